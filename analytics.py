@@ -0,0 +1,1820 @@
+"""Headless analytics for the lead dashboard.
+
+Parsing, deduplication, snapshots, the status cube, filters and the
+per-section aggregations live here and return DataFrames, dicts or
+dataclasses. Nothing in this module imports Streamlit: app.py renders these
+results, and worker processes and benchmarks can call them directly.
+"""
+import contextvars
+import cProfile
+import difflib
+import functools
+import hashlib
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import pstats
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager, suppress
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pandas.api.types import union_categoricals
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Header-row vocabularies (months, statuses, owners) and status aliases live
+# in a JSON config, so adding a salesperson needs no code change; the app
+# picks up edits on restart
+VOCABULARY_PATH = os.environ.get('LEAD_VOCABULARY_PATH', os.path.join(APP_DIR, 'vocabularies.json'))
+
+def load_vocabularies(path=VOCABULARY_PATH):
+    """Read the header vocabularies config"""
+    with open(path, encoding='utf-8') as f:
+        vocabularies = json.load(f)
+    missing = [key for key in ('months', 'statuses', 'owners') if not vocabularies.get(key)]
+    if missing:
+        raise ValueError(f"{path} is missing vocabularies: {', '.join(missing)}")
+    return vocabularies
+
+def vocabulary_pattern(words):
+    """Compile a vocabulary into one regex alternation"""
+    return '|'.join(re.escape(word) for word in words)
+
+VOCABULARIES = load_vocabularies()
+MONTHS = VOCABULARIES['months']
+STATUSES = VOCABULARIES['statuses']
+OWNERS = VOCABULARIES['owners']
+STATUS_ALIASES = VOCABULARIES.get('status_aliases', {})
+MONTH_PATTERN = vocabulary_pattern(MONTHS)
+STATUS_PATTERN = vocabulary_pattern(STATUSES)
+OWNER_PATTERN = vocabulary_pattern(OWNERS)
+# Parses depend on the vocabularies, so they are part of every dataset key
+VOCABULARY_DIGEST = hashlib.sha256(json.dumps(VOCABULARIES, sort_keys=True).encode()).hexdigest()[:12]
+
+# Bump whenever parsing/cleaning output changes so cached parses are not reused
+PARSER_VERSION = 6
+
+# Parsed datasets are persisted here as uncompressed Arrow IPC (Feather v2)
+# files so they can be memory-mapped back after a restart
+SNAPSHOT_DIR = os.environ.get(
+    'LEAD_SNAPSHOT_DIR',
+    os.path.join(APP_DIR, '.lead_snapshots')
+)
+SNAPSHOT_METADATA_KEY = b'lead_snapshot'
+# Saving a snapshot deletes the oldest ones beyond these limits (the newest
+# is always kept, however large)
+SNAPSHOT_MAX_COUNT = 20
+SNAPSHOT_MAX_BYTES = 2 * 1024 ** 3
+# Appending to a saved dataset writes only the new rows, as a delta on top of
+# its snapshot; a chain of this many deltas is written out in full instead
+SNAPSHOT_MAX_DELTAS = 8
+
+# Opt-in profiles of whole reruns are saved here: speedscope JSON from
+# pyinstrument's sampler when it is installed, cProfile pstats otherwise
+PROFILE_DIR = os.environ.get(
+    'LEAD_PROFILE_DIR',
+    os.path.join(APP_DIR, '.lead_profiles')
+)
+PROFILE_SAMPLE_INTERVAL_S = 0.001
+PROFILE_TOP_FUNCTIONS = 15
+# Only the newest saved profiles are kept
+PROFILE_MAX_FILES = 20
+
+# Multi-file uploads are parsed in a process pool of up to this many workers
+PARSE_WORKERS = os.cpu_count() or 1
+
+# Hierarchical CSVs larger than this are parsed in streaming chunks
+CSV_CHUNK_THRESHOLD_BYTES = 64 * 1024 * 1024
+CSV_CHUNK_ROWS = 200_000
+
+# Dimension columns stored as pandas categoricals after loading; every
+# groupby on them must pass observed=True so filtered-out values are skipped
+CATEGORICAL_COLUMNS = ['Month', 'Status', 'Sales_Person', 'Source', 'Company']
+
+DEDUP_KEY = ['Lead_Name', 'Month', 'Sales_Person', 'Company', 'Source']
+
+# Near-duplicate pass: leads sharing month, owner, source, surname (last
+# word of the name) and the first characters of their normalized company are
+# compared with their neighbour in name order; both name and company must be
+# this similar to be a near-duplicate
+FUZZY_BLOCK_PREFIX = 4
+FUZZY_NAME_SIMILARITY = 0.9
+FUZZY_COMPANY_SIMILARITY = 0.85
+FUZZY_REPORT_EXAMPLES = 20
+# Near-duplicates are kept (and only looked for on demand) unless merging them
+# is turned on; the setting changes parses, so it is part of every dataset key
+MERGE_NEAR_DUPLICATES = os.environ.get('LEAD_MERGE_NEAR_DUPLICATES', '') == '1'
+
+EXACT_TEST_NAMES = ['test', 'testt', 'abc']
+EXACT_TEST_COMPANIES = ['testing compny001', 'testing company001', 'test company']
+
+# Charts over unbounded dimensions (companies, sources) ship at most this many
+# points per trace; the long tail is summed into one "Others" point server-side.
+CHART_MAX_POINTS = 2000
+
+class ParseError(ValueError):
+    """An upload that holds no usable leads (the message is shown to the user)"""
+
+class SnapshotError(Exception):
+    """A snapshot that could not be written or read back"""
+
+@dataclass
+class ParsedUpload:
+    """One parsed export and what the parser found in it"""
+    df: pd.DataFrame
+    summary: dict
+    layout: str  # 'standard', 'hierarchical' or 'streamed' (chunked hierarchical CSV)
+    raw_rows: int  # rows read before parsing (0 when streamed)
+    extracted: int  # leads extracted from a hierarchical layout, before test-row filtering
+    dedup: dict = None  # dedup_leads report for hierarchical layouts
+
+@dataclass
+class Trace:
+    """Stages traced during one run, in the order they started"""
+    started_at: str
+    memory: bool  # whether peak memory can be measured per stage
+    stages: list = field(default_factory=list)
+    open: list = field(default_factory=list)  # records of the stages still running, innermost last
+    dropped: int = 0  # stages not recorded once TRACE_MAX_STAGES were
+    
+    def to_json(self):
+        return json.dumps({'started_at': self.started_at, 'stages': self.stages, 'dropped': self.dropped}, indent=2)
+
+# Stages recorded per trace; later ones (e.g. a traced helper called in a loop)
+# only count towards Trace.dropped, so a long-lived trace cannot grow unbounded
+TRACE_MAX_STAGES = 2000
+
+# The trace collecting stages in this context (one per script run); calls made
+# outside a trace, e.g. from worker threads, are not recorded
+_current_trace = contextvars.ContextVar('lead_trace', default=None)
+
+def _memory_kb(field_name):
+    """A memory figure of this process from /proc (VmRSS, VmHWM), or None where unavailable"""
+    try:
+        with open('/proc/self/status') as f:
+            match = re.search(rf'{field_name}:\s+(\d+)', f.read())
+    except OSError:
+        return None
+    return int(match.group(1)) if match else None
+
+def _reset_peak_memory():
+    """Reset the process's peak RSS to its current RSS (Linux); False where that is not possible"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def start_trace():
+    """Start collecting traced stages for the rest of this run; returns the Trace"""
+    trace = Trace(datetime.now().isoformat(timespec='seconds'), _reset_peak_memory())
+    _current_trace.set(trace)
+    return trace
+
+def _row_count(value):
+    """Rows of a traced argument or result (the first item of a tuple), None if it has none"""
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    if isinstance(value, ParsedUpload):
+        value = value.df
+    if isinstance(value, (pd.DataFrame, pd.Series, LeadView)):
+        return len(value)
+    return None
+
+@contextmanager
+def trace_stage(stage, rows_in=None):
+    """Record a stage of the current trace: wall time, rows in/out and peak memory.
+    
+    Peak memory is the process's peak RSS while the stage ran (peak_mb) and
+    how far it rose above the RSS the stage started with (peak_growth_mb).
+    It is process-wide, so concurrent reruns and background jobs show up in
+    it. The yielded record takes the stage's 'rows_out'.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield {}
+        return
+    if len(trace.stages) >= TRACE_MAX_STAGES:
+        trace.dropped += 1
+        yield {}
+        return
+    
+    record = {'stage': stage, 'depth': len(trace.open), 'rows_in': rows_in, 'rows_out': None}
+    trace.stages.append(record)
+    if trace.memory:
+        # The enclosing stage's peak so far, before this stage resets it
+        if trace.open:
+            parent = trace.open[-1]
+            parent['_peak_kb'] = max(parent.get('_peak_kb', 0), _memory_kb('VmHWM') or 0)
+        start_kb = _memory_kb('VmRSS') or 0
+        _reset_peak_memory()
+    trace.open.append(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['wall_s'] = round(time.perf_counter() - start, 6)
+        trace.open.pop()
+        if trace.memory:
+            peak_kb = max(_memory_kb('VmHWM') or 0, record.pop('_peak_kb', 0))
+            record['peak_mb'] = round(peak_kb / 1024, 1)
+            record['peak_growth_mb'] = round(max(peak_kb - start_kb, 0) / 1024, 1)
+            if trace.open:
+                parent = trace.open[-1]
+                parent['_peak_kb'] = max(parent.get('_peak_kb', 0), peak_kb)
+            _reset_peak_memory()
+
+def traced(func):
+    """Trace each call of `func` as a stage named after it, counting rows of its first argument and result"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _current_trace.get() is None:
+            return func(*args, **kwargs)
+        with trace_stage(func.__name__, _row_count(args[0]) if args else None) as record:
+            result = func(*args, **kwargs)
+            record['rows_out'] = _row_count(result)
+            return result
+    
+    return wrapper
+
+def start_profile():
+    """Start profiling the calling thread; returns the profiler, or None if another profile is running"""
+    try:
+        if importlib.util.find_spec('pyinstrument') is not None:
+            from pyinstrument import Profiler
+            profiler = Profiler(interval=PROFILE_SAMPLE_INTERVAL_S)
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+    except (RuntimeError, ValueError):
+        return None
+    return profiler
+
+def _pstats_hotspots(stats):
+    """Functions of a cProfile run by own time"""
+    return pd.DataFrame([
+        {'function': function, 'location': f"{os.path.basename(path)}:{line}",
+         'self_s': own, 'total_s': total, 'calls': calls}
+        for (path, line, function), (_, calls, own, total, _) in stats.stats.items()
+    ])
+
+def _speedscope_hotspots(profile):
+    """Functions of an evented speedscope profile by own time (calls are not sampled)"""
+    frames = profile['shared']['frames']
+    own, total = {}, {}
+    for run in profile['profiles']:
+        scale = {'milliseconds': 1e-3, 'microseconds': 1e-6, 'nanoseconds': 1e-9}.get(run.get('unit'), 1)
+        stack = []  # (frame, opened at), innermost last
+        last = run.get('startValue', 0)
+        for event in run['events']:
+            at = event['at']
+            if stack:
+                own[stack[-1][0]] = own.get(stack[-1][0], 0) + (at - last) * scale
+            last = at
+            if event['type'] == 'O':
+                stack.append((event['frame'], at))
+                continue
+            frame, opened = stack.pop()
+            # Recursive frames count once, from their outermost call
+            if all(outer != frame for outer, _ in stack):
+                total[frame] = total.get(frame, 0) + (at - opened) * scale
+    return pd.DataFrame([
+        {'function': frames[frame]['name'],
+         'location': f"{os.path.basename(frames[frame].get('file') or '')}:{frames[frame].get('line') or 0}",
+         'self_s': own.get(frame, 0.0), 'total_s': seconds, 'calls': None}
+        for frame, seconds in total.items()
+    ])
+
+def stop_profile(profiler, save=True):
+    """Stop a profile from start_profile and save it under PROFILE_DIR.
+    
+    Returns the saved path and the PROFILE_TOP_FUNCTIONS hottest functions by
+    own time (function, location, self_s, total_s, calls), or None when
+    save is False. Saving raises OSError if the profile cannot be written.
+    """
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+    else:
+        session = profiler.stop()
+    if not save:
+        return None
+    
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"rerun_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+    if isinstance(profiler, cProfile.Profile):
+        path = os.path.join(PROFILE_DIR, f"{name}.pstats")
+        profiler.dump_stats(path)
+        hotspots = _pstats_hotspots(pstats.Stats(profiler))
+    else:
+        from pyinstrument.renderers import SpeedscopeRenderer
+        profile_json = SpeedscopeRenderer().render(session)
+        path = os.path.join(PROFILE_DIR, f"{name}.speedscope.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(profile_json)
+        hotspots = _speedscope_hotspots(json.loads(profile_json))
+    prune_profiles()
+    hotspots = hotspots.sort_values('self_s', ascending=False).head(PROFILE_TOP_FUNCTIONS)
+    return path, hotspots.round({'self_s': 4, 'total_s': 4}).reset_index(drop=True)
+
+def prune_profiles():
+    """Delete all but the PROFILE_MAX_FILES newest saved profiles; returns the deleted file names"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    
+    # Profile names start with their timestamp, so they sort oldest first
+    names = sorted(name for name in os.listdir(PROFILE_DIR) if name.startswith('rerun_'))
+    deleted = []
+    for name in names[:max(len(names) - PROFILE_MAX_FILES, 0)]:
+        with suppress(OSError):
+            os.remove(os.path.join(PROFILE_DIR, name))
+            deleted.append(name)
+    return deleted
+
+def _raw_text_column(values, position):
+    """Stringify one raw column the same way the row parser did (NaN -> '')"""
+    if position >= values.shape[1]:
+        return pd.Series([''] * len(values), dtype=str)
+    column = pd.Series(values[:, position], dtype=object)
+    text = column.astype(str).str.strip()
+    return text.where(column.notna(), '')
+
+def _forward_fill_header(text, is_header, carry=''):
+    """Carry each header's label (text before '(') down to the rows below it"""
+    labels = text[is_header].str.split('(').str[0].str.strip()
+    return labels.reindex(text.index).ffill().fillna(carry)
+
+def _parse_hierarchy(df_raw, context=('', '', '')):
+    """Columnar parse of one block of raw hierarchical rows.
+    
+    Returns the uncleaned lead rows and the (month, status, owner) context in
+    effect after the last row, so a following block can continue from it.
+    """
+    # Classify header rows with vectorized matching, forward-fill
+    # Month/Status/Owner context, then mask out lead rows
+    values = df_raw.values
+    col_month = _raw_text_column(values, 0)
+    col_status = _raw_text_column(values, 1)
+    col_owner = _raw_text_column(values, 2)
+    lead_names = _raw_text_column(values, 3)
+    
+    # One precompiled alternation per column; months match case-sensitively,
+    # statuses and owners ignore case. Precedence: Month, then Status, then Owner
+    is_month = col_month.str.contains(MONTH_PATTERN, regex=True)
+    is_status = ~is_month & col_status.str.contains(STATUS_PATTERN, case=False, regex=True)
+    is_owner = ~is_month & ~is_status & col_owner.str.contains(OWNER_PATTERN, case=False, regex=True)
+    is_header = is_month | is_status | is_owner
+    
+    current_month = _forward_fill_header(col_month, is_month, context[0])
+    current_status = _forward_fill_header(col_status, is_status, context[1])
+    current_owner = _forward_fill_header(col_owner, is_owner, context[2])
+    
+    is_lead = (
+        ~is_header &
+        ~lead_names.isin(["", "nan", "None", ".", "-"]) &
+        (lead_names.str.len() > 1) &
+        (current_month != '') &
+        (current_status != '') &
+        (current_owner != '')
+    )
+    
+    leads = pd.DataFrame({
+        'Month': current_month[is_lead].values,
+        'Status': current_status[is_lead].values,
+        'Sales_Person': current_owner[is_lead].values,
+        'Lead_Name': lead_names[is_lead].values,
+        'Source': _raw_text_column(values, 4)[is_lead].values,
+        'Company': _raw_text_column(values, 5)[is_lead].values
+    })
+    
+    if len(values) > 0:
+        context = (current_month.iloc[-1], current_status.iloc[-1], current_owner.iloc[-1])
+    return leads, context
+
+def _clean_leads(df_clean):
+    """Normalize parsed lead rows (strip counts like '(12)', unify status names)"""
+    df_clean['Month'] = df_clean['Month'].str.replace(r'\s*\(\d+\)', '', regex=True).str.strip()
+    df_clean['Status'] = df_clean['Status'].str.replace(r'\s*\(\d+\)', '', regex=True).str.strip()
+    df_clean['Sales_Person'] = df_clean['Sales_Person'].str.replace(r'\s*\(\d+\)', '', regex=True).str.strip()
+    df_clean['Company'] = df_clean['Company'].str.strip()
+    df_clean['Source'] = df_clean['Source'].str.strip()
+    
+    df_clean['Status'] = df_clean['Status'].replace(STATUS_ALIASES)
+    return df_clean
+
+def _normalize_text(values):
+    """Per-row codes into the distinct values of a Series, plus those values and
+    their lowercased, punctuation-free, whitespace-collapsed form.
+    
+    Categoricals reuse their categories, so nothing is computed per row.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # The trailing missing value is what code -1 looks up
+        codes, uniques = values.cat.codes.to_numpy(), [*values.cat.categories, np.nan]
+    else:
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    uniques = np.asarray(uniques, dtype=object)
+    normalized = _normalize_strings(pd.Series(uniques, dtype=str)).to_numpy(dtype=object)
+    return codes, uniques, normalized
+
+def _normalize_strings(values):
+    """Lowercase a string Series, turn punctuation into spaces and collapse whitespace"""
+    return (
+        values
+        .str.lower()
+        .str.replace(r'[^\w\s]+', ' ', regex=True)
+        .str.replace(r'\s+', ' ', regex=True)
+        .str.strip()
+    )
+
+def _combine_hashes(column_hashes):
+    """Fold per-column 64-bit hashes into one hash per row"""
+    combined = np.zeros(len(column_hashes[0]), dtype=np.uint64)
+    for hashes in column_hashes:
+        combined = (combined * np.uint64(1099511628211)) ^ hashes
+    return combined
+
+def dedup_hashes(df):
+    """Per-row 64-bit hashes of the raw and of the normalized DEDUP_KEY, each
+    column hashed once per distinct value"""
+    raw, normalized = [], []
+    for column in DEDUP_KEY:
+        codes, uniques, normalized_uniques = _normalize_text(df[column])
+        raw.append(pd.util.hash_array(uniques)[codes])
+        normalized.append(pd.util.hash_array(normalized_uniques)[codes])
+    return _combine_hashes(raw), _combine_hashes(normalized)
+
+def dedup_keys(df):
+    """The DEDUP_KEY columns with case, spacing and punctuation variants folded together"""
+    columns = {}
+    for column in DEDUP_KEY:
+        codes, _, normalized = _normalize_text(df[column])
+        columns[column] = normalized[codes]
+    return pd.DataFrame(columns, index=df.index)
+
+def row_fingerprints(df):
+    """64-bit hashes of each lead's normalized dedup key"""
+    return dedup_hashes(df)[1]
+
+def _exact_duplicates(raw, normalized, seen_raw, seen_normalized):
+    """Flag rows whose raw / normalized key hash was already seen here or in the sorted seen arrays.
+    
+    Returns (is_exact, is_duplicate, seen_raw, seen_normalized) with the seen
+    arrays extended by these rows.
+    """
+    is_exact = pd.Series(raw).duplicated().to_numpy() | _in_sorted(seen_raw, raw)
+    is_duplicate = pd.Series(normalized).duplicated().to_numpy() | _in_sorted(seen_normalized, normalized)
+    
+    seen_raw = np.sort(np.concatenate([seen_raw, raw[~is_exact]]))
+    seen_normalized = np.sort(np.concatenate([seen_normalized, normalized[~is_duplicate]]))
+    return is_exact, is_duplicate, seen_raw, seen_normalized
+
+def _near_duplicates(keys):
+    """Flag leads that closely match their neighbour within a block; returns (mask, examples).
+    
+    Rows are blocked by month, owner, source, surname and company prefix,
+    sorted by name and by reversed name (so typos near either end still land
+    next to each other), and each row is compared only with its neighbour
+    (sorted neighbourhood), so the pass is O(n log n) rather than all pairs.
+    Names with different surnames (so any one-word names that are not equal)
+    and names or companies whose digits differ never match. Of a matching
+    pair, the later row is flagged.
+    """
+    flagged = np.zeros(len(keys), dtype=bool)
+    if len(keys) < 2:
+        return flagged, []
+    
+    names = keys['Lead_Name'].to_numpy(dtype=object)
+    companies = keys['Company'].to_numpy(dtype=object)
+    blocks = pd.DataFrame({
+        'Month': keys['Month'].to_numpy(dtype=object),
+        'Sales_Person': keys['Sales_Person'].to_numpy(dtype=object),
+        'Source': keys['Source'].to_numpy(dtype=object),
+        'Surname': keys['Lead_Name'].str.replace(r'^.*\s', '', regex=True).to_numpy(dtype=object),
+        'Prefix': keys['Company'].str[:FUZZY_BLOCK_PREFIX].to_numpy(dtype=object)
+    }).groupby(['Month', 'Sales_Person', 'Source', 'Surname', 'Prefix'], sort=False, dropna=False).ngroup().to_numpy()
+    orders = [
+        pc.sort_indices(
+            pa.table({'block': blocks, 'name': pa.array(sort_names, type=pa.string())}),
+            sort_keys=[('block', 'ascending'), ('name', 'ascending')]
+        ).to_numpy()
+        for sort_names in (names, keys['Lead_Name'].str[::-1].to_numpy(dtype=object))
+    ]
+    first = np.concatenate([order[:-1] for order in orders])
+    second = np.concatenate([order[1:] for order in orders])
+    name_digits = keys['Lead_Name'].str.replace(r'\D+', '', regex=True).to_numpy(dtype=object)
+    company_digits = keys['Company'].str.replace(r'\D+', '', regex=True).to_numpy(dtype=object)
+    candidates = (
+        (blocks[first] == blocks[second]) &
+        (name_digits[first] == name_digits[second]) &
+        (company_digits[first] == company_digits[second])
+    )
+    
+    examples = []
+    for a, b in zip(first[candidates], second[candidates]):
+        kept, dropped = min(a, b), max(a, b)
+        # e.g. a pair found by both the name and the reversed-name order
+        if flagged[dropped]:
+            continue
+        if not _similar(names[a], names[b], FUZZY_NAME_SIMILARITY):
+            continue
+        if not _similar(companies[a], companies[b], FUZZY_COMPANY_SIMILARITY):
+            continue
+        flagged[dropped] = True
+        if len(examples) < FUZZY_REPORT_EXAMPLES:
+            examples.append((kept, dropped))
+    return flagged, examples
+
+def _similar(a, b, threshold):
+    """difflib ratio >= threshold, trying the cheap upper bounds first"""
+    if a == b:
+        return True
+    matcher = difflib.SequenceMatcher(None, a, b)
+    return (matcher.real_quick_ratio() >= threshold and
+            matcher.quick_ratio() >= threshold and
+            matcher.ratio() >= threshold)
+
+@traced
+def dedup_leads(df, merge_near_duplicates=MERGE_NEAR_DUPLICATES):
+    """Drop exact and normalized duplicate leads (first occurrence wins), and near-duplicates if merging.
+    
+    The near-duplicate pass only runs when `merge_near_duplicates` is set;
+    otherwise near-duplicates are kept, and find_near_duplicates reviews them
+    on demand. Returns the deduplicated frame and a report of how many rows
+    each rule matched, with example near-duplicate pairs.
+    """
+    raw, normalized = dedup_hashes(df)
+    is_exact = pd.Series(raw).duplicated().to_numpy()
+    is_duplicate = pd.Series(normalized).duplicated().to_numpy()
+    df = df[~is_duplicate]
+    
+    is_near, examples = _merged_near_duplicates(df, merge_near_duplicates)
+    report = _dedup_report(int(is_exact.sum()), int(is_duplicate.sum() - is_exact.sum()),
+                           is_near, examples, merge_near_duplicates)
+    return df[~is_near], report
+
+def _merged_near_duplicates(df, merge_near_duplicates):
+    """Mask of the near-duplicates to drop from `df` and their example pairs; none unless merging"""
+    if not merge_near_duplicates:
+        return np.zeros(len(df), dtype=bool), pd.DataFrame()
+    is_near, examples = _near_duplicates(dedup_keys(df))
+    return is_near, _example_pairs(df, examples)
+
+@traced
+def find_near_duplicates(df):
+    """Near-duplicate leads kept in a deduplicated frame, for review: (count, example pairs)"""
+    is_near, examples = _near_duplicates(dedup_keys(df))
+    return int(is_near.sum()), _example_pairs(df, examples)
+
+def _dedup_report(exact, normalized, is_near, examples, merged):
+    """Rows matched by each dedup rule; near-duplicates ('fuzzy') are only looked for when `merged`"""
+    return {
+        'exact': exact,
+        'normalized': normalized,
+        'fuzzy': int(is_near.sum()),
+        'fuzzy_merged': merged,
+        'examples': examples
+    }
+
+def _example_pairs(df, examples):
+    """Earlier/later lead and company of near-duplicate pairs side by side for the dedup report"""
+    if not examples:
+        return pd.DataFrame()
+    first, later = (df.iloc[[pair[i] for pair in examples]] for i in (0, 1))
+    return pd.DataFrame({
+        'Lead': first['Lead_Name'].to_numpy(),
+        'Company': first['Company'].to_numpy(),
+        'Near-Duplicate Lead': later['Lead_Name'].to_numpy(),
+        'Near-Duplicate Company': later['Company'].to_numpy()
+    })
+
+@traced
+def extract_leads_from_excel(df_raw):
+    """Extract lead data from hierarchical Excel structure; returns (df or None, dedup report)"""
+    leads, _ = _parse_hierarchy(df_raw)
+    
+    if leads.empty:
+        return None, None
+    
+    df_clean = _clean_leads(leads)
+    
+    # Exact and normalized-key removal (first occurrence wins), plus the
+    # near-duplicate pass when merging
+    return dedup_leads(df_clean)
+
+def _in_sorted(sorted_values, values):
+    """Membership test against an already-sorted array via binary search"""
+    if len(sorted_values) == 0:
+        return np.zeros(len(values), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_values, values), len(sorted_values) - 1)
+    return sorted_values[positions] == values
+
+@traced
+def extract_leads_from_csv_chunks(file_bytes, chunk_rows=CSV_CHUNK_ROWS):
+    """Stream a hierarchical CSV in chunks; returns (df or None, test entries removed, dedup report).
+    
+    Only one chunk of raw rows is alive at a time: the Month/Status/Owner
+    context is carried across chunk boundaries and exact duplicates are
+    dropped against 64-bit hashes of the rows already seen. Each chunk's kept
+    leads are then stored in the compact schema, and their categories are
+    unioned once at the end. Test rows are dropped per chunk too, except
+    under MERGE_NEAR_DUPLICATES: as in memory, the near-duplicate pass runs
+    over all the kept leads before they are filtered.
+    """
+    context = ('', '', '')
+    seen_raw = np.empty(0, dtype=np.uint64)
+    seen_normalized = np.empty(0, dtype=np.uint64)
+    parts = []
+    exact_removed = 0
+    normalized_removed = 0
+    test_removed = 0
+    
+    reader = pd.read_csv(io.BytesIO(file_bytes), header=None, dtype=str, chunksize=chunk_rows)
+    for chunk in reader:
+        leads, context = _parse_hierarchy(chunk, context)
+        if leads.empty:
+            continue
+        leads = _clean_leads(leads)
+        
+        # Same rules as dedup_leads, applied across chunks
+        raw, normalized = dedup_hashes(leads)
+        is_exact, is_duplicate, seen_raw, seen_normalized = _exact_duplicates(
+            raw, normalized, seen_raw, seen_normalized
+        )
+        exact_removed += int(is_exact.sum())
+        normalized_removed += int(is_duplicate.sum() - is_exact.sum())
+        leads = leads[~is_duplicate]
+        if not MERGE_NEAR_DUPLICATES:
+            kept = _filter_test_entries(leads)
+            test_removed += len(leads) - len(kept)
+            leads = kept
+        parts.append(compact_schema(leads))
+    
+    if not parts:
+        return None, 0, None
+    
+    df_clean = _concat_compact(parts)
+    if not MERGE_NEAR_DUPLICATES:
+        return df_clean, test_removed, _dedup_report(
+            exact_removed, normalized_removed, np.zeros(0, dtype=bool), pd.DataFrame(), False
+        )
+    
+    is_near, examples = _merged_near_duplicates(df_clean, True)
+    report = _dedup_report(exact_removed, normalized_removed, is_near, examples, True)
+    df_clean = df_clean[~is_near]
+    kept = _filter_test_entries(df_clean)
+    return kept, len(df_clean) - len(kept), report
+
+def _filter_test_entries(df):
+    """Drop rows whose Lead_Name or Company is an exact known test value"""
+    # Only remove if Lead_Name is EXACTLY these values (case-insensitive)
+    df = df[~df['Lead_Name'].str.strip().str.lower().isin(EXACT_TEST_NAMES)]
+    
+    # Only remove if Company is EXACTLY these values
+    return df[~df['Company'].str.strip().str.lower().isin(EXACT_TEST_COMPANIES)]
+
+def _excel_engine():
+    """Prefer the Rust calamine reader when installed; pandas' default otherwise"""
+    if importlib.util.find_spec('python_calamine') is not None:
+        return 'calamine'
+    return None
+
+def _promote_header_row(df_raw):
+    """Turn a sheet read with header=None into a standard frame using its first row"""
+    df = df_raw.iloc[1:].reset_index(drop=True)
+    df.columns = [name if pd.notna(name) else f"Unnamed: {i}" for i, name in enumerate(df_raw.iloc[0])]
+    return df.infer_objects()
+
+@traced
+def parse_upload(name, file_bytes):
+    """Read, parse and clean one export from its bytes; raises ParseError when it holds no usable leads"""
+    file_extension = name.split('.')[-1].lower()
+    test_entries_prefiltered = 0
+    raw_rows = 0
+    dedup = None
+    
+    if file_extension == 'csv':
+        # Sniff the header line only, then do a single full parse
+        header = pd.read_csv(io.BytesIO(file_bytes), nrows=0).columns
+        if 'Month' in header:
+            layout = 'standard'
+            df = pd.read_csv(io.BytesIO(file_bytes))
+            raw_rows = len(df)
+        elif len(file_bytes) > CSV_CHUNK_THRESHOLD_BYTES:
+            layout = 'streamed'
+            df, test_entries_prefiltered, dedup = extract_leads_from_csv_chunks(file_bytes)
+        else:
+            layout = 'hierarchical'
+            # Raw text cells, so values do not depend on per-column dtype inference
+            df_raw = pd.read_csv(io.BytesIO(file_bytes), header=None, dtype=str)
+            raw_rows = len(df_raw)
+            df, dedup = extract_leads_from_excel(df_raw)
+    
+    elif file_extension in ['xlsx', 'xls']:
+        # Workbooks are expensive to open, so parse once without a header
+        # and decide the layout from the first row of the raw sheet
+        df_raw = pd.read_excel(io.BytesIO(file_bytes), header=None, engine=_excel_engine())
+        if len(df_raw) > 0 and 'Month' in df_raw.iloc[0].values:
+            layout = 'standard'
+            df = _promote_header_row(df_raw)
+            raw_rows = len(df)
+        else:
+            layout = 'hierarchical'
+            raw_rows = len(df_raw)
+            df, dedup = extract_leads_from_excel(df_raw)
+    else:
+        raise ParseError(f"Unsupported file format: {file_extension}")
+    
+    if df is None and layout != 'standard':
+        raise ParseError("No leads found in the hierarchical export")
+    
+    if df is None or df.empty:
+        raise ParseError("Empty file")
+    
+    extracted = len(df) + test_entries_prefiltered
+    
+    required_cols = ['Month', 'Status', 'Sales_Person', 'Lead_Name', 'Source', 'Company']
+    missing_cols = [col for col in required_cols if col not in df.columns]
+    
+    if missing_cols:
+        raise ParseError(f"Missing columns: {', '.join(missing_cols)}")
+    
+    df['Month_Date'] = _to_datetime(df['Month'], format='%B %Y', errors='coerce')
+    
+    if df['Month_Date'].isna().all():
+        df['Month_Date'] = _to_datetime(df['Month'], errors='coerce')
+    
+    df = df.dropna(subset=['Month_Date'])
+    
+    if df.empty:
+        raise ParseError("No valid dates found")
+    
+    df = df.sort_values('Month_Date', kind='stable')
+    
+    for col in ['Status', 'Sales_Person', 'Source', 'Company']:
+        if col in df.columns:
+            df[col] = _blank_missing(df[col])
+    
+    # EXTREMELY CONSERVATIVE filtering - only remove exact matches
+    # (streamed CSVs were already filtered chunk by chunk)
+    test_entries_before = len(df) + test_entries_prefiltered
+    df = _filter_test_entries(df)
+    test_entries_removed = test_entries_before - len(df)
+    
+    df = compact_schema(df)
+    
+    return ParsedUpload(
+        df, summarize_dataset(df, test_entries_before, test_entries_removed),
+        layout, raw_rows, extracted, dedup
+    )
+
+def _parse_job(name, file_bytes):
+    """Process-pool entry point: (ParsedUpload, None), or (None, error message)"""
+    try:
+        return parse_upload(name, file_bytes), None
+    except Exception as e:
+        return None, str(e)
+
+@functools.cache
+def _pool_context():
+    """Start method for parse workers; the server process is multi-threaded, so it is never forked.
+    
+    A forkserver forks the workers from a single-threaded process that has
+    imported this module once; where there is none, workers are spawned.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+def parse_in_pool(jobs, workers=PARSE_WORKERS):
+    """parse_upload over (name, bytes) jobs, one worker process per file.
+    
+    Returns a (ParsedUpload or None, error or None) pair per job and whether
+    the pool was used; if the pool dies, files are parsed in-process.
+    """
+    if len(jobs) > 1 and workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=min(len(jobs), workers), mp_context=_pool_context()) as pool:
+                return list(pool.map(_parse_job, *zip(*jobs))), True
+        except BrokenProcessPool:
+            pass
+    return [_parse_job(name, file_bytes) for name, file_bytes in jobs], False
+
+@traced
+def merge_uploads(parsed):
+    """Merge several ParsedUploads into one deduplicated (df, summary, dedup report)"""
+    # Per-file categoricals have different categories; concat as plain values
+    # and re-apply the compact schema to the merged frame
+    df = pd.concat(
+        [upload.df.astype({column: object for column in CATEGORICAL_COLUMNS}) for upload in parsed],
+        ignore_index=True
+    )
+    df = df.sort_values('Month_Date', kind='stable')
+    
+    # Same dedup rules as within a file, now across files (first upload wins)
+    df, report = dedup_leads(df)
+    df = compact_schema(df.reset_index(drop=True))
+    
+    test_entries_before = sum(upload.summary['test_entries_before'] for upload in parsed)
+    test_entries_removed = sum(upload.summary['test_entries_removed'] for upload in parsed)
+    return df, summarize_dataset(df, test_entries_before, test_entries_removed), report
+
+def _to_datetime(values, **kwargs):
+    """pd.to_datetime as a datetime Series; categoricals are converted per category"""
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        return pd.to_datetime(values, **kwargs)
+    dates = pd.to_datetime(pd.Series(values.cat.categories), **kwargs).to_numpy()
+    # The trailing missing value is what code -1 looks up
+    dates = np.append(dates, np.array(['NaT'], dtype=dates.dtype))
+    return pd.Series(dates[values.cat.codes.to_numpy()], index=values.index)
+
+def _blank_missing(values):
+    """Text with missing values as '' and surrounding whitespace stripped; categoricals are cleaned per category"""
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        return values.fillna('').astype(str).str.strip()
+    # The trailing missing value is what code -1 looks up
+    cleaned = pd.Series([*values.cat.categories, np.nan]).fillna('').astype(str).str.strip()
+    codes, categories = pd.factorize(cleaned, sort=True)
+    return pd.Series(
+        pd.Categorical.from_codes(codes[values.cat.codes.to_numpy()], categories), index=values.index
+    )
+
+def compact_schema(df):
+    """Categoricals for the low-cardinality dimensions, Arrow strings for Lead_Name"""
+    schema = {col: 'category' for col in CATEGORICAL_COLUMNS}
+    schema['Lead_Name'] = 'string[pyarrow]'
+    df = df.astype(schema)
+    # Columns that already were categorical (streamed uploads) may have lost rows since
+    return df.assign(**{col: df[col].cat.remove_unused_categories() for col in CATEGORICAL_COLUMNS})
+
+def _concat_compact(parts):
+    """Concatenate compact_schema frames, unioning each categorical's categories rather than re-encoding"""
+    df = pd.concat([part.drop(columns=CATEGORICAL_COLUMNS) for part in parts], ignore_index=True)
+    for column in CATEGORICAL_COLUMNS:
+        df[column] = union_categoricals([part[column] for part in parts], sort_categories=True)
+    return df[list(parts[0].columns)]
+
+# Lead-level columns of the first rows shown in the validation summary
+SAMPLE_COLUMNS = ['Month', 'Lead_Name', 'Company', 'Status', 'Sales_Person', 'Source']
+
+@traced
+def summarize_dataset(df, test_entries_before, test_entries_removed):
+    """Precompute the small tables shown in the validation expanders"""
+    monthly_dist = df.groupby('Month', observed=True).size().reset_index(name='Count')
+    monthly_dist = monthly_dist.merge(df[['Month', 'Month_Date']].drop_duplicates(), on='Month')
+    checks = {
+        'missing_names': int(df['Lead_Name'].isna().sum()),
+        'blank_companies': int((df['Company'] == '').sum()),
+        'blank_sources': int((df['Source'] == '').sum())
+    }
+    return _dataset_summary(
+        len(df), df['Status'].value_counts(), df['Sales_Person'].value_counts(), monthly_dist, checks,
+        (df['Month_Date'].min(), df['Month_Date'].max()), df['Company'].nunique(),
+        df.head(10)[SAMPLE_COLUMNS], test_entries_before, test_entries_removed
+    )
+
+@traced
+def summarize_append(summary, base_df, delta, df, cube, test_entries_before, test_entries_removed):
+    """summarize_dataset of `df`: the rows of `base_df` (summarized in `summary`) followed by `delta`.
+    
+    Counts come from the merged status cube, and the base summary plus the
+    delta rows, so the base rows are not scanned again.
+    """
+    checks = {
+        'missing_names': summary['missing_names'] + int(delta['Lead_Name'].isna().sum()),
+        'blank_companies': summary['blank_companies'] + int((delta['Company'] == '').sum()),
+        'blank_sources': int(cube.loc[cube['Source'] == '', 'Count'].sum())
+    }
+    # Appending only adds categories for companies the base did not have
+    new_companies = len(df['Company'].cat.categories) - len(base_df['Company'].cat.categories)
+    return _dataset_summary(
+        len(df),
+        cube_counts(cube, 'Status').sort_values(ascending=False, kind='stable'),
+        cube_counts(cube, 'Sales_Person').sort_values(ascending=False, kind='stable'),
+        cube_counts(cube, ['Month', 'Month_Date']).reset_index(name='Count'),
+        checks, (cube['Month_Date'].min(), cube['Month_Date'].max()),
+        summary['unique_companies'] + new_companies,
+        df.head(10)[SAMPLE_COLUMNS], test_entries_before, test_entries_removed
+    )
+
+def _dataset_summary(total_records, status_counts, person_counts, monthly_dist, checks, date_range,
+                     unique_companies, sample, test_entries_before, test_entries_removed):
+    """The validation summary dict from per-status, per-salesperson and per-month lead counts"""
+    status_counts = status_counts.to_dict()
+    status_df = pd.DataFrame({
+        'Status': status_counts.keys(),
+        'Count': status_counts.values()
+    })
+    status_df['Percentage'] = (status_df['Count'] / total_records * 100).round(2)
+    
+    top_sales = person_counts.head(10)
+    monthly_dist = monthly_dist.sort_values('Month_Date')
+    
+    quality_checks = []
+    
+    # Check for missing lead names
+    quality_checks.append(f"✅ Missing lead names: {checks['missing_names']}")
+    
+    # Check for missing companies
+    quality_checks.append(f"ℹ️ Blank companies: {checks['blank_companies']}")
+    
+    # Check for missing sources
+    quality_checks.append(f"ℹ️ Blank sources: {checks['blank_sources']}")
+    
+    # Check date range
+    first_month, last_month = date_range
+    date_span = (last_month - first_month).days
+    quality_checks.append(f"✅ Date span: {date_span} days ({date_span/30:.1f} months)")
+    
+    return {
+        'total_records': total_records,
+        'test_entries_before': test_entries_before,
+        'test_entries_removed': test_entries_removed,
+        'date_range': f"{first_month.strftime('%b %Y')} - {last_month.strftime('%b %Y')}",
+        'unique_salespeople': int((person_counts > 0).sum()),
+        'unique_companies': unique_companies,
+        'status_distribution': status_df,
+        'top_salespeople': pd.DataFrame({
+            'Salesperson': top_sales.index,
+            'Lead Count': top_sales.values
+        }),
+        'monthly_distribution': monthly_dist[['Month', 'Count']],
+        'quality_checks': quality_checks,
+        'sample': sample,
+        # Kept so appends can extend the checks without rescanning
+        'missing_names': checks['missing_names'],
+        'blank_companies': checks['blank_companies']
+    }
+
+def make_dataset_key(file_hash):
+    """Key of a parsed dataset: its content hash plus the parser version, vocabularies and dedup mode"""
+    dataset_key = f"{file_hash}-v{PARSER_VERSION}-{VOCABULARY_DIGEST}"
+    return f"{dataset_key}-merged" if MERGE_NEAR_DUPLICATES else dataset_key
+
+def snapshot_path(dataset_key):
+    return os.path.join(SNAPSHOT_DIR, f"{dataset_key}.arrow")
+
+@traced
+def save_snapshot(df, summary, dataset_key, source_name, base_key=None):
+    """Persist a parsed dataset with its schema/version metadata; raises SnapshotError.
+    
+    With `base_key`, `df` is that saved dataset followed by appended rows:
+    only those rows are written, as a delta snapshot read back on top of the
+    base one, unless the base is gone or already SNAPSHOT_MAX_DELTAS deep.
+    """
+    path = snapshot_path(dataset_key)
+    if os.path.exists(path):
+        return
+    
+    metadata = {
+        'dataset_key': dataset_key,
+        'file_hash': dataset_key.split('-v')[0],
+        'parser_version': PARSER_VERSION,
+        'vocabulary': VOCABULARY_DIGEST,
+        'merge_near_duplicates': MERGE_NEAR_DUPLICATES,
+        'source_name': source_name,
+        'saved_at': datetime.now().isoformat(timespec='seconds'),
+        'rows': len(df),
+        'test_entries_before': summary['test_entries_before'],
+        'test_entries_removed': summary['test_entries_removed']
+    }
+    base = _snapshot_header(snapshot_path(base_key)) if base_key is not None else None
+    if _snapshot_is_current(base) and base.get('depth', 0) < SNAPSHOT_MAX_DELTAS:
+        metadata.update(base_key=base_key, base_rows=base['rows'], depth=base.get('depth', 0) + 1)
+        df = df.iloc[base['rows']:]
+        # Only the appended rows' categories, so the file does not repeat the base's
+        df = df.assign(**{column: df[column].cat.remove_unused_categories() for column in CATEGORICAL_COLUMNS})
+    
+    table = pa.Table.from_pandas(df)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        SNAPSHOT_METADATA_KEY: json.dumps(metadata).encode()
+    })
+    
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        raise SnapshotError(f"Could not save snapshot: {str(e)}") from e
+    finally:
+        # Only left behind when the write or rename failed
+        with suppress(OSError):
+            os.remove(tmp_path)
+    prune_snapshots()
+
+def prune_snapshots():
+    """Delete the oldest snapshots beyond SNAPSHOT_MAX_COUNT and SNAPSHOT_MAX_BYTES; returns the deleted file names.
+    
+    A delta snapshot is kept together with the snapshots it is built on, or
+    not at all. Snapshots of older parser versions, unreadable ones and deltas
+    whose base is gone are never read back, so they are deleted first; those
+    of other vocabularies or dedup modes (another deployment's, or this one's
+    before a setting changed) count against the limits like any other.
+    Processes that have a deleted snapshot mapped keep their mapping.
+    """
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    
+    snapshots = {}
+    for name in os.listdir(SNAPSHOT_DIR):
+        if not name.endswith('.arrow'):
+            continue
+        path = os.path.join(SNAPSHOT_DIR, name)
+        # Snapshots are renamed into place once complete, so unreadable ones are corrupt
+        metadata = _snapshot_header(path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        if metadata is not None and metadata['parser_version'] < PARSER_VERSION:
+            metadata = None
+        snapshots[name[:-len('.arrow')]] = (metadata, size)
+    
+    def chain(dataset_key):
+        """The snapshot and those it is built on, or None if one of them is missing or outdated"""
+        keys = []
+        while dataset_key is not None:
+            if snapshots.get(dataset_key, (None,))[0] is None:
+                return None
+            keys.append(dataset_key)
+            dataset_key = snapshots[dataset_key][0].get('base_key')
+        return keys
+    
+    newest_first = sorted(
+        ((metadata['saved_at'], dataset_key) for dataset_key, (metadata, _) in snapshots.items() if metadata),
+        reverse=True
+    )
+    kept, kept_bytes = set(), 0
+    for _, dataset_key in newest_first:
+        keys = chain(dataset_key)
+        if dataset_key in kept or keys is None:
+            continue
+        added = [key for key in keys if key not in kept]
+        size = sum(snapshots[key][1] for key in added)
+        # The newest snapshot is always kept
+        if kept and (len(kept) + len(added) > SNAPSHOT_MAX_COUNT or kept_bytes + size > SNAPSHOT_MAX_BYTES):
+            continue
+        kept.update(added)
+        kept_bytes += size
+    
+    deleted = []
+    for dataset_key in snapshots:
+        if dataset_key not in kept:
+            with suppress(OSError):
+                os.remove(snapshot_path(dataset_key))
+                deleted.append(f"{dataset_key}.arrow")
+    return deleted
+
+def _snapshot_metadata(schema):
+    metadata = (schema.metadata or {}).get(SNAPSHOT_METADATA_KEY)
+    return json.loads(metadata) if metadata else None
+
+def _snapshot_header(path):
+    """Metadata of a snapshot file from its footer schema only, not the data; None if unreadable"""
+    try:
+        with pa.memory_map(path) as source:
+            return _snapshot_metadata(pa.ipc.open_file(source).schema)
+    except (OSError, pa.ArrowInvalid):
+        return None
+
+def _snapshot_is_current(metadata):
+    """Whether a snapshot was parsed with this parser version, vocabularies and dedup mode"""
+    return (metadata is not None and
+            metadata['parser_version'] == PARSER_VERSION and
+            metadata.get('vocabulary') == VOCABULARY_DIGEST and
+            metadata.get('merge_near_duplicates', False) == MERGE_NEAR_DUPLICATES)
+
+@traced
+def map_snapshot(dataset_key):
+    """Memory-map a saved snapshot as (df, metadata); None if there is none, SnapshotError if unreadable.
+    
+    The Arrow string columns (Lead_Name, the category labels) stay views of
+    the mapped file, so the bulk of the frame lives in the OS page cache
+    rather than on the heap, and is shared by every process that maps it.
+    A delta snapshot's rows are appended to its mapped base, as on append.
+    """
+    path = snapshot_path(dataset_key)
+    if not os.path.exists(path):
+        return None
+    
+    try:
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+        metadata = _snapshot_metadata(table.schema)
+        if not _snapshot_is_current(metadata):
+            return None
+        df = table.to_pandas()
+    except (OSError, pa.ArrowInvalid, ValueError) as e:
+        raise SnapshotError(f"Ignoring unreadable snapshot {os.path.basename(path)}: {str(e)}") from e
+    
+    if metadata.get('base_key') is not None:
+        base = map_snapshot(metadata['base_key'])
+        if base is None or len(base[0]) != metadata['base_rows']:
+            return None
+        df = _append_rows(base[0], df)
+    return df, metadata
+
+def read_snapshot(dataset_key):
+    """Memory-map a saved snapshot back into (df, summary); None if there is none, SnapshotError if unreadable"""
+    mapped = map_snapshot(dataset_key)
+    if mapped is None:
+        return None
+    
+    df, metadata = mapped
+    summary = summarize_dataset(df, metadata['test_entries_before'], metadata['test_entries_removed'])
+    return df, summary
+
+def list_snapshots():
+    """Metadata of the saved snapshots matching this parser version and vocabularies, newest first"""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    
+    snapshots = []
+    for name in os.listdir(SNAPSHOT_DIR):
+        if not name.endswith('.arrow'):
+            continue
+        metadata = _snapshot_header(os.path.join(SNAPSHOT_DIR, name))
+        if _snapshot_is_current(metadata):
+            snapshots.append(metadata)
+    
+    return sorted(snapshots, key=lambda meta: meta['saved_at'], reverse=True)
+
+def _append_rows(base_df, delta):
+    """`base_df` followed by the `delta` rows, extending each categorical's categories rather than re-encoding"""
+    df = pd.concat(
+        [part.drop(columns=CATEGORICAL_COLUMNS) for part in (base_df, delta)],
+        ignore_index=True
+    )
+    for column in CATEGORICAL_COLUMNS:
+        df[column] = union_categoricals([base_df[column], delta[column].cat.remove_unused_categories()])
+    return df[list(base_df.columns) + [column for column in delta.columns if column not in base_df.columns]]
+
+def _block_candidates(df, keys):
+    """Positions of the rows of `df` in the near-duplicate block of one of the normalized `keys`.
+    
+    Month, owner, source and company prefix are normalized and hashed once
+    per category, and only for the rows whose surname is among the keys'.
+    """
+    # Names are mostly distinct, so they are only normalized and matched per row
+    surnames = _normalize_strings(df['Lead_Name']).str.replace(r'^.*\s', '', regex=True).fillna('')
+    wanted_surnames = keys['Lead_Name'].str.replace(r'^.*\s', '', regex=True).fillna('')
+    rows = np.flatnonzero(surnames.isin(set(wanted_surnames)).to_numpy())
+    
+    row_hashes = [pd.util.hash_array(surnames.iloc[rows].to_numpy(dtype=object))]
+    key_hashes = [pd.util.hash_array(wanted_surnames.to_numpy(dtype=object))]
+    for column in ('Month', 'Sales_Person', 'Source', 'Company'):
+        codes, _, categories = _normalize_text(df[column])
+        categories, wanted = pd.Series(categories), keys[column]
+        if column == 'Company':
+            categories, wanted = categories.str[:FUZZY_BLOCK_PREFIX], wanted.str[:FUZZY_BLOCK_PREFIX]
+        row_hashes.append(pd.util.hash_array(categories.to_numpy(dtype=object))[codes[rows]])
+        key_hashes.append(pd.util.hash_array(wanted.to_numpy(dtype=object)))
+    return rows[_in_sorted(np.sort(_combine_hashes(key_hashes)), _combine_hashes(row_hashes))]
+
+def _appended_near_duplicates(base_df, delta):
+    """Mask of the `delta` rows that near-duplicate a base row or an earlier delta row, with example pairs"""
+    keys = dedup_keys(delta)
+    # Base rows come first, so of a base/new pair the new row is flagged
+    candidates = _block_candidates(base_df, keys)
+    is_near, examples = _near_duplicates(pd.concat(
+        [dedup_keys(base_df.iloc[candidates]), keys], ignore_index=True
+    ))
+    pairs = pd.concat(
+        [part[['Lead_Name', 'Company']].astype(object) for part in (base_df.iloc[candidates], delta)],
+        ignore_index=True
+    )
+    return is_near[len(candidates):], _example_pairs(
+        pairs, [pair for pair in examples if pair[1] >= len(candidates)]
+    )
+
+@traced
+def merge_new_leads(base_df, new_df, base_fingerprints, merge_near_duplicates=MERGE_NEAR_DUPLICATES):
+    """Append the leads of `new_df` that are not duplicates of `base_df`'s or of each other.
+    
+    The new rows go through dedup_leads' rules, first occurrence (the base)
+    winning: exact and normalized duplicates are dropped, and when merging,
+    near-duplicates are looked for among the new rows and the base rows
+    sharing their blocks.
+    The base rows are not re-sorted or re-encoded; the merged frame is the
+    base followed by the appended rows.
+    
+    Returns the merged frame, the appended rows, the merged frame's sorted
+    fingerprints (the base ones with the delta's inserted), and a dedup
+    report of the new rows whose 'existing' entry counts those the base had.
+    """
+    raw, normalized = dedup_hashes(new_df)
+    existing = _in_sorted(base_fingerprints, normalized)
+    is_exact = pd.Series(raw).duplicated().to_numpy() & ~existing
+    is_duplicate = pd.Series(normalized).duplicated().to_numpy() | existing
+    delta, normalized = new_df[~is_duplicate], normalized[~is_duplicate]
+    
+    if merge_near_duplicates:
+        is_near, examples = _appended_near_duplicates(base_df, delta)
+    else:
+        is_near, examples = np.zeros(len(delta), dtype=bool), pd.DataFrame()
+    report = _dedup_report(int(is_exact.sum()), int((is_duplicate & ~existing).sum() - is_exact.sum()),
+                           is_near, examples, merge_near_duplicates)
+    report['existing'] = int(existing.sum())
+    delta, normalized = delta[~is_near], normalized[~is_near]
+    
+    df = _append_rows(base_df, delta)
+    delta_fingerprints = np.sort(normalized)
+    fingerprints = np.insert(
+        base_fingerprints, np.searchsorted(base_fingerprints, delta_fingerprints), delta_fingerprints
+    )
+    return df, delta, fingerprints, report
+
+@dataclass(frozen=True)
+class LeadView:
+    """A filter state over a shared dataset: the dataset itself plus the selected row positions.
+    
+    Views are what sessions hold; the dataset is never copied or modified,
+    and rows are only materialized, for the columns asked for, by the
+    sections that need lead-level data.
+    """
+    df: pd.DataFrame
+    rows: np.ndarray = None  # None selects every row
+    
+    def __len__(self):
+        return len(self.df) if self.rows is None else len(self.rows)
+    
+    def frame(self, columns=None):
+        """The selected rows as a DataFrame, optionally only `columns`"""
+        df = self.df if columns is None else self.df[columns]
+        return df if self.rows is None else df.take(self.rows)
+
+def filter_view(df, index, filters):
+    """LeadView of the rows matching a filter state, from the dataset's filter index"""
+    rows = select_rows(index, len(df), filters)
+    # e.g. the default full date range: an unfiltered view
+    if rows is not None and len(rows) == len(df):
+        rows = None
+    return LeadView(df, rows)
+
+CUBE_DIMENSIONS = ['Month', 'Month_Date', 'Sales_Person', 'Source', 'Status']
+# Multiselect filters from the sidebar (the date range is the fourth filter)
+LIST_FILTERS = ['Status', 'Sales_Person', 'Source']
+FILTER_INDEX_COLUMNS = ['Month_Date'] + LIST_FILTERS
+
+@traced
+def build_status_cube(df):
+    """Aggregate leads once into Month × Sales_Person × Source × Status counts"""
+    return (
+        df.groupby(CUBE_DIMENSIONS, observed=True, dropna=False)
+        .size()
+        .reset_index(name='Count')
+    )
+
+def cube_slices(cube):
+    """Cube row positions per value of each list filter, for update_cube_mask"""
+    return {column: cube.groupby(column, observed=True).indices for column in LIST_FILTERS}
+
+def merge_cubes(cube, delta_cube, df):
+    """Add `delta_cube`'s counts into `cube`; equals build_status_cube of the merged rows `df`"""
+    merged = pd.concat(
+        [part.astype({column: object for column in CUBE_DIMENSIONS if column in CATEGORICAL_COLUMNS})
+         for part in (cube, delta_cube)],
+        ignore_index=True
+    ).astype({column: df[column].dtype for column in CUBE_DIMENSIONS})
+    return (
+        merged.groupby(CUBE_DIMENSIONS, observed=True, dropna=False)['Count']
+        .sum()
+        .reset_index()
+    )
+
+def update_cube_mask(cube, slices, filters, previous=None):
+    """Cube-row selection for a filter state.
+    
+    When only one list filter changed since `previous`, the old selection is
+    patched by removing/adding the slices of the values that changed, so the
+    cost follows the size of the change rather than the cube.
+    """
+    if previous is None or previous['filters']['date_range'] != filters['date_range']:
+        return cube_filter_mask(cube, filters)
+    
+    changed = [column for column in LIST_FILTERS
+               if set(previous['filters'][column]) != set(filters[column])]
+    if not changed:
+        return previous['mask']
+    
+    column = changed[0]
+    old_values = set(previous['filters'][column])
+    new_values = set(filters[column])
+    # Switching to/from "All" (empty selection) or changing several filters at once
+    if len(changed) > 1 or not old_values or not new_values:
+        return cube_filter_mask(cube, filters)
+    
+    mask = previous['mask'].copy()
+    for value in old_values - new_values:
+        mask[slices[column].get(value, [])] = False
+    
+    added = [slices[column][value] for value in new_values - old_values if value in slices[column]]
+    if added:
+        rows = np.concatenate(added)
+        # Added rows still have to satisfy every other filter
+        mask[rows] = cube_filter_mask(cube.iloc[rows], {**filters, column: []})
+    return mask
+
+# A value's rows are indexed as a packed bitmap (n/8 bytes) only when it
+# holds at least 1/32 of the rows; sparser values keep their sorted int32
+# row positions (4 bytes a row), so no column costs more than 4 bytes a row
+# however many distinct values it has
+FILTER_BITMAP_MIN_SHARE = 32
+
+def _index_entry(positions, n_rows):
+    """Packed bitmap of a dense value's rows, sorted int32 positions of a sparse one"""
+    if len(positions) * FILTER_BITMAP_MIN_SHARE < n_rows:
+        return positions.astype(np.int32)
+    bits = np.zeros(n_rows, dtype=bool)
+    bits[positions] = True
+    return np.packbits(bits)
+
+@traced
+def build_filter_index(df):
+    """Per-value row sets of the filter columns: packed bitmaps (uint8) or sorted row positions (int32)"""
+    return {
+        column: {
+            value: _index_entry(positions, len(df))
+            for value, positions in df.groupby(column, observed=True).indices.items()
+        }
+        for column in FILTER_INDEX_COLUMNS
+    }
+
+@traced
+def extend_filter_index(index, delta, n_base):
+    """build_filter_index of a frame of `n_base` indexed rows followed by the `delta` rows.
+    
+    Bitmaps are padded to the new length with the delta's rows ORed in, and
+    sparse position lists are extended; a value keeps its representation,
+    and values new to the column get one by their share of the merged rows.
+    """
+    n_rows = n_base + len(delta)
+    extended = {}
+    for column in FILTER_INDEX_COLUMNS:
+        entries = {
+            value: np.concatenate([entry, np.zeros((n_rows + 7) // 8 - len(entry), dtype=np.uint8)])
+            if _is_bitmap(entry) else entry
+            for value, entry in index[column].items()
+        }
+        for value, positions in delta.groupby(column, observed=True).indices.items():
+            positions = positions + n_base
+            if value not in entries:
+                entries[value] = _index_entry(positions, n_rows)
+            elif _is_bitmap(entries[value]):
+                np.bitwise_or.at(entries[value], positions >> 3, (0x80 >> (positions & 7)).astype(np.uint8))
+            else:
+                entries[value] = np.concatenate([entries[value], positions.astype(np.int32)])
+        extended[column] = entries
+    return extended
+
+def _is_bitmap(selection):
+    return selection.dtype == np.uint8
+
+def _bits_at(bits, positions):
+    """Whether each of `positions` is set in a packed bitmap"""
+    return ((bits[positions >> 3] >> (7 - (positions & 7))) & 1).astype(bool)
+
+def _union_entries(entries, values, n_rows):
+    """OR of the row sets of `values` (values absent from the index select nothing).
+    
+    A column's values never share rows, so sparse position lists are merged
+    by a sort; they are only set into a bitmap when a dense value is selected too.
+    """
+    selected = [entries[value] for value in set(values) if value in entries]
+    bitmaps = [entry for entry in selected if _is_bitmap(entry)]
+    positions = [entry for entry in selected if not _is_bitmap(entry)]
+    positions = np.sort(np.concatenate(positions)) if positions else np.empty(0, dtype=np.int32)
+    if not bitmaps:
+        return positions
+    
+    bits = np.bitwise_or.reduce(bitmaps)
+    np.bitwise_or.at(bits, positions >> 3, (0x80 >> (positions & 7)).astype(np.uint8))
+    return bits
+
+def _intersect(a, b):
+    """AND of two row sets, each a packed bitmap or sorted positions"""
+    if _is_bitmap(a) and _is_bitmap(b):
+        return a & b
+    if _is_bitmap(a):
+        a, b = b, a
+    if _is_bitmap(b):
+        return a[_bits_at(b, a)]
+    return np.intersect1d(a, b, assume_unique=True)
+
+def select_rows(index, n_rows, filters):
+    """Row positions matching a filter state, or None when nothing is filtered.
+    
+    Each filter is an OR over its selected values' row sets and the filters
+    are ANDed together, so no boolean Series or intermediate frames are built.
+    """
+    selection = None
+    
+    if filters.get('date_range'):
+        start_date, end_date = (pd.Timestamp(day) for day in filters['date_range'])
+        dates = [date for date in index['Month_Date'] if start_date <= date <= end_date]
+        selection = _union_entries(index['Month_Date'], dates, n_rows)
+    
+    for column in LIST_FILTERS:
+        if filters.get(column):
+            rows = _union_entries(index[column], filters[column], n_rows)
+            selection = rows if selection is None else _intersect(selection, rows)
+    
+    if selection is None:
+        return None
+    if _is_bitmap(selection):
+        return np.flatnonzero(np.unpackbits(selection, count=n_rows))
+    return selection.astype(np.intp)
+
+def cube_counts(cube, by):
+    """Lead counts per value of one (or more) cube dimensions"""
+    return cube.groupby(by, observed=True)['Count'].sum()
+
+def cube_pivot(cube, index, columns):
+    """Two-dimensional count table from the cube (missing combinations are 0)"""
+    table = cube_counts(cube, [index, columns]).unstack(fill_value=0)
+    # Plain axes, so callers can add columns such as a 'Total'
+    table.index = _plain_index(table.index)
+    table.columns = _plain_index(table.columns)
+    return table
+
+def status_column(table, status):
+    """One status column of a cube_pivot table as an array (zeros if never seen)"""
+    if status in table.columns:
+        return table[status].to_numpy(dtype=int)
+    return np.zeros(len(table), dtype=int)
+
+def conversion_table(cube, by):
+    """Total, converted and lost leads per value of a cube dimension, with rates in percent"""
+    by_status = cube_pivot(cube, by, 'Status')
+    table = pd.DataFrame({
+        by: by_status.index,
+        'Total_Leads': by_status.sum(axis=1).to_numpy(),
+        'Converted': status_column(by_status, 'Converted'),
+        'Lost': status_column(by_status, 'Lost Lead')
+    })
+    table['Conversion_Rate'] = table['Converted'] / table['Total_Leads'] * 100
+    table['Loss_Rate'] = table['Lost'] / table['Total_Leads'] * 100
+    return table
+
+def source_table(cube):
+    """conversion_table per lead source, largest first (leads without a source are left out)"""
+    cube_sources = cube[cube['Source'].str.len() > 0]
+    if len(cube_sources) == 0:
+        return None
+    return conversion_table(cube_sources, 'Source').sort_values('Total_Leads', ascending=False)
+
+def _plain_index(index):
+    if isinstance(index, pd.CategoricalIndex):
+        return index.astype(index.categories.dtype)
+    return index
+
+def cube_filter_mask(cube, filters):
+    """Cube rows selected by a filter state (a missing or empty entry means "All")"""
+    mask = np.ones(len(cube), dtype=bool)
+    
+    if filters.get('date_range'):
+        start_date, end_date = filters['date_range']
+        mask &= ((cube['Month_Date'] >= pd.Timestamp(start_date)) &
+                 (cube['Month_Date'] <= pd.Timestamp(end_date))).to_numpy()
+    
+    for column in LIST_FILTERS:
+        if filters.get(column):
+            mask &= cube[column].isin(filters[column]).to_numpy()
+    
+    return mask
+
+def calculate_metrics_batch(cube, filter_states):
+    """Calculate the KPI dict for many filter states in one call.
+    
+    Status, Month_Date and Sales_Person are encoded once; each filter state
+    then costs three weighted bincounts over the cube instead of row scans.
+    """
+    counts = cube['Count'].to_numpy()
+    status_codes, statuses = pd.factorize(cube['Status'])
+    month_codes, months = pd.factorize(cube['Month_Date'])
+    person_codes, people = pd.factorize(cube['Sales_Person'])
+    
+    results = []
+    for filters in filter_states:
+        weights = counts * cube_filter_mask(cube, filters)
+        by_status = np.bincount(status_codes, weights=weights, minlength=len(statuses)).astype(int)
+        by_month = np.bincount(month_codes, weights=weights, minlength=len(months)).astype(int)
+        by_person = np.bincount(person_codes, weights=weights, minlength=len(people)).astype(int)
+        results.append(_metrics_from_counts(
+            dict(zip(statuses, by_status)),
+            dict(zip(months, by_month)),
+            by_person[by_person > 0]
+        ))
+    return results
+
+@traced
+def calculate_metrics(cube, filters=None):
+    """Calculate comprehensive KPIs with correct conversion definition"""
+    return calculate_metrics_batch(cube, [filters or {}])[0]
+
+def _metrics_from_counts(status_counts, month_counts, person_counts):
+    """Build the KPI dict from per-status, per-month and per-salesperson lead counts"""
+    total_leads = int(sum(status_counts.values()))
+    
+    # CORRECTED: Only "Converted" status counts as conversion
+    converted = int(status_counts.get('Converted', 0))
+    pre_qualified = int(status_counts.get('Pre-Qualified', 0))
+    
+    contacted = int(status_counts.get('Contacted', 0))
+    new_leads = int(status_counts.get('New', 0))
+    lost_leads = int(status_counts.get('Lost Lead', 0))
+    
+    # CORRECTED: Conversion rate based only on "Converted" status
+    conversion_rate = (converted / total_leads * 100) if total_leads > 0 else 0
+    contact_rate = (contacted / total_leads * 100) if total_leads > 0 else 0
+    loss_rate = (lost_leads / total_leads * 100) if total_leads > 0 else 0
+    
+    active_months = [month for month, count in month_counts.items() if count > 0]
+    current_month = max(active_months) if active_months else pd.NaT
+    last_month = current_month - pd.DateOffset(months=1)
+    
+    current_month_leads = int(month_counts.get(current_month, 0))
+    last_month_leads = int(month_counts.get(last_month, 0))
+    
+    month_growth = ((current_month_leads - last_month_leads) / last_month_leads * 100) if last_month_leads > 0 else 0
+    avg_leads_per_person = person_counts.mean() if len(person_counts) > 0 else np.nan
+    
+    return {
+        'total_leads': total_leads,
+        'conversion_rate': conversion_rate,
+        'contact_rate': contact_rate,
+        'loss_rate': loss_rate,
+        'new_leads': new_leads,
+        'month_growth': month_growth,
+        'avg_leads_per_person': avg_leads_per_person,
+        'current_month_leads': current_month_leads,
+        'active_salespeople': len(person_counts),
+        'converted_leads': converted,  # Only Converted
+        'lost_leads': lost_leads,
+        'pre_qualified': pre_qualified,  # Separate tracking
+        'active_leads': total_leads - converted - lost_leads
+    }
+
+def executive_highlights(cube):
+    """Volume leader, top converter and best month as (name, count) pairs ("N/A", 0 when empty)"""
+    highlights = {}
+    for key, counts in (
+        ('top_volume', cube_counts(cube, 'Sales_Person')),
+        ('top_converter', cube_counts(cube[cube['Status'] == 'Converted'], 'Sales_Person')),
+        ('best_month', cube_counts(cube, 'Month'))
+    ):
+        highlights[key] = (counts.idxmax(), counts.max()) if len(counts) > 0 else ("N/A", 0)
+    return highlights
+
+def monthly_trends(cube):
+    """Leads per month with a 3-month moving average, growth rate and running total"""
+    monthly_data = cube_counts(cube, ['Month', 'Month_Date']).reset_index()
+    monthly_data.columns = ['Month', 'Date', 'Lead_Count']
+    monthly_data = monthly_data.sort_values('Date')
+    
+    monthly_data['MA_3'] = monthly_data['Lead_Count'].rolling(window=3, min_periods=1).mean()
+    monthly_data['Growth_Rate'] = monthly_data['Lead_Count'].pct_change() * 100
+    monthly_data['Cumulative'] = monthly_data['Lead_Count'].cumsum()
+    return monthly_data
+
+def team_performance(cube):
+    """Per-salesperson status counts, conversion rate and last activity; returns (table, Sales_Person × Status pivot)"""
+    status_by_person = cube_pivot(cube, 'Sales_Person', 'Status')
+    last_activity = cube.groupby('Sales_Person', observed=True)['Month_Date'].max()
+    team_metrics = pd.DataFrame({
+        'Sales_Person': status_by_person.index,
+        'Total_Leads': status_by_person.sum(axis=1).to_numpy(),
+        'Last_Activity': last_activity.to_numpy()
+    })
+    
+    # Conversions count only "Converted"; pre-qualified is tracked separately
+    team_metrics['Converted'] = status_column(status_by_person, 'Converted')
+    team_metrics['Pre_Qualified'] = status_column(status_by_person, 'Pre-Qualified')
+    team_metrics['Contacted'] = status_column(status_by_person, 'Contacted')
+    team_metrics['New'] = status_column(status_by_person, 'New')
+    team_metrics['Lost'] = status_column(status_by_person, 'Lost Lead')
+    
+    # Calculate rates
+    team_metrics['Conversion_Rate'] = (team_metrics['Converted'] / team_metrics['Total_Leads'] * 100).round(1)
+    team_metrics['Active'] = team_metrics['Total_Leads'] - team_metrics['Converted'] - team_metrics['Lost']
+    return team_metrics, status_by_person
+
+def performance_tiers(team_metrics):
+    """Salespeople with high (>=3%), medium (1-3%) and low (<1%) conversion rates"""
+    # CORRECTED: Realistic B2B thresholds
+    high_performers = len(team_metrics[team_metrics['Conversion_Rate'] >= 3])
+    medium_performers = len(team_metrics[(team_metrics['Conversion_Rate'] >= 1) &
+                                         (team_metrics['Conversion_Rate'] < 3)])
+    low_performers = len(team_metrics[team_metrics['Conversion_Rate'] < 1])
+    return high_performers, medium_performers, low_performers
+
+def funnel_counts(cube):
+    """Lead counts per funnel stage, leaving out empty stages"""
+    status_counts = cube_counts(cube, 'Status')
+    stages = {
+        'All Leads': int(cube['Count'].sum()),
+        'New': int(status_counts.get('New', 0)),
+        'Attempted Contact': int(status_counts.get('Attempted to Contact', 0)),
+        'Contacted': int(status_counts.get('Contacted', 0)),
+        'Pre-Qualified': int(status_counts.get('Pre-Qualified', 0)),
+        'Converted': int(status_counts.get('Converted', 0))
+    }
+    return {k: v for k, v in stages.items() if v > 0}
+
+def status_timeline_counts(cube):
+    """Lead counts per month and status, in month order"""
+    timeline = cube_counts(cube, ['Month', 'Month_Date', 'Status']).reset_index()
+    return timeline.sort_values('Month_Date')
+
+def status_month_pivot(cube):
+    """Status × Month lead counts with the months in calendar order"""
+    heatmap_pivot = cube_pivot(cube, 'Status', 'Month')
+    if not heatmap_pivot.empty:
+        month_order = cube.groupby('Month', observed=True)['Month_Date'].first().sort_values().index
+        month_order = [m for m in month_order if m in heatmap_pivot.columns]
+        if month_order:
+            heatmap_pivot = heatmap_pivot[month_order]
+    return heatmap_pivot
+
+def top_salesperson_status_pivot(cube, top=10):
+    """Salesperson × Status lead counts for the `top` salespeople by volume (None without data)"""
+    sp_status = cube_pivot(cube, 'Sales_Person', 'Status')
+    if sp_status.empty:
+        return None
+    top_sp = cube_counts(cube, 'Sales_Person').nlargest(top).index
+    sp_pivot = sp_status[sp_status.index.isin(top_sp)]
+    # Keep only statuses the top salespeople actually have
+    return sp_pivot.loc[:, sp_pivot.sum() > 0]
+
+@dataclass
+class Forecast:
+    """Linear trend over monthly lead counts, extended with a 95% band"""
+    history: pd.DataFrame  # Month_Date, Leads
+    trend_line: np.ndarray
+    slope: float
+    mean_leads: float
+    future_dates: pd.DatetimeIndex
+    forecast: np.ndarray
+    upper: np.ndarray
+    lower: np.ndarray
+
+def lead_forecast(cube, horizon=6):
+    """Least-squares trend of monthly leads projected `horizon` months ahead (None below 3 months)"""
+    monthly_data = cube_counts(cube, 'Month_Date').reset_index(name='Leads')
+    monthly_data = monthly_data.sort_values('Month_Date')
+    
+    if len(monthly_data) < 3:
+        return None
+    
+    X = np.arange(len(monthly_data))
+    y = monthly_data['Leads'].values
+    
+    x_mean = X.mean()
+    y_mean = y.mean()
+    
+    numerator = np.sum((X - x_mean) * (y - y_mean))
+    denominator = np.sum((X - x_mean) ** 2)
+    slope = numerator / denominator if denominator != 0 else 0
+    intercept = y_mean - slope * x_mean
+    
+    trend_line = slope * X + intercept
+    
+    future_X = np.arange(len(monthly_data), len(monthly_data) + horizon)
+    forecast = slope * future_X + intercept
+    forecast = np.maximum(forecast, 0)
+    
+    # Calculate confidence intervals (simple method)
+    residuals = y - trend_line
+    std_error = np.std(residuals)
+    forecast_upper = forecast + 1.96 * std_error
+    forecast_lower = np.maximum(forecast - 1.96 * std_error, 0)
+    
+    last_date = monthly_data['Month_Date'].max()
+    future_dates = pd.date_range(start=last_date + pd.DateOffset(months=1), periods=horizon, freq='MS')
+    
+    return Forecast(monthly_data, trend_line, slope, y_mean, future_dates, forecast, forecast_upper, forecast_lower)
+
+def bucket_long_tail(table, label, limit=CHART_MAX_POINTS, noun='items'):
+    """Keep the first `limit - 1` rows of a table sorted largest first and sum the rest into an 'Others' row"""
+    if len(table) <= limit:
+        return table
+    head, tail = table.iloc[:limit - 1], table.iloc[limit - 1:]
+    others = tail.select_dtypes('number').sum().to_frame().T
+    others[label] = f"Others ({len(tail):,} {noun})"
+    return pd.concat([head, others], ignore_index=True)[table.columns]
+
+def histogram_bars(values, max_bins):
+    """Integer-aligned histogram computed server-side, so the payload is one bar per bin"""
+    low, high = int(values.min()), int(values.max())
+    width = max(1, -(-(high - low + 1) // max_bins))
+    edges = np.arange(low, high + width + 1, width)
+    counts, _ = np.histogram(values, bins=edges)
+    labels = [str(start) if width == 1 else f"{start}-{start + width - 1}" for start in edges[:-1]]
+    return edges[:-1] + (width - 1) / 2, counts, width, labels
+
+# Columns build_company_table reads
+COMPANY_COLUMNS = ['Company', 'Lead_Name', 'Status', 'Sales_Person', 'Month_Date']
+
+@traced
+def build_company_table(df):
+    """Per-company lead counts, distinct statuses and team size, and contact dates (None without companies)"""
+    df_companies = df[df['Company'].str.len() > 0]
+    
+    if len(df_companies) == 0:
+        return None
+    
+    company_data = df_companies.groupby('Company', observed=True).agg(
+        Total_Leads=('Lead_Name', 'count'),
+        Status_Count=('Status', 'nunique'),
+        Team_Size=('Sales_Person', 'nunique'),
+        First_Contact=('Month_Date', 'min'),
+        Last_Contact=('Month_Date', 'max')
+    ).reset_index()
+    
+    company_data['Days_Active'] = (company_data['Last_Contact'] - company_data['First_Contact']).dt.days
+    return company_data.sort_values('Total_Leads', ascending=False)
+
+# Unfiltered per-tab aggregates precomputed in the background once a dataset
+# is loaded, with the label shown while a tab waits on them
+AGGREGATE_STAGES = {
+    'monthly_trends': 'monthly trends',
+    'forecast': 'forecast',
+    'team': 'team metrics',
+    'sources': 'source metrics',
+    'companies': 'company table'
+}
+
+@traced
+def precompute_aggregates(df, cube, report):
+    """Compute the AGGREGATE_STAGES of a dataset from its full cube, passing each to report(stage, result)"""
+    report('monthly_trends', monthly_trends(cube))
+    report('forecast', lead_forecast(cube, horizon=6))
+    report('team', team_performance(cube))
+    report('sources', source_table(cube))
+    report('companies', build_company_table(df[COMPANY_COLUMNS]))
+
+def engagement_duration_counts(days_active):
+    """Companies per engagement-duration range, with ranges sized to the longest engagement"""
+    max_days = days_active.max()
+    
+    # Create dynamic bins based on max days
+    if max_days <= 30:
+        bins = [0, 10, 20, 30, max_days + 1]
+        labels = ['0-10', '11-20', '21-30', '30+']
+    elif max_days <= 90:
+        bins = [0, 30, 60, 90, max_days + 1]
+        labels = ['0-30', '31-60', '61-90', '90+']
+    elif max_days <= 180:
+        bins = [0, 30, 60, 90, 180, max_days + 1]
+        labels = ['0-30', '31-60', '61-90', '91-180', '180+']
+    elif max_days <= 365:
+        bins = [0, 30, 60, 90, 180, 365, max_days + 1]
+        labels = ['0-30', '31-60', '61-90', '91-180', '181-365', '365+']
+    else:
+        bins = [0, 30, 60, 90, 180, 365, max_days + 1]
+        labels = ['0-30', '31-60', '61-90', '91-180', '181-365', '365+']
+    
+    # Remove duplicate bins
+    bins = sorted(list(set(bins)))
+    # Adjust labels to match bins
+    if len(bins) != len(labels) + 1:
+        # Create simple labels based on actual bins
+        labels = [f"{int(bins[i])}-{int(bins[i+1]-1)}" for i in range(len(bins)-1)]
+    
+    duration_bins = pd.cut(days_active, bins=bins, labels=labels[:len(bins)-1], include_lowest=True)
+    return duration_bins.value_counts().sort_index()
+
+# Lead-level columns shown by the data explorer
+LEAD_DISPLAY_COLUMNS = ['Month', 'Lead_Name', 'Company', 'Status', 'Sales_Person', 'Source']
+
+def search_leads(df, search_term, sort_by):
+    """Leads whose name, company or source contains `search_term`, in display columns and order"""
+    display_df = df
+    
+    if search_term:
+        mask = (
+            display_df['Lead_Name'].str.contains(search_term, case=False, na=False) |
+            display_df['Company'].str.contains(search_term, case=False, na=False) |
+            display_df['Source'].str.contains(search_term, case=False, na=False)
+        )
+        display_df = display_df[mask]
+    
+    return display_df[LEAD_DISPLAY_COLUMNS].sort_values(sort_by, ascending=False)
@@ -5,6 +5,27 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
 import numpy as np
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from analytics import (
+    COMPANY_COLUMNS, CSV_CHUNK_ROWS, EXACT_TEST_COMPANIES, EXACT_TEST_NAMES, LEAD_DISPLAY_COLUMNS,
+    MERGE_NEAR_DUPLICATES, PARSE_WORKERS, PARSER_VERSION, VOCABULARY_DIGEST, ParseError, SnapshotError,
+    parse_upload, parse_in_pool, merge_uploads, merge_new_leads, row_fingerprints, find_near_duplicates,
+    make_dataset_key, save_snapshot, map_snapshot, read_snapshot, list_snapshots,
+    build_status_cube, cube_slices, merge_cubes, update_cube_mask, build_filter_index, extend_filter_index, filter_view,
+    calculate_metrics, conversion_table, source_table, build_company_table,
+    bucket_long_tail, histogram_bars, summarize_append,
+    executive_highlights, monthly_trends, team_performance, performance_tiers,
+    funnel_counts, status_timeline_counts, status_month_pivot, top_salesperson_status_pivot,
+    lead_forecast, engagement_duration_counts, search_leads, AGGREGATE_STAGES, precompute_aggregates,
+    start_trace, trace_stage, traced, start_profile, stop_profile
+)
 
 # Page configuration
 st.set_page_config(
@@ -381,304 +402,434 @@ st.markdown("""
 st.title("📊 Enterprise Lead Analytics Dashboard")
 st.markdown("*AI-Powered Sales Intelligence & Performance Tracking*")
 
-def extract_leads_from_excel(df_raw):
-    """Extract lead data from hierarchical Excel structure"""
-    try:
-        data_rows = df_raw.values.tolist()
-        leads_data = []
-        current_month = None
-        current_status = None
-        current_owner = None
-        
-        months = ['January', 'February', 'March', 'April', 'May', 'June',
-                 'July', 'August', 'September', 'October', 'November', 'December']
-        statuses = ['New', 'Contacted', 'Pre-Qualified', 'Pre Qualified', 
-                   'Lost Lead', 'Postpone', 'Attempted to Contact', 
-                   'Not Qualified', 'Cold Call', 'Qualified', 'Converted']
-        owners = ['Onkar', 'Balasubramanian', 'Samyuktha', 'Pravesh', 
-                 'Devangi', 'Gauri', 'Saphinangi', 'Sneha', 'Nishant', 
-                 'Asmita', 'Tirath', 'Nivedita', 'Selvam', 'social Inv']
-        
-        for row in data_rows:
-            row = [str(cell).strip() if pd.notna(cell) else "" for cell in row]
-            
-            if all(cell == "" or cell == "nan" for cell in row):
-                continue
-            
-            if len(row) > 0 and any(month in row[0] for month in months):
-                current_month = row[0].split('(')[0].strip()
-                continue
-            
-            if len(row) > 1 and any(status.lower() in row[1].lower() for status in statuses):
-                current_status = row[1].split('(')[0].strip()
-                continue
-            
-            if len(row) > 2 and any(owner.lower() in row[2].lower() for owner in owners):
-                current_owner = row[2].split('(')[0].strip()
-                continue
-            
-            lead_name = row[3] if len(row) > 3 else ""
-            
-            if (lead_name and 
-                lead_name not in ["", "nan", "None", ".", "-"] and 
-                len(lead_name) > 1 and
-                current_month and 
-                current_status and 
-                current_owner):
-                
-                lead_record = {
-                    'Month': current_month,
-                    'Status': current_status,
-                    'Sales_Person': current_owner,
-                    'Lead_Name': lead_name,
-                    'Source': row[4] if len(row) > 4 else '',
-                    'Company': row[5] if len(row) > 5 else ''
-                }
-                leads_data.append(lead_record)
-        
-        if not leads_data:
-            return None
-        
-        df_clean = pd.DataFrame(leads_data)
-        df_clean['Month'] = df_clean['Month'].str.replace(r'\s*\(\d+\)', '', regex=True).str.strip()
-        df_clean['Status'] = df_clean['Status'].str.replace(r'\s*\(\d+\)', '', regex=True).str.strip()
-        df_clean['Sales_Person'] = df_clean['Sales_Person'].str.replace(r'\s*\(\d+\)', '', regex=True).str.strip()
-        df_clean['Company'] = df_clean['Company'].str.strip()
-        df_clean['Source'] = df_clean['Source'].str.strip()
-        
-        status_mapping = {
-            'Pre Qualified': 'Pre-Qualified',
-            'Postpone': 'Postponed',
-        }
-        df_clean['Status'] = df_clean['Status'].replace(status_mapping)
-        
-        # More conservative duplicate removal - only if ALL fields match
-        df_clean = df_clean.drop_duplicates(subset=['Lead_Name', 'Month', 'Sales_Person', 'Company', 'Source'], keep='first')
-        
-        # Debug: Show how many duplicates were removed
-        duplicates_removed = len(leads_data) - len(df_clean)
-        if duplicates_removed > 0:
-            st.info(f"ℹ️ Removed {duplicates_removed} exact duplicate entries")
-        
-        return df_clean
-        
-    except Exception as e:
-        st.error(f"Error extracting data: {str(e)}")
-        return None
+PARSE_CACHE_MAX_ENTRIES = 8
 
-def load_data(uploaded_file):
-    """Load and validate data from uploaded file"""
+def display_dedup_report(report, scope="entries"):
+    """Explain how many duplicate leads were merged and why"""
+    total = report['exact'] + report['normalized'] + report['fuzzy']
+    if total > 0:
+        st.info(
+            f"ℹ️ Removed {total} duplicate {scope}: {report['exact']} exact, "
+            f"{report['normalized']} case/spacing/punctuation variants, "
+            f"{report['fuzzy']} near-duplicates"
+        )
+    if report['fuzzy'] > 0:
+        with st.expander("🔁 Near-duplicate merges (examples)"):
+            st.dataframe(report['examples'], use_container_width=True, hide_index=True)
+
+def display_parse_notes(parsed):
+    """Explain what the parser found in one upload"""
+    if parsed.layout == 'standard':
+        st.info(f"🔍 Standard format detected. Loaded {parsed.raw_rows} rows initially")
+    else:
+        if parsed.layout == 'streamed':
+            st.info(f"📄 Hierarchical format detected... streamed in chunks of {CSV_CHUNK_ROWS:,} rows")
+        else:
+            st.info("📄 Hierarchical format detected...")
+            st.warning(f"🔍 RAW DATA: {parsed.raw_rows} rows in hierarchical format")
+        display_dedup_report(parsed.dedup)
+        st.success(f"✅ PARSED: Extracted {parsed.extracted} leads from hierarchical format")
+    
+    # DETAILED DEBUG INFO
+    if parsed.summary['test_entries_removed'] > 0:
+        st.warning(f"⚠️ Removed {parsed.summary['test_entries_removed']} test entries")
+
+def parse_uploaded_file(uploaded_file):
+    """Read, parse and clean an uploaded file; returns (df, validation summary)"""
     try:
         file_extension = uploaded_file.name.split('.')[-1].lower()
         
         # DEBUG: Show file info
         st.info(f"📂 File: {uploaded_file.name} | Size: {uploaded_file.size} bytes | Type: {file_extension}")
         
-        if file_extension == 'csv':
-            df = pd.read_csv(uploaded_file)
-            st.info(f"🔍 CSV RAW: Loaded {len(df)} rows initially")
-            
-            if 'Month' not in df.columns:
-                st.info("📄 Detecting hierarchical format...")
-                df_raw = pd.read_csv(uploaded_file, header=None)
-                st.warning(f"🔍 RAW DATA: {len(df_raw)} rows in hierarchical format")
-                df = extract_leads_from_excel(df_raw)
-                if df is not None:
-                    st.success(f"✅ PARSED: Extracted {len(df)} leads from hierarchical format")
-                if df is None:
-                    return None
-        
-        elif file_extension in ['xlsx', 'xls']:
-            df_test = pd.read_excel(uploaded_file, nrows=5)
-            if 'Month' in df_test.columns:
-                st.info("🔍 Standard format detected. Loading directly.")
-                df = pd.read_excel(uploaded_file)
-                st.info(f"🔍 Excel RAW: Loaded {len(df)} rows initially")
-            else:
-                st.info("📄 Detecting hierarchical format...")
-                df_raw = pd.read_excel(uploaded_file, header=None)
-                st.warning(f"🔍 RAW DATA: {len(df_raw)} rows in hierarchical format")
-                df = extract_leads_from_excel(df_raw)
-                if df is not None:
-                    st.success(f"✅ PARSED: Extracted {len(df)} leads from hierarchical format")
-                if df is None:
-                    return None
-        else:
-            st.error(f"Unsupported file format: {file_extension}")
-            return None
-        
-        if df is None or df.empty:
-            st.error("Empty file")
-            return None
-        
-        required_cols = ['Month', 'Status', 'Sales_Person', 'Lead_Name', 'Source', 'Company']
-        missing_cols = [col for col in required_cols if col not in df.columns]
-        
-        if missing_cols:
-            st.error(f"❌ Missing columns: {', '.join(missing_cols)}")
-            return None
-        
-        df['Month_Date'] = pd.to_datetime(df['Month'], format='%B %Y', errors='coerce')
-        
-        if df['Month_Date'].isna().all():
-            df['Month_Date'] = pd.to_datetime(df['Month'], errors='coerce')
-        
-        df = df.dropna(subset=['Month_Date'])
+        # Read the upload once; the headless parser works on these bytes
+        parsed = parse_upload(uploaded_file.name, uploaded_file.getvalue())
+        display_parse_notes(parsed)
+        return parsed.df, parsed.summary
         
-        if df.empty:
-            st.error("No valid dates found")
-            return None
-        
-        df = df.sort_values('Month_Date')
-        
-        for col in ['Status', 'Sales_Person', 'Source', 'Company']:
-            if col in df.columns:
-                df[col] = df[col].fillna('').astype(str).str.strip()
-        
-        # EXTREMELY CONSERVATIVE filtering - only remove exact matches
-        test_entries_before = len(df)
-        
-        # Only remove if Lead_Name is EXACTLY these values (case-insensitive)
-        exact_test_names = ['test', 'testt', 'abc']
-        df = df[~df['Lead_Name'].str.strip().str.lower().isin(exact_test_names)]
-        
-        # Only remove if Company is EXACTLY these values
-        exact_test_companies = ['testing compny001', 'testing company001', 'test company']
-        df = df[~df['Company'].str.strip().str.lower().isin(exact_test_companies)]
+    except ParseError as e:
+        st.error(f"❌ {str(e)}")
+        return None
+    except Exception as e:
+        st.error(f"❌ Error: {str(e)}")
+        return None
+
+def display_validation_summary(summary):
+    """Render the load/validation expanders from a precomputed summary"""
+    # Show what was actually removed
+    with st.expander("🔍 DEBUG: What was filtered out?"):
+        st.write(f"**Before filtering:** {summary['test_entries_before']} records")
+        st.write(f"**After filtering:** {summary['total_records']} records")
+        st.write(f"**Removed:** {summary['test_entries_removed']} records")
+        
+        if summary['test_entries_removed'] > 0:
+            st.write("**Filter criteria used:**")
+            st.write("- Exact Lead Names removed:", EXACT_TEST_NAMES)
+            st.write("- Exact Company Names removed:", EXACT_TEST_COMPANIES)
+    
+    st.success(f"✅ Successfully loaded {summary['total_records']} leads!")
+    
+    # COMPREHENSIVE data validation summary
+    with st.expander("📊 DETAILED Data Validation Summary - OPEN THIS!", expanded=True):
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("📊 Total Records", summary['total_records'])
+        with col2:
+            st.metric("📅 Date Range", summary['date_range'])
+        with col3:
+            st.metric("👥 Unique Salespeople", summary['unique_salespeople'])
+        with col4:
+            st.metric("🏢 Unique Companies", summary['unique_companies'])
         
-        test_entries_removed = test_entries_before - len(df)
+        st.markdown("---")
+        st.markdown("### 📋 Status Distribution:")
+        st.dataframe(summary['status_distribution'], use_container_width=True, hide_index=True)
         
-        # DETAILED DEBUG INFO
-        if test_entries_removed > 0:
-            st.warning(f"⚠️ Removed {test_entries_removed} test entries")
+        st.markdown("---")
+        st.markdown("### 👥 Top 10 Salespeople by Volume:")
+        st.dataframe(summary['top_salespeople'], use_container_width=True, hide_index=True)
         
-        # Show what was actually removed
-        with st.expander("🔍 DEBUG: What was filtered out?"):
-            st.write(f"**Before filtering:** {test_entries_before} records")
-            st.write(f"**After filtering:** {len(df)} records")
-            st.write(f"**Removed:** {test_entries_removed} records")
-            
-            if test_entries_removed > 0:
-                st.write("**Filter criteria used:**")
-                st.write("- Exact Lead Names removed:", exact_test_names)
-                st.write("- Exact Company Names removed:", exact_test_companies)
-        
-        st.success(f"✅ Successfully loaded {len(df)} leads!")
-        
-        # COMPREHENSIVE data validation summary
-        with st.expander("📊 DETAILED Data Validation Summary - OPEN THIS!", expanded=True):
-            col1, col2, col3, col4 = st.columns(4)
-            with col1:
-                st.metric("📊 Total Records", len(df))
-            with col2:
-                st.metric("📅 Date Range", f"{df['Month_Date'].min().strftime('%b %Y')} - {df['Month_Date'].max().strftime('%b %Y')}")
-            with col3:
-                st.metric("👥 Unique Salespeople", df['Sales_Person'].nunique())
-            with col4:
-                st.metric("🏢 Unique Companies", df['Company'].nunique())
-            
-            st.markdown("---")
-            st.markdown("### 📋 Status Distribution:")
-            status_counts = df['Status'].value_counts().to_dict()
-            status_df = pd.DataFrame({
-                'Status': status_counts.keys(),
-                'Count': status_counts.values()
-            })
-            status_df['Percentage'] = (status_df['Count'] / len(df) * 100).round(2)
-            st.dataframe(status_df, use_container_width=True, hide_index=True)
-            
-            st.markdown("---")
-            st.markdown("### 👥 Top 10 Salespeople by Volume:")
-            top_sales = df['Sales_Person'].value_counts().head(10)
-            st.dataframe(pd.DataFrame({
-                'Salesperson': top_sales.index,
-                'Lead Count': top_sales.values
-            }), use_container_width=True, hide_index=True)
-            
-            st.markdown("---")
-            st.markdown("### 📅 Monthly Distribution:")
-            monthly_dist = df.groupby('Month').size().reset_index(name='Count')
-            monthly_dist = monthly_dist.merge(df[['Month', 'Month_Date']].drop_duplicates(), on='Month')
-            monthly_dist = monthly_dist.sort_values('Month_Date')
-            st.dataframe(monthly_dist[['Month', 'Count']], use_container_width=True, hide_index=True)
-            
-            st.markdown("---")
-            st.markdown("### ⚠️ Data Quality Checks:")
-            
-            quality_checks = []
-            
-            # Check for missing lead names
-            missing_names = df['Lead_Name'].isna().sum()
-            quality_checks.append(f"✅ Missing lead names: {missing_names}")
-            
-            # Check for missing companies
-            missing_companies = (df['Company'] == '').sum()
-            quality_checks.append(f"ℹ️ Blank companies: {missing_companies}")
-            
-            # Check for missing sources
-            missing_sources = (df['Source'] == '').sum()
-            quality_checks.append(f"ℹ️ Blank sources: {missing_sources}")
-            
-            # Check date range
-            date_span = (df['Month_Date'].max() - df['Month_Date'].min()).days
-            quality_checks.append(f"✅ Date span: {date_span} days ({date_span/30:.1f} months)")
-            
-            for check in quality_checks:
-                st.write(check)
-            
-            st.markdown("---")
-            st.markdown("### 🔍 Sample of First 10 Records:")
-            st.dataframe(df[['Month', 'Lead_Name', 'Company', 'Status', 'Sales_Person', 'Source']].head(10), 
-                        use_container_width=True, hide_index=True)
+        st.markdown("---")
+        st.markdown("### 📅 Monthly Distribution:")
+        st.dataframe(summary['monthly_distribution'], use_container_width=True, hide_index=True)
         
-        return df
+        st.markdown("---")
+        st.markdown("### ⚠️ Data Quality Checks:")
+        for check in summary['quality_checks']:
+            st.write(check)
         
-    except Exception as e:
-        st.error(f"❌ Error: {str(e)}")
+        st.markdown("---")
+        st.markdown("### 🔍 Sample of First 10 Records:")
+        st.dataframe(summary['sample'], use_container_width=True, hide_index=True)
+
+@st.cache_resource
+def _parse_cache():
+    """Process-wide registry of loaded datasets, keyed by (content hash, parser version, vocabularies).
+    
+    Every session viewing the same upload shares one read-only frame from
+    here; sessions only keep their filter state (see LeadView).
+    """
+    return OrderedDict(), threading.Lock()
+
+@traced
+def parse_uploaded_files(uploaded_files):
+    """Parse several exports in parallel and merge them into one (df, summary)"""
+    jobs = [(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_files]
+    st.info(f"📂 Parsing {len(jobs)} files with {min(len(jobs), PARSE_WORKERS)} worker(s)")
+    results, pooled = parse_in_pool(jobs)
+    if len(jobs) > 1 and PARSE_WORKERS > 1 and not pooled:
+        st.warning("⚠️ Parallel parsing failed, parsing files one by one")
+    
+    failed = [f"{name} ({error})" for (name, _), (_, error) in zip(jobs, results) if error is not None]
+    if failed:
+        st.error(f"❌ Could not parse: {', '.join(failed)}")
         return None
+    
+    parsed = [result for result, _ in results]
+    df, summary, report = merge_uploads(parsed)
+    display_dedup_report(report, scope="leads across files")
+    st.success(f"✅ Merged {len(jobs)} files into {len(df)} leads")
+    return df, summary
 
-def calculate_metrics(df):
-    """Calculate comprehensive KPIs with correct conversion definition"""
-    total_leads = len(df)
-    
-    # CORRECTED: Only "Converted" status counts as conversion
-    converted = len(df[df['Status'] == 'Converted'])
-    pre_qualified = len(df[df['Status'] == 'Pre-Qualified'])
-    
-    contacted = len(df[df['Status'] == 'Contacted'])
-    new_leads = len(df[df['Status'] == 'New'])
-    lost_leads = len(df[df['Status'] == 'Lost Lead'])
-    
-    # CORRECTED: Conversion rate based only on "Converted" status
-    conversion_rate = (converted / total_leads * 100) if total_leads > 0 else 0
-    contact_rate = (contacted / total_leads * 100) if total_leads > 0 else 0
-    loss_rate = (lost_leads / total_leads * 100) if total_leads > 0 else 0
-    
-    current_month = df['Month_Date'].max()
-    last_month = current_month - pd.DateOffset(months=1)
-    
-    current_month_leads = len(df[df['Month_Date'] == current_month])
-    last_month_leads = len(df[df['Month_Date'] == last_month])
-    
-    month_growth = ((current_month_leads - last_month_leads) / last_month_leads * 100) if last_month_leads > 0 else 0
-    avg_leads_per_person = df.groupby('Sales_Person').size().mean()
-    
-    return {
-        'total_leads': total_leads,
-        'conversion_rate': conversion_rate,
-        'contact_rate': contact_rate,
-        'loss_rate': loss_rate,
-        'new_leads': new_leads,
-        'month_growth': month_growth,
-        'avg_leads_per_person': avg_leads_per_person,
-        'current_month_leads': current_month_leads,
-        'active_salespeople': df['Sales_Person'].nunique(),
-        'converted_leads': converted,  # Only Converted
-        'lost_leads': lost_leads,
-        'pre_qualified': pre_qualified,  # Separate tracking
-        'active_leads': total_leads - converted - lost_leads
+def select_snapshot():
+    """Sidebar picker over saved snapshots; returns the chosen file hash or None"""
+    snapshots = list_snapshots()
+    if not snapshots:
+        return None
+    
+    labels = {
+        meta['file_hash']: f"{meta['source_name']} · {meta['rows']:,} leads · {meta['saved_at'].replace('T', ' ')}"
+        for meta in snapshots
     }
+    st.sidebar.header("💾 Saved Datasets")
+    choice = st.sidebar.selectbox(
+        "Open a previous upload",
+        [None] + list(labels),
+        format_func=lambda file_hash: "—" if file_hash is None else labels[file_hash]
+    )
+    return choice
+
+def _get_dataset(file_hash, parse=None, source_name=None, base_key=None):
+    """(df, summary) from the parse cache, then the snapshot store, then a fresh `parse()`.
+    
+    `base_key` is the dataset a parsed append extends, so only its new rows are saved.
+    """
+    cache_key = (file_hash, PARSER_VERSION, VOCABULARY_DIGEST)
+    dataset_key = make_dataset_key(file_hash)
+    cache, lock = _parse_cache()
+    
+    with lock:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            cache.move_to_end(cache_key)
+    
+    if cached is None:
+        try:
+            cached = read_snapshot(dataset_key)
+        except SnapshotError as e:
+            st.warning(f"⚠️ {str(e)}")
+            cached = None
+        if cached is None:
+            if parse is None:
+                return None
+            cached = parse()
+            if cached is None:
+                return None
+            try:
+                save_snapshot(cached[0], cached[1], dataset_key, source_name, base_key)
+                # Serve the memory-mapped snapshot instead of the parser's heap copy
+                # (an append's snapshot would be rebuilt from its base, so keep it)
+                mapped = map_snapshot(dataset_key) if base_key is None else None
+                if mapped is not None:
+                    cached = (mapped[0], cached[1])
+            except SnapshotError as e:
+                st.warning(f"⚠️ {str(e)}")
+        # Identifies this parse for caches keyed by dataset (e.g. cached_metrics)
+        cached[0].attrs['dataset_key'] = dataset_key
+        # Index the filter columns at load time so reruns only do bitwise ops
+        filter_index(dataset_key, cached[0])
+        with lock:
+            cache[cache_key] = cached
+            while len(cache) > PARSE_CACHE_MAX_ENTRIES:
+                cache.popitem(last=False)
+    
+    return cached
+
+def _load_dataset(file_hash, parse=None, source_name=None, base_key=None):
+    """Fetch a dataset via _get_dataset and show its validation summary"""
+    cached = _get_dataset(file_hash, parse, source_name, base_key)
+    if cached is None:
+        return None
+    
+    df, summary = cached
+    display_validation_summary(summary)
+    return df
+
+@traced
+def load_data(uploaded_file):
+    """Load and validate data from uploaded file, reusing earlier parses of the same bytes"""
+    return _load_dataset(
+        hashlib.sha256(uploaded_file.getvalue()).hexdigest(),
+        lambda: parse_uploaded_file(uploaded_file),
+        uploaded_file.name
+    )
+
+@traced
+def load_files(uploaded_files):
+    """Load one or more exports (e.g. one per month) as a single deduplicated dataset"""
+    if len(uploaded_files) == 1:
+        return load_data(uploaded_files[0])
+    
+    # Keyed by the files' hashes in upload order, which decides dedup precedence
+    file_hashes = [hashlib.sha256(f.getvalue()).hexdigest() for f in uploaded_files]
+    return _load_dataset(
+        hashlib.sha256(''.join(file_hashes).encode()).hexdigest(),
+        lambda: parse_uploaded_files(uploaded_files),
+        f"{uploaded_files[0].name} + {len(uploaded_files) - 1} more"
+    )
+
+@st.cache_resource(max_entries=PARSE_CACHE_MAX_ENTRIES)
+def dataset_fingerprints(dataset_key, _df, _fingerprints=None):
+    """Sorted row fingerprints of a dataset; precomputed ones may be passed in"""
+    if _fingerprints is not None:
+        return _fingerprints
+    return np.sort(row_fingerprints(_df))
+
+def parse_appended_files(base, uploaded_files, dataset_key):
+    """Merge only the leads of new exports that the `base` dataset does not already contain.
+    
+    The new leads go through the same dedup rules as a multi-file upload,
+    and the base dataset's fingerprints, status cube and filter index are
+    reused and extended with the delta, so their cost follows the number of
+    new leads.
+    """
+    parsed = parse_uploaded_file(uploaded_files[0]) if len(uploaded_files) == 1 else parse_uploaded_files(uploaded_files)
+    if parsed is None:
+        return None
+    new_df, new_summary = parsed
+    base_df, base_summary = base
+    
+    base_key = base_df.attrs['dataset_key']
+    df, delta, fingerprints, report = merge_new_leads(base_df, new_df, dataset_fingerprints(base_key, base_df))
+    st.info(f"➕ Appending {len(delta)} new leads ({report['existing']} already in the dataset)")
+    display_dedup_report(report, scope="new leads")
+    
+    # Seed the per-dataset caches from the base dataset plus the delta
+    dataset_fingerprints(dataset_key, df, _fingerprints=fingerprints)
+    base_cube, _ = dataset_cube(base_key, base_df)
+    cube = merge_cubes(base_cube, build_status_cube(delta), df)
+    dataset_cube(dataset_key, df, _cube=cube)
+    filter_index(dataset_key, df, _index=extend_filter_index(filter_index(base_key, base_df), delta, len(base_df)))
+    
+    return df, summarize_append(
+        base_summary, base_df, delta, df, cube,
+        base_summary['test_entries_before'] + new_summary['test_entries_before'],
+        base_summary['test_entries_removed'] + new_summary['test_entries_removed']
+    )
+
+@traced
+def append_files(base_hash, uploaded_files):
+    """Append new exports to a saved dataset, parsing and aggregating only what changed"""
+    base = _get_dataset(base_hash)
+    if base is None:
+        st.error("❌ The selected dataset is no longer available")
+        return None
+    
+    file_hashes = [hashlib.sha256(f.getvalue()).hexdigest() for f in uploaded_files]
+    file_hash = hashlib.sha256(''.join([base_hash] + file_hashes).encode()).hexdigest()
+    return _load_dataset(
+        file_hash,
+        lambda: parse_appended_files(base, uploaded_files, make_dataset_key(file_hash)),
+        f"{len(base[0]):,} saved leads + {', '.join(f.name for f in uploaded_files)}",
+        base[0].attrs['dataset_key']
+    )
+
+@traced
+def load_snapshot(file_hash):
+    """Load a previously saved dataset without the original upload"""
+    return _load_dataset(file_hash)
+
+@st.cache_resource(max_entries=PARSE_CACHE_MAX_ENTRIES)
+def dataset_cube(dataset_key, _df, _cube=None):
+    """Unfiltered status cube of a loaded dataset plus its per-value row slices, built once"""
+    cube = build_status_cube(_df) if _cube is None else _cube
+    return cube, cube_slices(cube)
+
+@traced
+def filtered_cube(df, filters):
+    """Status cube for the current filter state, derived from the previous rerun's selection"""
+    dataset_key = df.attrs['dataset_key']
+    cube, slices = dataset_cube(dataset_key, df)
+    
+    previous = st.session_state.get('cube_selection')
+    if previous is not None and previous['dataset_key'] != dataset_key:
+        previous = None
+    
+    mask = update_cube_mask(cube, slices, filters, previous)
+    st.session_state['cube_selection'] = {'dataset_key': dataset_key, 'filters': filters, 'mask': mask}
+    return cube[mask]
+
+@st.cache_resource(max_entries=PARSE_CACHE_MAX_ENTRIES)
+def filter_index(dataset_key, _df, _index=None):
+    """build_filter_index of a loaded dataset, built once per dataset; a prebuilt index may be passed in"""
+    if _index is not None:
+        return _index
+    return build_filter_index(_df)
+
+@st.cache_resource(max_entries=PARSE_CACHE_MAX_ENTRIES, show_spinner=False)
+def near_duplicates(dataset_key, _df):
+    """find_near_duplicates of a loaded dataset, run once per dataset"""
+    return find_near_duplicates(_df)
+
+def review_near_duplicates(df):
+    """On-demand review of the near-duplicate leads a dataset kept (nothing to review when they are merged)"""
+    if MERGE_NEAR_DUPLICATES:
+        return
+    dataset_key = df.attrs['dataset_key']
+    with st.expander("🔁 Review possible near-duplicates"):
+        st.caption("Leads that closely match another (e.g. a misspelt name) are kept; looking for them scans every lead")
+        if st.button("🔍 Find near-duplicates"):
+            st.session_state['near_duplicate_review'] = dataset_key
+        if st.session_state.get('near_duplicate_review') != dataset_key:
+            return
+        with st.spinner("🔄 Comparing leads..."):
+            count, examples = near_duplicates(dataset_key, df)
+        if count == 0:
+            st.success("✅ No near-duplicate leads found")
+            return
+        st.info(f"🔁 {count} possible near-duplicate leads were kept; examples below")
+        st.dataframe(examples, use_container_width=True, hide_index=True)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def cached_metrics(dataset_key, filters, _cube):
+    """calculate_metrics memoized per (dataset, filter state); the cube itself is not hashed"""
+    return calculate_metrics(_cube, filters)
+
+logger = logging.getLogger(__name__)
+
+# Background pre-aggregation: worker threads shared by every session, and how
+# often a tab waiting on them polls for progress
+AGGREGATE_WORKERS = 2
+AGGREGATE_POLL_SECONDS = 0.5
+
+@st.cache_resource
+def _aggregate_jobs():
+    """Process-wide pre-aggregation pool and its per-dataset jobs (results dict + future)"""
+    pool = ThreadPoolExecutor(max_workers=AGGREGATE_WORKERS, thread_name_prefix='lead-aggregates')
+    return pool, OrderedDict(), threading.Lock()
+
+def start_aggregates(df):
+    """Queue the unfiltered tab aggregates of a loaded dataset in the background, once per dataset"""
+    pool, jobs, lock = _aggregate_jobs()
+    dataset_key = df.attrs['dataset_key']
+    with lock:
+        job = jobs.get(dataset_key)
+        if job is not None:
+            jobs.move_to_end(dataset_key)
+            return job
+    
+    cube, _ = dataset_cube(dataset_key, df)
+    with lock:
+        if dataset_key not in jobs:
+            results = {}
+            # The worker only adds finished stages to `results`; readers never wait on it
+            jobs[dataset_key] = {
+                'results': results,
+                'future': pool.submit(precompute_aggregates, df, cube, results.__setitem__)
+            }
+            jobs[dataset_key]['future'].add_done_callback(
+                lambda future: _log_aggregate_failure(dataset_key, future)
+            )
+            while len(jobs) > PARSE_CACHE_MAX_ENTRIES:
+                jobs.popitem(last=False)
+        return jobs[dataset_key]
+
+def _aggregate_error(future):
+    """The exception a finished pre-aggregation job raised, or None"""
+    return None if future.cancelled() else future.exception()
+
+def _log_aggregate_failure(dataset_key, future):
+    """Log a failed pre-aggregation job with its traceback; nobody calls result() on it"""
+    error = _aggregate_error(future)
+    if error is not None:
+        logger.error("Background aggregation of dataset %s failed", dataset_key, exc_info=error)
+
+def show_aggregate_progress(job, stages):
+    """Progress of a tab's pending aggregates, polled until they are in and then rerunning the app"""
+    @st.fragment(run_every=AGGREGATE_POLL_SECONDS)
+    def progress():
+        done = [stage for stage in stages if stage in job['results']]
+        if len(done) == len(stages) or job['future'].done():
+            st.rerun()
+        pending = next(stage for stage in stages if stage not in done)
+        st.progress(
+            len(done) / len(stages),
+            text=f"⏳ Aggregating {AGGREGATE_STAGES[pending]}... ({len(done)}/{len(stages)})"
+        )
+    
+    progress()
 
+def tab_aggregates(job, view, stages):
+    """Background aggregates for a tab, or None while the job is still on them.
+    
+    While waiting a progress bar is shown instead. Filtered views get {} and
+    compute their own, much smaller, aggregates, as do profiled reruns
+    (job None), which keep all the work in the profiled thread.
+    """
+    if view.rows is not None or job is None:
+        return {}
+    if all(stage in job['results'] for stage in stages):
+        return job['results']
+    if job['future'].done():
+        # A failed job leaves its stages out, and the sections compute them inline
+        error = _aggregate_error(job['future'])
+        if error is not None:
+            st.error(f"❌ Background aggregation failed ({type(error).__name__}: {error}); computing this tab directly")
+        return job['results']
+    show_aggregate_progress(job, stages)
+    return None
+
+@traced
 def display_kpi_dashboard(metrics):
     """Executive KPI Dashboard with enhanced metrics"""
     st.subheader("📈 Executive Dashboard - Key Performance Indicators")
@@ -715,109 +866,177 @@ def display_kpi_dashboard(metrics):
                  delta_color="inverse",
                  help="Lost lead percentage")
 
-def create_monthly_trends_advanced(df):
+# Built Plotly figures are kept across reruns and sessions; the budget is measured
+# in the figures' array bytes and text so a few large heatmaps cannot crowd out memory.
+FIGURE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+@st.cache_resource
+def _figure_cache():
+    """Process-wide LRU of built figures, keyed by chart name and a hash of its inputs"""
+    return OrderedDict(), threading.Lock(), {'bytes': 0}
+
+def _figure_key(name, inputs):
+    """Content hash of the aggregated data a chart is drawn from"""
+    digest = hashlib.sha256(name.encode())
+    for value in inputs:
+        if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+            digest.update(pd.util.hash_pandas_object(value, index=not isinstance(value, pd.Index)).to_numpy().tobytes())
+            columns = value.columns if isinstance(value, pd.DataFrame) else [value.name]
+            dtypes = value.dtypes if isinstance(value, pd.DataFrame) else [value.dtype]
+            digest.update(repr((list(columns), [str(dtype) for dtype in dtypes])).encode())
+        elif isinstance(value, np.ndarray):
+            digest.update(str(value.dtype).encode() + value.tobytes())
+        else:
+            digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+def _figure_nbytes(value):
+    """Rough size of figure properties: array buffers plus string lengths, without serializing them"""
+    if isinstance(value, np.ndarray):
+        if value.dtype != object:
+            return value.nbytes
+        return sum(map(len, map(str, value.ravel().tolist())))
+    if isinstance(value, dict):
+        return sum(map(_figure_nbytes, value.values()))
+    if isinstance(value, (list, tuple)):
+        return sum(map(_figure_nbytes, value))
+    if isinstance(value, str):
+        return len(value)
+    return 8
+
+def cached_figure(name, inputs, build):
+    """Return the figure for these inputs, building it only when they have changed"""
+    figures, lock, usage = _figure_cache()
+    key = _figure_key(name, inputs)
+    with lock:
+        if key in figures:
+            figures.move_to_end(key)
+            return figures[key][0]
+    with trace_stage(f"build_figure[{name}]"):
+        fig = build()
+    size = _figure_nbytes([trace.to_plotly_json() for trace in fig.data]) + _figure_nbytes(fig.layout.to_plotly_json())
+    with lock:
+        if key not in figures and size <= FIGURE_CACHE_MAX_BYTES:
+            figures[key] = (fig, size)
+            usage['bytes'] += size
+            while usage['bytes'] > FIGURE_CACHE_MAX_BYTES:
+                _, (_, evicted) = figures.popitem(last=False)
+                usage['bytes'] -= evicted
+    return fig
+
+def show_figure(name, inputs, build):
+    """Render a cached figure full width"""
+    fig = cached_figure(name, inputs, build)
+    # Serializing the figure into the page is its own stage
+    with trace_stage(f"plotly_chart[{name}]"):
+        st.plotly_chart(fig, use_container_width=True)
+
+# Scatter traces with more points than this render through WebGL
+SCATTERGL_THRESHOLD = 500
+
+def scatter_trace(n_points):
+    """Scattergl above SCATTERGL_THRESHOLD points, SVG Scatter below it"""
+    return go.Scattergl if n_points > SCATTERGL_THRESHOLD else go.Scatter
+
+@traced
+def create_monthly_trends_advanced(cube, monthly_data=None):
     """Advanced monthly trends with comprehensive analytics"""
     st.subheader("📅 Monthly Lead Generation Trends & Analytics")
     
-    monthly_data = df.groupby('Month').agg({
-        'Lead_Name': 'count',
-        'Month_Date': 'first'
-    }).reset_index()
-    monthly_data.columns = ['Month', 'Lead_Count', 'Date']
-    monthly_data = monthly_data.sort_values('Date')
-    
-    monthly_data['MA_3'] = monthly_data['Lead_Count'].rolling(window=3, min_periods=1).mean()
-    monthly_data['Growth_Rate'] = monthly_data['Lead_Count'].pct_change() * 100
-    monthly_data['Cumulative'] = monthly_data['Lead_Count'].cumsum()
-    
-    fig = make_subplots(
-        rows=3, cols=1,
-        subplot_titles=('Lead Volume & Moving Average', 'Month-over-Month Growth Rate', 'Cumulative Lead Generation'),
-        vertical_spacing=0.12,
-        row_heights=[0.4, 0.3, 0.3]
-    )
+    if monthly_data is None:
+        monthly_data = monthly_trends(cube)
     
-    # Lead volume bars
-    fig.add_trace(
-        go.Bar(
-            x=monthly_data['Month'],
-            y=monthly_data['Lead_Count'],
-            name='Monthly Leads',
-            marker=dict(
-                color=monthly_data['Lead_Count'],
-                colorscale='Blues',
-                showscale=False,
-                line=dict(color='rgba(255,255,255,0.5)', width=1)
+    def build_figure():
+        fig = make_subplots(
+            rows=3, cols=1,
+            subplot_titles=('Lead Volume & Moving Average', 'Month-over-Month Growth Rate', 'Cumulative Lead Generation'),
+            vertical_spacing=0.12,
+            row_heights=[0.4, 0.3, 0.3]
+        )
+        
+        # Lead volume bars
+        fig.add_trace(
+            go.Bar(
+                x=monthly_data['Month'],
+                y=monthly_data['Lead_Count'],
+                name='Monthly Leads',
+                marker=dict(
+                    color=monthly_data['Lead_Count'],
+                    colorscale='Blues',
+                    showscale=False,
+                    line=dict(color='rgba(255,255,255,0.5)', width=1)
+                ),
+                text=monthly_data['Lead_Count'].astype(int),
+                textposition='outside',
+                textfont=dict(size=11, color='#1e293b'),
+                hovertemplate='<b>%{x}</b><br>Leads: %{y}<extra></extra>'
             ),
-            text=monthly_data['Lead_Count'].astype(int),
-            textposition='outside',
-            textfont=dict(size=11, color='#1e293b'),
-            hovertemplate='<b>%{x}</b><br>Leads: %{y}<extra></extra>'
-        ),
-        row=1, col=1
-    )
-    
-    # Moving average
-    fig.add_trace(
-        go.Scatter(
-            x=monthly_data['Month'],
-            y=monthly_data['MA_3'],
-            name='3-Month Moving Avg',
-            mode='lines+markers',
-            line=dict(color='#ef4444', width=3),
-            marker=dict(size=8, color='#ef4444', symbol='diamond'),
-            hovertemplate='<b>%{x}</b><br>3-Month Avg: %{y:.1f}<extra></extra>'
-        ),
-        row=1, col=1
-    )
-    
-    # Growth rate
-    colors = ['#10b981' if x >= 0 else '#ef4444' for x in monthly_data['Growth_Rate'].fillna(0)]
-    fig.add_trace(
-        go.Bar(
-            x=monthly_data['Month'],
-            y=monthly_data['Growth_Rate'].fillna(0),
-            name='Growth %',
-            marker_color=colors,
-            text=[f"{x:+.1f}%" for x in monthly_data['Growth_Rate'].fillna(0)],
-            textposition='outside',
-            textfont=dict(size=10),
-            hovertemplate='<b>%{x}</b><br>Growth: %{y:.1f}%<extra></extra>'
-        ),
-        row=2, col=1
-    )
-    
-    # Cumulative
-    fig.add_trace(
-        go.Scatter(
-            x=monthly_data['Month'],
-            y=monthly_data['Cumulative'],
-            name='Cumulative Leads',
-            mode='lines+markers',
-            fill='tozeroy',
-            line=dict(color='#8b5cf6', width=3),
-            marker=dict(size=8, color='#8b5cf6'),
-            hovertemplate='<b>%{x}</b><br>Total: %{y}<extra></extra>'
-        ),
-        row=3, col=1
-    )
-    
-    fig.update_xaxes(title_text="Month", row=1, col=1, tickangle=-45)
-    fig.update_yaxes(title_text="Lead Count", row=1, col=1)
-    fig.update_xaxes(title_text="Month", row=2, col=1, tickangle=-45)
-    fig.update_yaxes(title_text="Growth %", row=2, col=1)
-    fig.update_xaxes(title_text="Month", row=3, col=1, tickangle=-45)
-    fig.update_yaxes(title_text="Cumulative", row=3, col=1)
-    
-    fig.update_layout(
-        height=900,
-        showlegend=True,
-        hovermode='x unified',
-        plot_bgcolor='rgba(0,0,0,0)',
-        paper_bgcolor='rgba(0,0,0,0)'
-    )
+            row=1, col=1
+        )
+        
+        # Moving average
+        fig.add_trace(
+            go.Scatter(
+                x=monthly_data['Month'],
+                y=monthly_data['MA_3'],
+                name='3-Month Moving Avg',
+                mode='lines+markers',
+                line=dict(color='#ef4444', width=3),
+                marker=dict(size=8, color='#ef4444', symbol='diamond'),
+                hovertemplate='<b>%{x}</b><br>3-Month Avg: %{y:.1f}<extra></extra>'
+            ),
+            row=1, col=1
+        )
+        
+        # Growth rate
+        colors = ['#10b981' if x >= 0 else '#ef4444' for x in monthly_data['Growth_Rate'].fillna(0)]
+        fig.add_trace(
+            go.Bar(
+                x=monthly_data['Month'],
+                y=monthly_data['Growth_Rate'].fillna(0),
+                name='Growth %',
+                marker_color=colors,
+                text=[f"{x:+.1f}%" for x in monthly_data['Growth_Rate'].fillna(0)],
+                textposition='outside',
+                textfont=dict(size=10),
+                hovertemplate='<b>%{x}</b><br>Growth: %{y:.1f}%<extra></extra>'
+            ),
+            row=2, col=1
+        )
+        
+        # Cumulative
+        fig.add_trace(
+            go.Scatter(
+                x=monthly_data['Month'],
+                y=monthly_data['Cumulative'],
+                name='Cumulative Leads',
+                mode='lines+markers',
+                fill='tozeroy',
+                line=dict(color='#8b5cf6', width=3),
+                marker=dict(size=8, color='#8b5cf6'),
+                hovertemplate='<b>%{x}</b><br>Total: %{y}<extra></extra>'
+            ),
+            row=3, col=1
+        )
+        
+        fig.update_xaxes(title_text="Month", row=1, col=1, tickangle=-45)
+        fig.update_yaxes(title_text="Lead Count", row=1, col=1)
+        fig.update_xaxes(title_text="Month", row=2, col=1, tickangle=-45)
+        fig.update_yaxes(title_text="Growth %", row=2, col=1)
+        fig.update_xaxes(title_text="Month", row=3, col=1, tickangle=-45)
+        fig.update_yaxes(title_text="Cumulative", row=3, col=1)
+        
+        fig.update_layout(
+            height=900,
+            showlegend=True,
+            hovermode='x unified',
+            plot_bgcolor='rgba(0,0,0,0)',
+            paper_bgcolor='rgba(0,0,0,0)'
+        )
+        
+        return fig
     
-    st.plotly_chart(fig, use_container_width=True)
+    show_figure('monthly_trends', [monthly_data], build_figure)
     
     # Insights
     latest_growth = monthly_data['Growth_Rate'].iloc[-1] if len(monthly_data) > 0 else 0
@@ -835,51 +1054,17 @@ def create_monthly_trends_advanced(df):
     </div>
     """, unsafe_allow_html=True)
 
-def create_team_performance_comprehensive(df):
+@traced
+def create_team_performance_comprehensive(cube, team=None):
     """Comprehensive team performance analytics"""
     st.subheader("👥 Team Performance & Productivity Analysis")
     
-    # Calculate comprehensive metrics per salesperson
-    team_metrics = df.groupby('Sales_Person').agg({
-        'Lead_Name': 'count',
-        'Month_Date': lambda x: x.max()
-    }).reset_index()
-    
-    team_metrics.columns = ['Sales_Person', 'Total_Leads', 'Last_Activity']
-    
-    # Calculate conversions properly - only "Converted" status
-    converted_status = df[df['Status'] == 'Converted']
-    converted_counts = converted_status.groupby('Sales_Person').size()
-    team_metrics['Converted'] = team_metrics['Sales_Person'].map(converted_counts).fillna(0).astype(int)
-    
-    # Calculate pre-qualified separately
-    preq_status = df[df['Status'] == 'Pre-Qualified']
-    preq_counts = preq_status.groupby('Sales_Person').size()
-    team_metrics['Pre_Qualified'] = team_metrics['Sales_Person'].map(preq_counts).fillna(0).astype(int)
-    
-    # Calculate contacted leads
-    contacted_status = df[df['Status'] == 'Contacted']
-    contacted_counts = contacted_status.groupby('Sales_Person').size()
-    team_metrics['Contacted'] = team_metrics['Sales_Person'].map(contacted_counts).fillna(0).astype(int)
-    
-    # Calculate new leads
-    new_status = df[df['Status'] == 'New']
-    new_counts = new_status.groupby('Sales_Person').size()
-    team_metrics['New'] = team_metrics['Sales_Person'].map(new_counts).fillna(0).astype(int)
-    
-    # Calculate lost leads
-    lost_status = df[df['Status'] == 'Lost Lead']
-    lost_counts = lost_status.groupby('Sales_Person').size()
-    team_metrics['Lost'] = team_metrics['Sales_Person'].map(lost_counts).fillna(0).astype(int)
-    
-    # Calculate rates
-    team_metrics['Conversion_Rate'] = (team_metrics['Converted'] / team_metrics['Total_Leads'] * 100).round(1)
-    team_metrics['Active'] = team_metrics['Total_Leads'] - team_metrics['Converted'] - team_metrics['Lost']
+    # Calculate comprehensive metrics per salesperson from the status cube
+    team_metrics, status_by_person = team if team is not None else team_performance(cube)
     
     # Add a debug expander at the top
     with st.expander("🔍 Debug: Conversion Status Breakdown by Salesperson"):
-        status_by_person = df.groupby(['Sales_Person', 'Status']).size().reset_index(name='Count')
-        status_pivot = status_by_person.pivot(index='Sales_Person', columns='Status', values='Count').fillna(0).astype(int)
+        status_pivot = status_by_person.astype(int)
         # Sort by total leads
         status_pivot['Total'] = status_pivot.sum(axis=1)
         status_pivot = status_pivot.sort_values('Total', ascending=False)
@@ -893,73 +1078,79 @@ def create_team_performance_comprehensive(df):
         # Performance scatter - sorted by total leads for clarity
         team_sorted = team_metrics.sort_values('Total_Leads', ascending=False).head(15)
         
-        fig = go.Figure()
-        
-        fig.add_trace(go.Scatter(
-            x=team_sorted['Total_Leads'],
-            y=team_sorted['Conversion_Rate'],
-            mode='markers+text',
-            marker=dict(
-                size=team_sorted['Total_Leads'] * 1.5 + 10,
-                color=team_sorted['Conversion_Rate'],
-                colorscale='RdYlGn',
-                showscale=True,
-                colorbar=dict(title="Conv %"),
-                line=dict(width=2, color='white'),
-                cmin=0,
-                cmax=max(30, team_sorted['Conversion_Rate'].max())
-            ),
-            text=team_sorted['Sales_Person'].str.split().str[0],
-            textposition='middle center',
-            textfont=dict(size=9, color='white', family='Arial Black'),
-            customdata=team_sorted[['Sales_Person', 'Converted']],
-            hovertemplate='<b>%{customdata[0]}</b><br>Total Leads: %{x}<br>Conversion Rate: %{y:.1f}%<br>Converted: %{customdata[1]}<extra></extra>',
-            name='Performance'
-        ))
-        
-        fig.update_layout(
-            title='Team Performance Matrix (Top 15)',
-            xaxis_title="Total Leads Managed",
-            yaxis_title="Conversion Rate (%)",
-            height=500,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)'
-        )
+        def build_figure():
+            fig = go.Figure()
+            
+            fig.add_trace(go.Scatter(
+                x=team_sorted['Total_Leads'],
+                y=team_sorted['Conversion_Rate'],
+                mode='markers+text',
+                marker=dict(
+                    size=team_sorted['Total_Leads'] * 1.5 + 10,
+                    color=team_sorted['Conversion_Rate'],
+                    colorscale='RdYlGn',
+                    showscale=True,
+                    colorbar=dict(title="Conv %"),
+                    line=dict(width=2, color='white'),
+                    cmin=0,
+                    cmax=max(30, team_sorted['Conversion_Rate'].max())
+                ),
+                text=team_sorted['Sales_Person'].str.split().str[0],
+                textposition='middle center',
+                textfont=dict(size=9, color='white', family='Arial Black'),
+                customdata=team_sorted[['Sales_Person', 'Converted']],
+                hovertemplate='<b>%{customdata[0]}</b><br>Total Leads: %{x}<br>Conversion Rate: %{y:.1f}%<br>Converted: %{customdata[1]}<extra></extra>',
+                name='Performance'
+            ))
+            
+            fig.update_layout(
+                title='Team Performance Matrix (Top 15)',
+                xaxis_title="Total Leads Managed",
+                yaxis_title="Conversion Rate (%)",
+                height=500,
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)'
+            )
+            
+            return fig
         
-        st.plotly_chart(fig, use_container_width=True)
+        show_figure('team_matrix', [team_sorted], build_figure)
     
     with col2:
         # Lead distribution by salesperson - top 10
         top_10 = team_metrics.nlargest(10, 'Total_Leads').sort_values('Total_Leads', ascending=True)
         
-        fig = go.Figure()
-        
-        fig.add_trace(go.Bar(
-            y=top_10['Sales_Person'],
-            x=top_10['Total_Leads'],
-            orientation='h',
-            marker=dict(
-                color=top_10['Total_Leads'],
-                colorscale='Viridis',
-                showscale=False,
-                line=dict(color='rgba(255,255,255,0.3)', width=1)
-            ),
-            text=top_10['Total_Leads'].astype(int),
-            textposition='outside',
-            customdata=top_10[['Converted', 'Conversion_Rate']],
-            hovertemplate='<b>%{y}</b><br>Total: %{x}<br>Converted: %{customdata[0]}<br>Rate: %{customdata[1]:.1f}%<extra></extra>'
-        ))
-        
-        fig.update_layout(
-            title='Top 10 Sales Leaders by Volume',
-            xaxis_title="Total Leads",
-            yaxis_title="",
-            height=500,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)'
-        )
+        def build_figure():
+            fig = go.Figure()
+            
+            fig.add_trace(go.Bar(
+                y=top_10['Sales_Person'],
+                x=top_10['Total_Leads'],
+                orientation='h',
+                marker=dict(
+                    color=top_10['Total_Leads'],
+                    colorscale='Viridis',
+                    showscale=False,
+                    line=dict(color='rgba(255,255,255,0.3)', width=1)
+                ),
+                text=top_10['Total_Leads'].astype(int),
+                textposition='outside',
+                customdata=top_10[['Converted', 'Conversion_Rate']],
+                hovertemplate='<b>%{y}</b><br>Total: %{x}<br>Converted: %{customdata[0]}<br>Rate: %{customdata[1]:.1f}%<extra></extra>'
+            ))
+            
+            fig.update_layout(
+                title='Top 10 Sales Leaders by Volume',
+                xaxis_title="Total Leads",
+                yaxis_title="",
+                height=500,
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)'
+            )
+            
+            return fig
         
-        st.plotly_chart(fig, use_container_width=True)
+        show_figure('team_top_volume', [top_10], build_figure)
     
     # Detailed breakdown
     st.markdown("### 📊 Detailed Team Breakdown")
@@ -970,138 +1161,143 @@ def create_team_performance_comprehensive(df):
         # Stacked bar chart showing actual breakdown
         top_performers = team_metrics.nlargest(8, 'Total_Leads').sort_values('Total_Leads', ascending=True)
         
-        fig = go.Figure()
-        
-        fig.add_trace(go.Bar(
-            name='Converted',
-            y=top_performers['Sales_Person'],
-            x=top_performers['Converted'],
-            orientation='h',
-            marker_color='#10b981',
-            text=top_performers['Converted'].astype(int),
-            textposition='inside',
-            textfont=dict(color='white')
-        ))
-        
-        fig.add_trace(go.Bar(
-            name='Contacted',
-            y=top_performers['Sales_Person'],
-            x=top_performers['Contacted'],
-            orientation='h',
-            marker_color='#3b82f6',
-            text=top_performers['Contacted'].astype(int),
-            textposition='inside',
-            textfont=dict(color='white')
-        ))
-        
-        fig.add_trace(go.Bar(
-            name='Pre-Qualified',
-            y=top_performers['Sales_Person'],
-            x=top_performers['Pre_Qualified'],
-            orientation='h',
-            marker_color='#06b6d4',
-            text=top_performers['Pre_Qualified'].astype(int),
-            textposition='inside',
-            textfont=dict(color='white')
-        ))
-        
-        fig.add_trace(go.Bar(
-            name='New',
-            y=top_performers['Sales_Person'],
-            x=top_performers['New'],
-            orientation='h',
-            marker_color='#f59e0b',
-            text=top_performers['New'].astype(int),
-            textposition='inside',
-            textfont=dict(color='white')
-        ))
-        
-        fig.add_trace(go.Bar(
-            name='Lost',
-            y=top_performers['Sales_Person'],
-            x=top_performers['Lost'],
-            orientation='h',
-            marker_color='#ef4444',
-            text=top_performers['Lost'].astype(int),
-            textposition='inside',
-            textfont=dict(color='white')
-        ))
-        
-        fig.update_layout(
-            title='Lead Status Distribution (Top 8)',
-            barmode='stack',
-            height=400,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            xaxis_title="Number of Leads"
-        )
-        
-        st.plotly_chart(fig, use_container_width=True)
-    
-    with col2:
-        # Conversion rate comparison - only those with conversions
-        team_with_conversions = team_metrics[team_metrics['Converted'] > 0].copy()
-        
-        if len(team_with_conversions) > 0:
-            top_conv = team_with_conversions.nlargest(8, 'Conversion_Rate').sort_values('Conversion_Rate', ascending=True)
-            
+        def build_figure():
             fig = go.Figure()
             
-            colors = ['#10b981' if x >= 3 else '#f59e0b' if x >= 1 else '#ef4444' 
-                     for x in top_conv['Conversion_Rate']]
+            fig.add_trace(go.Bar(
+                name='Converted',
+                y=top_performers['Sales_Person'],
+                x=top_performers['Converted'],
+                orientation='h',
+                marker_color='#10b981',
+                text=top_performers['Converted'].astype(int),
+                textposition='inside',
+                textfont=dict(color='white')
+            ))
             
             fig.add_trace(go.Bar(
-                y=top_conv['Sales_Person'],
-                x=top_conv['Conversion_Rate'],
+                name='Contacted',
+                y=top_performers['Sales_Person'],
+                x=top_performers['Contacted'],
                 orientation='h',
-                marker_color=colors,
-                text=[f"{x:.1f}%" for x in top_conv['Conversion_Rate']],
-                textposition='outside',
-                customdata=top_conv['Converted'],
-                hovertemplate='<b>%{y}</b><br>Rate: %{x:.1f}%<br>Converted: %{customdata}<extra></extra>'
+                marker_color='#3b82f6',
+                text=top_performers['Contacted'].astype(int),
+                textposition='inside',
+                textfont=dict(color='white')
+            ))
+            
+            fig.add_trace(go.Bar(
+                name='Pre-Qualified',
+                y=top_performers['Sales_Person'],
+                x=top_performers['Pre_Qualified'],
+                orientation='h',
+                marker_color='#06b6d4',
+                text=top_performers['Pre_Qualified'].astype(int),
+                textposition='inside',
+                textfont=dict(color='white')
+            ))
+            
+            fig.add_trace(go.Bar(
+                name='New',
+                y=top_performers['Sales_Person'],
+                x=top_performers['New'],
+                orientation='h',
+                marker_color='#f59e0b',
+                text=top_performers['New'].astype(int),
+                textposition='inside',
+                textfont=dict(color='white')
+            ))
+            
+            fig.add_trace(go.Bar(
+                name='Lost',
+                y=top_performers['Sales_Person'],
+                x=top_performers['Lost'],
+                orientation='h',
+                marker_color='#ef4444',
+                text=top_performers['Lost'].astype(int),
+                textposition='inside',
+                textfont=dict(color='white')
             ))
             
             fig.update_layout(
-                title='Top Conversion Rates',
-                xaxis_title="Conversion Rate (%)",
+                title='Lead Status Distribution (Top 8)',
+                barmode='stack',
                 height=400,
                 plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)'
+                paper_bgcolor='rgba(0,0,0,0)',
+                xaxis_title="Number of Leads"
             )
             
-            st.plotly_chart(fig, use_container_width=True)
-        else:
-            st.info("No conversions recorded yet")
+            return fig
+        
+        show_figure('team_status_mix', [top_performers], build_figure)
     
-    with col3:
-        # Performance tiers based on conversion rate
-        if len(team_metrics) > 0:
-            # CORRECTED: Realistic B2B thresholds
-            high_performers = len(team_metrics[team_metrics['Conversion_Rate'] >= 3])
-            medium_performers = len(team_metrics[(team_metrics['Conversion_Rate'] >= 1) & 
-                                                 (team_metrics['Conversion_Rate'] < 3)])
-            low_performers = len(team_metrics[team_metrics['Conversion_Rate'] < 1])
+    with col2:
+        # Conversion rate comparison - only those with conversions
+        team_with_conversions = team_metrics[team_metrics['Converted'] > 0].copy()
+        
+        if len(team_with_conversions) > 0:
+            top_conv = team_with_conversions.nlargest(8, 'Conversion_Rate').sort_values('Conversion_Rate', ascending=True)
             
-            fig = go.Figure()
+            def build_figure():
+                fig = go.Figure()
+                
+                colors = ['#10b981' if x >= 3 else '#f59e0b' if x >= 1 else '#ef4444' 
+                         for x in top_conv['Conversion_Rate']]
+                
+                fig.add_trace(go.Bar(
+                    y=top_conv['Sales_Person'],
+                    x=top_conv['Conversion_Rate'],
+                    orientation='h',
+                    marker_color=colors,
+                    text=[f"{x:.1f}%" for x in top_conv['Conversion_Rate']],
+                    textposition='outside',
+                    customdata=top_conv['Converted'],
+                    hovertemplate='<b>%{y}</b><br>Rate: %{x:.1f}%<br>Converted: %{customdata}<extra></extra>'
+                ))
+                
+                fig.update_layout(
+                    title='Top Conversion Rates',
+                    xaxis_title="Conversion Rate (%)",
+                    height=400,
+                    plot_bgcolor='rgba(0,0,0,0)',
+                    paper_bgcolor='rgba(0,0,0,0)'
+                )
+                
+                return fig
             
-            fig.add_trace(go.Pie(
-                labels=['High (≥3%)', 'Medium (1-3%)', 'Low (<1%)'],
-                values=[high_performers, medium_performers, low_performers],
-                hole=0.5,
-                marker=dict(colors=['#10b981', '#f59e0b', '#ef4444']),
-                textposition='auto',
-                textinfo='label+value+percent',
-                hovertemplate='<b>%{label}</b><br>Count: %{value}<br>Percentage: %{percent}<extra></extra>'
-            ))
+            show_figure('team_conversion_rates', [top_conv], build_figure)
+        else:
+            st.info("No conversions recorded yet")
+    
+    with col3:
+        # Performance tiers based on conversion rate
+        if len(team_metrics) > 0:
+            high_performers, medium_performers, low_performers = performance_tiers(team_metrics)
             
-            fig.update_layout(
-                title='Performance Tier Distribution',
-                height=400,
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)'
-            )
+            def build_figure():
+                fig = go.Figure()
+                
+                fig.add_trace(go.Pie(
+                    labels=['High (≥3%)', 'Medium (1-3%)', 'Low (<1%)'],
+                    values=[high_performers, medium_performers, low_performers],
+                    hole=0.5,
+                    marker=dict(colors=['#10b981', '#f59e0b', '#ef4444']),
+                    textposition='auto',
+                    textinfo='label+value+percent',
+                    hovertemplate='<b>%{label}</b><br>Count: %{value}<br>Percentage: %{percent}<extra></extra>'
+                ))
+                
+                fig.update_layout(
+                    title='Performance Tier Distribution',
+                    height=400,
+                    plot_bgcolor='rgba(0,0,0,0)',
+                    paper_bgcolor='rgba(0,0,0,0)'
+                )
+                
+                return fig
             
-            st.plotly_chart(fig, use_container_width=True)
+            show_figure('team_tiers', [high_performers, medium_performers, low_performers], build_figure)
         else:
             st.info("No performance data available")
     
@@ -1145,55 +1341,49 @@ def create_team_performance_comprehensive(df):
     
     col1, col2 = st.columns(2)
 
-def create_advanced_funnel(df):
+@traced
+def create_advanced_funnel(cube):
     """Multi-dimensional conversion funnel"""
     st.subheader("🔄 Advanced Conversion Funnel Analysis")
     
     col1, col2 = st.columns([2, 1])
     
     with col1:
-        # Define comprehensive funnel
-        funnel_stages = {
-            'All Leads': len(df),
-            'New': len(df[df['Status'] == 'New']),
-            'Attempted Contact': len(df[df['Status'] == 'Attempted to Contact']),
-            'Contacted': len(df[df['Status'] == 'Contacted']),
-            'Pre-Qualified': len(df[df['Status'] == 'Pre-Qualified']),
-            'Converted': len(df[df['Status'] == 'Converted'])
-        }
-        
-        # Remove empty stages
-        funnel_stages = {k: v for k, v in funnel_stages.items() if v > 0}
+        # Comprehensive funnel, empty stages removed
+        funnel_stages = funnel_counts(cube)
         
         if len(funnel_stages) >= 2:
             stages = list(funnel_stages.keys())
             values = list(funnel_stages.values())
             
-            fig = go.Figure()
-            
-            fig.add_trace(go.Funnel(
-                y=stages,
-                x=values,
-                textposition="inside",
-                textinfo="value+percent initial",
-                marker=dict(
-                    color=['#8b5cf6', '#6366f1', '#3b82f6', '#06b6d4', '#10b981', '#059669'],
-                    line=dict(width=3, color='white')
-                ),
-                connector=dict(
-                    line=dict(color='#64748b', width=4, dash='dot')
-                ),
-                hovertemplate='<b>%{y}</b><br>Leads: %{x}<br>%{percentInitial}<extra></extra>'
-            ))
-            
-            fig.update_layout(
-                title='Complete Lead Conversion Funnel',
-                height=500,
-                paper_bgcolor='rgba(0,0,0,0)',
-                plot_bgcolor='rgba(0,0,0,0)'
-            )
+            def build_figure():
+                fig = go.Figure()
+                
+                fig.add_trace(go.Funnel(
+                    y=stages,
+                    x=values,
+                    textposition="inside",
+                    textinfo="value+percent initial",
+                    marker=dict(
+                        color=['#8b5cf6', '#6366f1', '#3b82f6', '#06b6d4', '#10b981', '#059669'],
+                        line=dict(width=3, color='white')
+                    ),
+                    connector=dict(
+                        line=dict(color='#64748b', width=4, dash='dot')
+                    ),
+                    hovertemplate='<b>%{y}</b><br>Leads: %{x}<br>%{percentInitial}<extra></extra>'
+                ))
+                
+                fig.update_layout(
+                    title='Complete Lead Conversion Funnel',
+                    height=500,
+                    paper_bgcolor='rgba(0,0,0,0)',
+                    plot_bgcolor='rgba(0,0,0,0)'
+                )
+                
+                return fig
             
-            st.plotly_chart(fig, use_container_width=True)
+            show_figure('funnel', [stages, values], build_figure)
     
     with col2:
         st.markdown("### 📉 Drop-off Analysis")
@@ -1213,56 +1403,50 @@ def create_advanced_funnel(df):
                     f"-{drop_off_pct:.1f}%",
                     delta_color="inverse"
                 )
-                st.progress(retention / 100)
+                # A later stage can outnumber an earlier one; the bar only takes 0-1
+                st.progress(min(max(retention / 100, 0.0), 1.0))
                 st.caption(f"Retention: {retention:.1f}%")
                 st.markdown("---")
     
     # Status breakdown over time
     st.markdown("### 📈 Status Evolution Timeline")
     
-    status_timeline = df.groupby(['Month', 'Status']).size().reset_index(name='Count')
-    status_timeline = status_timeline.merge(
-        df[['Month', 'Month_Date']].drop_duplicates(),
-        on='Month'
-    ).sort_values('Month_Date')
-    
-    fig = px.area(
-        status_timeline,
-        x='Month',
-        y='Count',
-        color='Status',
-        title='Lead Status Distribution Over Time',
-        color_discrete_sequence=px.colors.qualitative.Set3
-    )
+    status_timeline = status_timeline_counts(cube)
     
-    fig.update_layout(
-        height=400,
-        hovermode='x unified',
-        plot_bgcolor='rgba(0,0,0,0)',
-        paper_bgcolor='rgba(0,0,0,0)'
-    )
+    def build_figure():
+        fig = px.area(
+            status_timeline,
+            x='Month',
+            y='Count',
+            color='Status',
+            title='Lead Status Distribution Over Time',
+            color_discrete_sequence=px.colors.qualitative.Set3
+        )
+        
+        fig.update_layout(
+            height=400,
+            hovermode='x unified',
+            plot_bgcolor='rgba(0,0,0,0)',
+            paper_bgcolor='rgba(0,0,0,0)'
+        )
+        
+        return fig
     
-    st.plotly_chart(fig, use_container_width=True)
+    show_figure('status_timeline', [status_timeline], build_figure)
 
-def create_source_intelligence(df):
+@traced
+def create_source_intelligence(cube, source_data=None):
     """Advanced lead source intelligence"""
     st.subheader("📞 Lead Source Intelligence & ROI Analysis")
     
-    df_sources = df[df['Source'].str.len() > 0].copy()
+    if source_data is None:
+        source_data = source_table(cube)
     
-    if len(df_sources) == 0:
+    if source_data is None:
         st.info("No source data available")
         return
     
-    source_data = df_sources.groupby('Source').agg({
-        'Lead_Name': 'count',
-        'Status': lambda x: (x == 'Converted').sum()
-    }).reset_index()
-    source_data.columns = ['Source', 'Total_Leads', 'Converted']
-    source_data['Conversion_Rate'] = (source_data['Converted'] / source_data['Total_Leads'] * 100).round(1)
-    source_data['Lost'] = df_sources.groupby('Source')['Status'].apply(lambda x: (x == 'Lost Lead').sum()).values
-    source_data['Loss_Rate'] = (source_data['Lost'] / source_data['Total_Leads'] * 100).round(1)
-    source_data = source_data.sort_values('Total_Leads', ascending=False)
+    source_data = source_data.round({'Conversion_Rate': 1, 'Loss_Rate': 1})
     
     col1, col2 = st.columns([2, 1])
     
@@ -1270,34 +1454,37 @@ def create_source_intelligence(df):
         # Top sources with conversion
         top_sources = source_data.head(15).sort_values('Total_Leads', ascending=True)
         
-        fig = go.Figure()
-        
-        fig.add_trace(go.Bar(
-            y=top_sources['Source'],
-            x=top_sources['Total_Leads'],
-            orientation='h',
-            name='Total Leads',
-            marker=dict(
-                color=top_sources['Conversion_Rate'],
-                colorscale='RdYlGn',
-                showscale=True,
-                colorbar=dict(title="Conv %"),
-                line=dict(color='white', width=1)
-            ),
-            text=top_sources['Total_Leads'].astype(int),
-            textposition='outside',
-            hovertemplate='<b>%{y}</b><br>Leads: %{x}<br>Conv: %{marker.color:.1f}%<extra></extra>'
-        ))
-        
-        fig.update_layout(
-            title='Top 15 Lead Sources (Color = Conversion Rate)',
-            xaxis_title="Number of Leads",
-            height=600,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)'
-        )
+        def build_figure():
+            fig = go.Figure()
+            
+            fig.add_trace(go.Bar(
+                y=top_sources['Source'],
+                x=top_sources['Total_Leads'],
+                orientation='h',
+                name='Total Leads',
+                marker=dict(
+                    color=top_sources['Conversion_Rate'],
+                    colorscale='RdYlGn',
+                    showscale=True,
+                    colorbar=dict(title="Conv %"),
+                    line=dict(color='white', width=1)
+                ),
+                text=top_sources['Total_Leads'].astype(int),
+                textposition='outside',
+                hovertemplate='<b>%{y}</b><br>Leads: %{x}<br>Conv: %{marker.color:.1f}%<extra></extra>'
+            ))
+            
+            fig.update_layout(
+                title='Top 15 Lead Sources (Color = Conversion Rate)',
+                xaxis_title="Number of Leads",
+                height=600,
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)'
+            )
+            
+            return fig
         
-        st.plotly_chart(fig, use_container_width=True)
+        show_figure('source_top', [top_sources], build_figure)
     
     with col2:
         st.markdown("### 🏆 Source Performance")
@@ -1330,35 +1517,41 @@ def create_source_intelligence(df):
     
     with col1:
         # Volume vs conversion scatter
-        fig = go.Figure()
-        
-        fig.add_trace(go.Scatter(
-            x=source_data['Total_Leads'],
-            y=source_data['Conversion_Rate'],
-            mode='markers',
-            marker=dict(
-                size=source_data['Total_Leads'],
-                color=source_data['Conversion_Rate'],
-                colorscale='Viridis',
-                showscale=True,
-                sizemode='area',
-                sizeref=2.*max(source_data['Total_Leads'])/(40.**2),
-                line=dict(width=1, color='white')
-            ),
-            text=source_data['Source'],
-            hovertemplate='<b>%{text}</b><br>Leads: %{x}<br>Conv: %{y:.1f}%<extra></extra>'
-        ))
+        scatter_data = bucket_long_tail(source_data[['Source', 'Total_Leads', 'Converted']], 'Source', noun='sources')
+        scatter_data = scatter_data.assign(Conversion_Rate=(scatter_data['Converted'] / scatter_data['Total_Leads'] * 100).round(1))
         
-        fig.update_layout(
-            title='Volume vs Quality',
-            xaxis_title="Total Leads",
-            yaxis_title="Conversion Rate (%)",
-            height=400,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)'
-        )
+        def build_figure():
+            fig = go.Figure()
+            
+            fig.add_trace(scatter_trace(len(scatter_data))(
+                x=scatter_data['Total_Leads'],
+                y=scatter_data['Conversion_Rate'],
+                mode='markers',
+                marker=dict(
+                    size=scatter_data['Total_Leads'],
+                    color=scatter_data['Conversion_Rate'],
+                    colorscale='Viridis',
+                    showscale=True,
+                    sizemode='area',
+                    sizeref=2.*max(scatter_data['Total_Leads'])/(40.**2),
+                    line=dict(width=1, color='white')
+                ),
+                text=scatter_data['Source'],
+                hovertemplate='<b>%{text}</b><br>Leads: %{x}<br>Conv: %{y:.1f}%<extra></extra>'
+            ))
+            
+            fig.update_layout(
+                title='Volume vs Quality',
+                xaxis_title="Total Leads",
+                yaxis_title="Conversion Rate (%)",
+                height=400,
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)'
+            )
+            
+            return fig
         
-        st.plotly_chart(fig, use_container_width=True)
+        show_figure('source_volume_quality', [scatter_data], build_figure)
     
     with col2:
         # Top sources pie
@@ -1369,113 +1562,113 @@ def create_source_intelligence(df):
         })
         pie_data = pd.concat([top_5[['Source', 'Total_Leads']], others])
         
-        fig = go.Figure()
-        
-        fig.add_trace(go.Pie(
-            labels=pie_data['Source'],
-            values=pie_data['Total_Leads'],
-            hole=0.4,
-            marker=dict(
-                colors=px.colors.qualitative.Set2,
-                line=dict(color='white', width=2)
-            ),
-            textposition='auto',
-            textinfo='label+percent'
-        ))
-        
-        fig.update_layout(
-            title='Source Distribution',
-            height=400,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)'
-        )
+        def build_figure():
+            fig = go.Figure()
+            
+            fig.add_trace(go.Pie(
+                labels=pie_data['Source'],
+                values=pie_data['Total_Leads'],
+                hole=0.4,
+                marker=dict(
+                    colors=px.colors.qualitative.Set2,
+                    line=dict(color='white', width=2)
+                ),
+                textposition='auto',
+                textinfo='label+percent'
+            ))
+            
+            fig.update_layout(
+                title='Source Distribution',
+                height=400,
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)'
+            )
+            
+            return fig
         
-        st.plotly_chart(fig, use_container_width=True)
+        show_figure('source_share', [pie_data], build_figure)
     
     with col3:
         # Loss rate comparison
         top_loss = source_data.nlargest(8, 'Total_Leads')
         
-        fig = go.Figure()
-        
-        colors = ['#ef4444' if x > 20 else '#f59e0b' if x > 10 else '#10b981' 
-                 for x in top_loss['Loss_Rate']]
-        
-        fig.add_trace(go.Bar(
-            y=top_loss['Source'],
-            x=top_loss['Loss_Rate'],
-            orientation='h',
-            marker_color=colors,
-            text=[f"{x:.1f}%" for x in top_loss['Loss_Rate']],
-            textposition='outside'
-        ))
-        
-        fig.update_layout(
-            title='Loss Rate by Source',
-            xaxis_title="Loss Rate (%)",
-            height=400,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)'
-        )
+        def build_figure():
+            fig = go.Figure()
+            
+            colors = ['#ef4444' if x > 20 else '#f59e0b' if x > 10 else '#10b981' 
+                     for x in top_loss['Loss_Rate']]
+            
+            fig.add_trace(go.Bar(
+                y=top_loss['Source'],
+                x=top_loss['Loss_Rate'],
+                orientation='h',
+                marker_color=colors,
+                text=[f"{x:.1f}%" for x in top_loss['Loss_Rate']],
+                textposition='outside'
+            ))
+            
+            fig.update_layout(
+                title='Loss Rate by Source',
+                xaxis_title="Loss Rate (%)",
+                height=400,
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)'
+            )
+            
+            return fig
         
-        st.plotly_chart(fig, use_container_width=True)
+        show_figure('source_loss_rate', [top_loss], build_figure)
 
-def create_company_analysis(df):
+@st.cache_data(max_entries=64, show_spinner=False)
+def cached_company_table(dataset_key, filters, _view):
+    """build_company_table memoized per dataset and filter state (`_view` is not hashed)"""
+    return build_company_table(_view.frame(COMPANY_COLUMNS))
+
+@traced
+def create_company_analysis(company_data):
     """Deep company intelligence"""
     st.subheader("🏢 Company Intelligence & Account Analysis")
     
-    df_companies = df[df['Company'].str.len() > 0].copy()
-    
-    if len(df_companies) == 0:
+    if company_data is None:
         st.info("No company data available")
         return
     
-    company_data = df_companies.groupby('Company').agg({
-        'Lead_Name': 'count',
-        'Status': lambda x: list(x.unique()),
-        'Sales_Person': lambda x: list(x.unique()),
-        'Month_Date': ['min', 'max']
-    }).reset_index()
-    
-    company_data.columns = ['Company', 'Total_Leads', 'Statuses', 'Sales_Team', 'First_Contact', 'Last_Contact']
-    company_data['Days_Active'] = (company_data['Last_Contact'] - company_data['First_Contact']).dt.days
-    company_data['Status_Count'] = company_data['Statuses'].apply(len)
-    company_data['Team_Size'] = company_data['Sales_Team'].apply(len)
-    company_data = company_data.sort_values('Total_Leads', ascending=False)
-    
     col1, col2 = st.columns([3, 2])
     
     with col1:
         # Top companies
         top_20 = company_data.head(20).sort_values('Total_Leads', ascending=True)
         
-        fig = go.Figure()
-        
-        fig.add_trace(go.Bar(
-            y=top_20['Company'],
-            x=top_20['Total_Leads'],
-            orientation='h',
-            marker=dict(
-                color=top_20['Days_Active'],
-                colorscale='Plasma',
-                showscale=True,
-                colorbar=dict(title="Days Active"),
-                line=dict(color='white', width=1)
-            ),
-            text=top_20['Total_Leads'].astype(int),
-            textposition='outside',
-            hovertemplate='<b>%{y}</b><br>Leads: %{x}<br>Active: %{marker.color} days<extra></extra>'
-        ))
-        
-        fig.update_layout(
-            title='Top 20 Companies by Lead Volume',
-            xaxis_title="Number of Leads",
-            height=700,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)'
-        )
+        def build_figure():
+            fig = go.Figure()
+            
+            fig.add_trace(go.Bar(
+                y=top_20['Company'],
+                x=top_20['Total_Leads'],
+                orientation='h',
+                marker=dict(
+                    color=top_20['Days_Active'],
+                    colorscale='Plasma',
+                    showscale=True,
+                    colorbar=dict(title="Days Active"),
+                    line=dict(color='white', width=1)
+                ),
+                text=top_20['Total_Leads'].astype(int),
+                textposition='outside',
+                hovertemplate='<b>%{y}</b><br>Leads: %{x}<br>Active: %{marker.color} days<extra></extra>'
+            ))
+            
+            fig.update_layout(
+                title='Top 20 Companies by Lead Volume',
+                xaxis_title="Number of Leads",
+                height=700,
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)'
+            )
+            
+            return fig
         
-        st.plotly_chart(fig, use_container_width=True)
+        show_figure('company_top', [top_20[['Company', 'Total_Leads', 'Days_Active']]], build_figure)
     
     with col2:
         st.markdown("### 🎯 Key Accounts")
@@ -1503,109 +1696,102 @@ def create_company_analysis(df):
     
     with col1:
         # Engagement duration
-        fig = go.Figure()
-        
-        max_days = company_data['Days_Active'].max()
-        
-        # Create dynamic bins based on max days
-        if max_days <= 30:
-            bins = [0, 10, 20, 30, max_days + 1]
-            labels = ['0-10', '11-20', '21-30', '30+']
-        elif max_days <= 90:
-            bins = [0, 30, 60, 90, max_days + 1]
-            labels = ['0-30', '31-60', '61-90', '90+']
-        elif max_days <= 180:
-            bins = [0, 30, 60, 90, 180, max_days + 1]
-            labels = ['0-30', '31-60', '61-90', '91-180', '180+']
-        elif max_days <= 365:
-            bins = [0, 30, 60, 90, 180, 365, max_days + 1]
-            labels = ['0-30', '31-60', '61-90', '91-180', '181-365', '365+']
-        else:
-            bins = [0, 30, 60, 90, 180, 365, max_days + 1]
-            labels = ['0-30', '31-60', '61-90', '91-180', '181-365', '365+']
-        
-        # Remove duplicate bins
-        bins = sorted(list(set(bins)))
-        # Adjust labels to match bins
-        if len(bins) != len(labels) + 1:
-            # Create simple labels based on actual bins
-            labels = [f"{int(bins[i])}-{int(bins[i+1]-1)}" for i in range(len(bins)-1)]
-        
-        company_data['Duration_Bin'] = pd.cut(company_data['Days_Active'], bins=bins, labels=labels[:len(bins)-1], include_lowest=True)
-        duration_counts = company_data['Duration_Bin'].value_counts().sort_index()
-        
-        fig.add_trace(go.Bar(
-            x=duration_counts.index.astype(str),
-            y=duration_counts.values,
-            marker=dict(
-                color=duration_counts.values,
-                colorscale='Greens',
-                showscale=False
-            ),
-            text=duration_counts.values,
-            textposition='outside'
-        ))
-        
-        fig.update_layout(
-            title='Engagement Duration (Days)',
-            xaxis_title="Duration Range",
-            yaxis_title="Companies",
-            height=400,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)'
-        )
+        def build_figure():
+            fig = go.Figure()
+            
+            duration_counts = engagement_duration_counts(company_data['Days_Active'])
+            
+            fig.add_trace(go.Bar(
+                x=duration_counts.index.astype(str),
+                y=duration_counts.values,
+                marker=dict(
+                    color=duration_counts.values,
+                    colorscale='Greens',
+                    showscale=False
+                ),
+                text=duration_counts.values,
+                textposition='outside'
+            ))
+            
+            fig.update_layout(
+                title='Engagement Duration (Days)',
+                xaxis_title="Duration Range",
+                yaxis_title="Companies",
+                height=400,
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)'
+            )
+            
+            return fig
         
-        st.plotly_chart(fig, use_container_width=True)
+        show_figure('company_duration', [company_data['Days_Active']], build_figure)
     
     with col2:
         # Team coverage
-        fig = go.Figure()
-        
-        fig.add_trace(go.Histogram(
-            x=company_data['Team_Size'],
-            nbinsx=10,
-            marker=dict(
-                color='#3b82f6',
-                line=dict(color='white', width=1)
+        def build_figure():
+            fig = go.Figure()
+            
+            # Binned here rather than in the browser, one bar per bin instead of one value per company
+            centers, counts, width, labels = histogram_bars(company_data['Team_Size'], 10)
+            fig.add_trace(go.Bar(
+                x=centers,
+                y=counts,
+                width=width,
+                customdata=labels,
+                marker=dict(
+                    color='#3b82f6',
+                    line=dict(color='white', width=1)
+                ),
+                hovertemplate='%{customdata}: %{y}<extra></extra>'
+            ))
+            
+            fig.update_layout(
+                title='Sales Team Coverage',
+                xaxis_title="Team Members per Company",
+                yaxis_title="Number of Companies",
+                height=400,
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)'
             )
-        ))
-        
-        fig.update_layout(
-            title='Sales Team Coverage',
-            xaxis_title="Team Members per Company",
-            yaxis_title="Number of Companies",
-            height=400,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)'
-        )
+            
+            return fig
         
-        st.plotly_chart(fig, use_container_width=True)
+        show_figure('company_team_coverage', [company_data['Team_Size']], build_figure)
     
     with col3:
         # Lead concentration
-        fig = go.Figure()
-        
-        fig.add_trace(go.Histogram(
-            x=company_data['Total_Leads'],
-            nbinsx=15,
-            marker=dict(
-                color='#8b5cf6',
-                line=dict(color='white', width=1)
+        def build_figure():
+            fig = go.Figure()
+            
+            # Pre-binned like team coverage; leads per company spread wider, so more bins
+            centers, counts, width, labels = histogram_bars(company_data['Total_Leads'], 15)
+            fig.add_trace(go.Bar(
+                x=centers,
+                y=counts,
+                width=width,
+                customdata=labels,
+                marker=dict(
+                    color='#8b5cf6',
+                    line=dict(color='white', width=1)
+                ),
+                hovertemplate='%{customdata}: %{y}<extra></extra>'
+            ))
+            
+            fig.update_layout(
+                title='Lead Concentration',
+                xaxis_title="Leads per Company",
+                yaxis_title="Frequency",
+                height=400,
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)'
             )
-        ))
-        
-        fig.update_layout(
-            title='Lead Concentration',
-            xaxis_title="Leads per Company",
-            yaxis_title="Frequency",
-            height=400,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)'
-        )
+            
+            return fig
         
-        st.plotly_chart(fig, use_container_width=True)
+        show_figure('company_concentration', [company_data['Total_Leads']], build_figure)
 
-def create_heatmap_analysis(df):
+@traced
+def create_heatmap_analysis(cube):
     """Advanced heatmap analysis"""
     st.subheader("🔥 Lead Activity Heatmap & Patterns")
     
@@ -1613,78 +1799,72 @@ def create_heatmap_analysis(df):
     
     with col1:
         # Status x Month heatmap
-        heatmap_data = df.groupby(['Month', 'Status']).size().reset_index(name='Count')
-        
-        if not heatmap_data.empty:
-            heatmap_pivot = heatmap_data.pivot(index='Status', columns='Month', values='Count').fillna(0)
-            
-            if 'Month_Date' in df.columns:
-                month_order = df.groupby('Month')['Month_Date'].first().sort_values().index
-                month_order = [m for m in month_order if m in heatmap_pivot.columns]
-                if month_order:
-                    heatmap_pivot = heatmap_pivot[month_order]
-            
-            fig = go.Figure(data=go.Heatmap(
-                z=heatmap_pivot.values,
-                x=heatmap_pivot.columns,
-                y=heatmap_pivot.index,
-                colorscale='YlOrRd',
-                text=heatmap_pivot.values.astype(int),
-                texttemplate='%{text}',
-                textfont={"size": 11, "color": "white"},
-                hovertemplate='<b>%{y}</b><br>%{x}<br>Leads: %{z}<extra></extra>',
-                colorbar=dict(title="Leads")
-            ))
-            
-            fig.update_layout(
-                title='Status × Month Heatmap',
-                height=450,
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)'
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
-        else:
-            st.info("No data available for Status × Month heatmap")
-    
-    with col2:
-        # Salesperson x Status heatmap
-        sp_status = df.groupby(['Sales_Person', 'Status']).size().reset_index(name='Count')
+        heatmap_pivot = status_month_pivot(cube)
         
-        if not sp_status.empty:
-            top_sp = df.groupby('Sales_Person').size().nlargest(10).index
-            sp_status_filtered = sp_status[sp_status['Sales_Person'].isin(top_sp)]
-            
-            if len(sp_status_filtered) > 0:
-                sp_pivot = sp_status_filtered.pivot(index='Sales_Person', columns='Status', values='Count').fillna(0)
-                
+        if not heatmap_pivot.empty:
+            def build_figure():
                 fig = go.Figure(data=go.Heatmap(
-                    z=sp_pivot.values,
-                    x=sp_pivot.columns,
-                    y=sp_pivot.index,
-                    colorscale='Blues',
-                    text=sp_pivot.values.astype(int),
+                    z=heatmap_pivot.values,
+                    x=heatmap_pivot.columns,
+                    y=heatmap_pivot.index,
+                    colorscale='YlOrRd',
+                    text=heatmap_pivot.values.astype(int),
                     texttemplate='%{text}',
-                    textfont={"size": 10, "color": "white"},
-                    hovertemplate='<b>%{y}</b><br>%{x}<br>Count: %{z}<extra></extra>',
-                    colorbar=dict(title="Count")
+                    textfont={"size": 11, "color": "white"},
+                    hovertemplate='<b>%{y}</b><br>%{x}<br>Leads: %{z}<extra></extra>',
+                    colorbar=dict(title="Leads")
                 ))
                 
                 fig.update_layout(
-                    title='Top 10 Salespeople × Status',
+                    title='Status × Month Heatmap',
                     height=450,
                     plot_bgcolor='rgba(0,0,0,0)',
                     paper_bgcolor='rgba(0,0,0,0)'
                 )
                 
-                st.plotly_chart(fig, use_container_width=True)
+                return fig
+            
+            show_figure('heatmap_status_month', [heatmap_pivot], build_figure)
+        else:
+            st.info("No data available for Status × Month heatmap")
+    
+    with col2:
+        # Salesperson x Status heatmap
+        sp_pivot = top_salesperson_status_pivot(cube, 10)
+        
+        if sp_pivot is not None:
+            if len(sp_pivot) > 0:
+                
+                def build_figure():
+                    fig = go.Figure(data=go.Heatmap(
+                        z=sp_pivot.values,
+                        x=sp_pivot.columns,
+                        y=sp_pivot.index,
+                        colorscale='Blues',
+                        text=sp_pivot.values.astype(int),
+                        texttemplate='%{text}',
+                        textfont={"size": 10, "color": "white"},
+                        hovertemplate='<b>%{y}</b><br>%{x}<br>Count: %{z}<extra></extra>',
+                        colorbar=dict(title="Count")
+                    ))
+                    
+                    fig.update_layout(
+                        title='Top 10 Salespeople × Status',
+                        height=450,
+                        plot_bgcolor='rgba(0,0,0,0)',
+                        paper_bgcolor='rgba(0,0,0,0)'
+                    )
+                    
+                    return fig
+                
+                show_figure('heatmap_team_status', [sp_pivot], build_figure)
             else:
                 st.info("Not enough data for Salesperson × Status heatmap")
         else:
             st.info("No data available for Salesperson × Status heatmap")
     
     # Insights
-    if not heatmap_data.empty and 'heatmap_pivot' in locals() and len(heatmap_pivot) > 0:
+    if len(heatmap_pivot) > 0:
         max_cell = heatmap_pivot.max().max()
         if max_cell > 0:
             max_location = heatmap_pivot.stack().idxmax()
@@ -1698,98 +1878,81 @@ def create_heatmap_analysis(df):
             </div>
             """, unsafe_allow_html=True)
 
-def create_forecast_analysis(df):
+@traced
+def create_forecast_analysis(cube, projection=None):
     """Time series forecasting"""
     st.subheader("🔮 Predictive Analytics & Forecasting")
     
-    monthly_data = df.groupby('Month_Date').size().reset_index(name='Leads')
-    monthly_data = monthly_data.sort_values('Month_Date')
+    if projection is None:
+        projection = lead_forecast(cube, horizon=6)
     
-    if len(monthly_data) < 3:
+    if projection is None:
         st.warning("Need at least 3 months of data for forecasting")
         return
     
-    X = np.arange(len(monthly_data))
-    y = monthly_data['Leads'].values
-    
-    n = len(X)
-    x_mean = X.mean()
-    y_mean = y.mean()
-    
-    numerator = np.sum((X - x_mean) * (y - y_mean))
-    denominator = np.sum((X - x_mean) ** 2)
-    slope = numerator / denominator if denominator != 0 else 0
-    intercept = y_mean - slope * x_mean
-    
-    trend_line = slope * X + intercept
-    
-    # Forecast next 6 months
-    future_X = np.arange(len(monthly_data), len(monthly_data) + 6)
-    forecast = slope * future_X + intercept
-    forecast = np.maximum(forecast, 0)
-    
-    # Calculate confidence intervals (simple method)
-    residuals = y - trend_line
-    std_error = np.std(residuals)
-    forecast_upper = forecast + 1.96 * std_error
-    forecast_lower = np.maximum(forecast - 1.96 * std_error, 0)
-    
-    last_date = monthly_data['Month_Date'].max()
-    future_dates = pd.date_range(start=last_date + pd.DateOffset(months=1), periods=6, freq='MS')
-    
-    fig = go.Figure()
-    
-    # Historical data
-    fig.add_trace(go.Scatter(
-        x=monthly_data['Month_Date'],
-        y=monthly_data['Leads'],
-        mode='lines+markers',
-        name='Actual',
-        line=dict(color='#3b82f6', width=3),
-        marker=dict(size=10, symbol='circle')
-    ))
-    
-    # Trend line
-    fig.add_trace(go.Scatter(
-        x=monthly_data['Month_Date'],
-        y=trend_line,
-        mode='lines',
-        name='Trend',
-        line=dict(color='#ef4444', width=2, dash='dash')
-    ))
-    
-    # Forecast
-    fig.add_trace(go.Scatter(
-        x=future_dates,
-        y=forecast,
-        mode='lines+markers',
-        name='Forecast',
-        line=dict(color='#10b981', width=3, dash='dot'),
-        marker=dict(size=10, symbol='diamond')
-    ))
-    
-    # Confidence interval
-    fig.add_trace(go.Scatter(
-        x=list(future_dates) + list(future_dates[::-1]),
-        y=list(forecast_upper) + list(forecast_lower[::-1]),
-        fill='toself',
-        fillcolor='rgba(16, 185, 129, 0.2)',
-        line=dict(color='rgba(255,255,255,0)'),
-        name='95% Confidence',
-        showlegend=True
-    ))
-    
-    fig.update_layout(
-        title='6-Month Lead Generation Forecast',
-        xaxis_title="Date",
-        yaxis_title="Number of Leads",
-        height=500,
-        hovermode='x unified',
-        plot_bgcolor='rgba(0,0,0,0)',
-        paper_bgcolor='rgba(0,0,0,0)'
+    monthly_data, trend_line, slope, y_mean = (
+        projection.history, projection.trend_line, projection.slope, projection.mean_leads
+    )
+    future_dates, forecast, forecast_upper, forecast_lower = (
+        projection.future_dates, projection.forecast, projection.upper, projection.lower
     )
     
-    st.plotly_chart(fig, use_container_width=True)
+    def build_figure():
+        fig = go.Figure()
+        
+        # Historical data
+        fig.add_trace(go.Scatter(
+            x=monthly_data['Month_Date'],
+            y=monthly_data['Leads'],
+            mode='lines+markers',
+            name='Actual',
+            line=dict(color='#3b82f6', width=3),
+            marker=dict(size=10, symbol='circle')
+        ))
+        
+        # Trend line
+        fig.add_trace(go.Scatter(
+            x=monthly_data['Month_Date'],
+            y=trend_line,
+            mode='lines',
+            name='Trend',
+            line=dict(color='#ef4444', width=2, dash='dash')
+        ))
+        
+        # Forecast
+        fig.add_trace(go.Scatter(
+            x=future_dates,
+            y=forecast,
+            mode='lines+markers',
+            name='Forecast',
+            line=dict(color='#10b981', width=3, dash='dot'),
+            marker=dict(size=10, symbol='diamond')
+        ))
+        
+        # Confidence interval
+        fig.add_trace(go.Scatter(
+            x=list(future_dates) + list(future_dates[::-1]),
+            y=list(forecast_upper) + list(forecast_lower[::-1]),
+            fill='toself',
+            fillcolor='rgba(16, 185, 129, 0.2)',
+            line=dict(color='rgba(255,255,255,0)'),
+            name='95% Confidence',
+            showlegend=True
+        ))
+        
+        fig.update_layout(
+            title='6-Month Lead Generation Forecast',
+            xaxis_title="Date",
+            yaxis_title="Number of Leads",
+            height=500,
+            hovermode='x unified',
+            plot_bgcolor='rgba(0,0,0,0)',
+            paper_bgcolor='rgba(0,0,0,0)'
+        )
+        
+        return fig
+    
+    show_figure('forecast', [monthly_data, trend_line, future_dates, forecast, forecast_upper, forecast_lower], build_figure)
     
     # Forecast summary
     col1, col2, col3 = st.columns(3)
@@ -1827,14 +1990,16 @@ def create_forecast_analysis(df):
         </div>
         """, unsafe_allow_html=True)
 
+@traced
 def create_advanced_filters(df):
     """Enhanced filtering system"""
     st.sidebar.header("🎛️ Advanced Filters")
+    index = filter_index(df.attrs['dataset_key'], df)
     
     # Date range
     st.sidebar.subheader("📅 Date Range")
-    min_date = df['Month_Date'].min()
-    max_date = df['Month_Date'].max()
+    min_date = min(index['Month_Date'])
+    max_date = max(index['Month_Date'])
     
     date_range = st.sidebar.date_input(
         "Select Date Range",
@@ -1845,7 +2010,7 @@ def create_advanced_filters(df):
     
     # Status filter
     st.sidebar.subheader("🔍 Filter Criteria")
-    all_statuses = ['All'] + sorted(df['Status'].unique().tolist())
+    all_statuses = ['All'] + sorted(index['Status'])
     selected_statuses = st.sidebar.multiselect(
         "Status",
         all_statuses,
@@ -1853,7 +2018,7 @@ def create_advanced_filters(df):
     )
     
     # Salesperson filter
-    all_sales = ['All'] + sorted(df['Sales_Person'].unique().tolist())
+    all_sales = ['All'] + sorted(index['Sales_Person'])
     selected_sales = st.sidebar.multiselect(
         "Salesperson",
         all_sales,
@@ -1861,38 +2026,32 @@ def create_advanced_filters(df):
     )
     
     # Source filter
-    all_sources = ['All'] + sorted([s for s in df['Source'].unique() if s])
+    all_sources = ['All'] + sorted([s for s in index['Source'] if s])
     selected_sources = st.sidebar.multiselect(
         "Source",
         all_sources,
         default=['All']
     )
     
-    # Apply filters
-    df_filtered = df.copy()
-    
-    if len(date_range) == 2:
-        start_date, end_date = date_range
-        df_filtered = df_filtered[
-            (df_filtered['Month_Date'] >= pd.Timestamp(start_date)) &
-            (df_filtered['Month_Date'] <= pd.Timestamp(end_date))
-        ]
-    
-    if 'All' not in selected_statuses and selected_statuses:
-        df_filtered = df_filtered[df_filtered['Status'].isin(selected_statuses)]
-    
-    if 'All' not in selected_sales and selected_sales:
-        df_filtered = df_filtered[df_filtered['Sales_Person'].isin(selected_sales)]
+    # Filter state: a hashable description of the selection, used as a cache key
+    filters = {
+        'date_range': tuple(date_range) if len(date_range) == 2 else None,
+        'Status': selected_statuses if 'All' not in selected_statuses else [],
+        'Sales_Person': selected_sales if 'All' not in selected_sales else [],
+        'Source': selected_sources if 'All' not in selected_sources else []
+    }
     
-    if 'All' not in selected_sources and selected_sources:
-        df_filtered = df_filtered[df_filtered['Source'].isin(selected_sources)]
+    # Apply filters: bitwise ops on the load-time index; rows are only taken
+    # from the shared dataset by the sections that need lead-level data
+    view = filter_view(df, index, filters)
     
-    if len(df_filtered) < len(df):
-        st.sidebar.success(f"✅ Showing {len(df_filtered)} of {len(df)} leads")
+    if len(view) < len(df):
+        st.sidebar.success(f"✅ Showing {len(view)} of {len(df)} leads")
     
-    return df_filtered
+    return view, filters
 
-def create_detailed_data_explorer(df):
+@traced
+def create_detailed_data_explorer(view):
     """Advanced data explorer"""
     st.subheader("📋 Detailed Lead Records Explorer")
     
@@ -1904,18 +2063,7 @@ def create_detailed_data_explorer(df):
     with col2:
         sort_by = st.selectbox("Sort by:", ['Month', 'Lead_Name', 'Company', 'Status', 'Sales_Person'])
     
-    display_df = df.copy()
-    
-    if search_term:
-        mask = (
-            display_df['Lead_Name'].str.contains(search_term, case=False, na=False) |
-            display_df['Company'].str.contains(search_term, case=False, na=False) |
-            display_df['Source'].str.contains(search_term, case=False, na=False)
-        )
-        display_df = display_df[mask]
-    
-    display_cols = ['Month', 'Lead_Name', 'Company', 'Status', 'Sales_Person', 'Source']
-    display_df = display_df[display_cols].sort_values(sort_by, ascending=False)
+    display_df = search_leads(view.frame(LEAD_DISPLAY_COLUMNS), search_term, sort_by)
     
     st.dataframe(
         display_df,
@@ -1924,16 +2072,17 @@ def create_detailed_data_explorer(df):
         height=500
     )
     
-    st.caption(f"📊 Showing {len(display_df)} of {len(df)} records")
+    st.caption(f"📊 Showing {len(display_df)} of {len(view)} records")
 
-def export_reports(df, metrics):
+@traced
+def export_reports(view, cube, metrics):
     """Enhanced export functionality"""
     st.subheader("📥 Export Reports & Data")
     
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        csv = df.to_csv(index=False)
+        csv = view.frame().to_csv(index=False)
         st.download_button(
             label="📊 Full Dataset",
             data=csv,
@@ -1955,12 +2104,8 @@ def export_reports(df, metrics):
         )
     
     with col3:
-        team_data = df.groupby('Sales_Person').agg({
-            'Lead_Name': 'count',
-            'Status': lambda x: (x == 'Converted').sum()
-        }).reset_index()
-        team_data.columns = ['Sales_Person', 'Total_Leads', 'Converted']
-        team_data['Conversion_Rate'] = (team_data['Converted'] / team_data['Total_Leads'] * 100).round(2)
+        team_data = conversion_table(cube, 'Sales_Person')
+        team_data = team_data[['Sales_Person', 'Total_Leads', 'Converted', 'Conversion_Rate']].round({'Conversion_Rate': 2})
         csv_team = team_data.to_csv(index=False)
         st.download_button(
             label="👥 Team Report",
@@ -1971,12 +2116,10 @@ def export_reports(df, metrics):
     
     with col4:
         # Source analysis export
-        source_data = df[df['Source'].str.len() > 0].groupby('Source').agg({
-            'Lead_Name': 'count',
-            'Status': lambda x: (x == 'Converted').sum()
-        }).reset_index()
-        source_data.columns = ['Source', 'Total_Leads', 'Converted']
-        source_data['Conversion_Rate'] = (source_data['Converted'] / source_data['Total_Leads'] * 100).round(2)
+        source_data = source_table(cube)
+        if source_data is None:
+            source_data = pd.DataFrame(columns=['Source', 'Total_Leads', 'Converted', 'Conversion_Rate'])
+        source_data = source_data[['Source', 'Total_Leads', 'Converted', 'Conversion_Rate']].round({'Conversion_Rate': 2})
         csv_source = source_data.to_csv(index=False)
         st.download_button(
             label="📞 Source Analysis",
@@ -1985,7 +2128,8 @@ def export_reports(df, metrics):
             mime="text/csv"
         )
 
-def create_executive_summary(df, metrics):
+@traced
+def create_executive_summary(cube, metrics):
     """Executive summary dashboard"""
     st.subheader("📊 Executive Summary")
     
@@ -2007,30 +2151,10 @@ def create_executive_summary(df, metrics):
     
     with col2:
         # Top performers - separate volume and conversion leaders
-        salesperson_counts = df.groupby('Sales_Person').size()
-        if len(salesperson_counts) > 0:
-            top_volume = salesperson_counts.idxmax()
-            top_volume_count = salesperson_counts.max()
-        else:
-            top_volume = "N/A"
-            top_volume_count = 0
-        
-        # Find top converter
-        converted_by_person = df[df['Status'] == 'Converted'].groupby('Sales_Person').size()
-        if len(converted_by_person) > 0:
-            top_converter = converted_by_person.idxmax()
-            top_conversions = converted_by_person.max()
-        else:
-            top_converter = "N/A"
-            top_conversions = 0
-        
-        month_counts = df.groupby('Month').size()
-        if len(month_counts) > 0:
-            best_month = month_counts.idxmax()
-            best_month_count = month_counts.max()
-        else:
-            best_month = "N/A"
-            best_month_count = 0
+        highlights = executive_highlights(cube)
+        top_volume, top_volume_count = highlights['top_volume']
+        top_converter, top_conversions = highlights['top_converter']
+        best_month, best_month_count = highlights['best_month']
         
         st.markdown(f"""
         <div class="success-box">
@@ -2045,25 +2169,111 @@ def create_executive_summary(df, metrics):
         </div>
         """, unsafe_allow_html=True)
 
+def display_performance_panel(trace, profile=None):
+    """Collapsible per-stage timings of this rerun, downloadable as JSON, with the profile toggle"""
+    with st.sidebar.expander("⏱️ Performance", expanded=profile is not None):
+        st.checkbox(
+            "🔬 Profile every rerun",
+            key="profile_reruns",
+            help="Profiles whole reruns (upload through every tab) and saves each profile on the server; "
+                 "also enabled by ?profile=1 in the URL"
+        )
+        if profile is not None:
+            display_profile_summary(*profile)
+        
+        if not trace.stages:
+            st.caption("No stages traced in this run")
+            return
+        
+        table = pd.DataFrame(trace.stages)
+        # Nested stages are indented under the stage that called them
+        table['stage'] = ['\u2003' * depth + stage for depth, stage in zip(table['depth'], table['stage'])]
+        table['wall_ms'] = (table['wall_s'] * 1000).round(1)
+        table = table.astype({'rows_in': 'Int64', 'rows_out': 'Int64'})
+        columns = ['stage', 'wall_ms', 'rows_in', 'rows_out']
+        if trace.memory:
+            columns += ['peak_mb', 'peak_growth_mb']
+        st.dataframe(table[columns], use_container_width=True, hide_index=True)
+        
+        total = table.loc[table['depth'] == 0, 'wall_s'].sum()
+        st.caption(f"Traced stages: {total:.2f}s this rerun" +
+                   (f" · {trace.dropped:,} more stages not recorded" if trace.dropped else "") +
+                   ("" if trace.memory else " · peak memory is not available on this platform"))
+        st.download_button(
+            label="📥 Download trace (JSON)",
+            data=trace.to_json(),
+            file_name=f"trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            mime="application/json"
+        )
+
+def display_profile_summary(path, hotspots):
+    """The hottest functions of a profiled rerun and where its profile was saved"""
+    st.markdown("**🔬 Hottest functions (own time)**")
+    st.dataframe(hotspots, use_container_width=True, hide_index=True)
+    st.caption(f"Profile saved to {path}")
+    with open(path, 'rb') as f:
+        st.download_button(
+            label="📥 Download profile",
+            data=f.read(),
+            file_name=os.path.basename(path),
+            mime="application/json" if path.endswith('.json') else "application/octet-stream"
+        )
+
 # Main Application
-uploaded_file = st.file_uploader(
+# Every traced stage of this run (loading, filtering, aggregation, figures)
+# is collected here and shown in the sidebar's Performance panel; only under
+# a script run, so importing the app (e.g. from benchmark.py) does not trace
+trace = start_trace() if get_script_run_ctx() is not None else None
+
+# Opt-in profiling of this whole rerun (?profile=1 or the Performance panel's
+# toggle); a profile left running by an interrupted rerun is dropped first
+if st.session_state.get('active_profiler') is not None:
+    stop_profile(st.session_state.pop('active_profiler'), save=False)
+profiler = None
+if st.query_params.get('profile') == '1' or st.session_state.get('profile_reruns', False):
+    profiler = start_profile()
+    if profiler is None:
+        st.sidebar.warning("⚠️ Another rerun is being profiled; this one is not")
+st.session_state['active_profiler'] = profiler
+
+uploaded_files = st.file_uploader(
     "📁 Upload Lead Data (CSV or Excel)",
     type=['csv', 'xlsx', 'xls'],
-    help="Upload your CRM export file"
+    accept_multiple_files=True,
+    help="Upload your CRM export file, or several (e.g. one per month) to analyze them together"
 )
 
-if uploaded_file is not None:
+# A dataset saved by an earlier session can be reopened, or extended with new uploads
+snapshot_hash = select_snapshot()
+append_mode = bool(uploaded_files) and snapshot_hash is not None and st.sidebar.checkbox(
+    "➕ Append uploads to this dataset",
+    value=True,
+    help="Only leads not already in the saved dataset are added"
+)
+
+if uploaded_files or snapshot_hash is not None:
     with st.spinner("🔄 Processing data..."):
-        df = load_data(uploaded_file)
+        if append_mode:
+            df = append_files(snapshot_hash, uploaded_files)
+        elif uploaded_files:
+            df = load_files(uploaded_files)
+        else:
+            df = load_snapshot(snapshot_hash)
     
     if df is not None and len(df) > 0:
         # st.success(f"✅ Loaded {len(df)} leads successfully!") # Moved inside load_data
         
+        review_near_duplicates(df)
+        
         # Apply filters
-        df_filtered = create_advanced_filters(df)
+        view, filters = create_advanced_filters(df)
+        
+        # Status cube shared by every section: built once per dataset, then
+        # re-sliced incrementally as the filters change
+        cube = filtered_cube(df, filters)
         
-        # Calculate metrics
-        metrics = calculate_metrics(df_filtered)
+        # Calculate metrics (memoized per dataset and filter state)
+        metrics = cached_metrics(df.attrs['dataset_key'], filters, cube)
         
         # Display KPIs
         display_kpi_dashboard(metrics)
@@ -2071,11 +2281,12 @@ if uploaded_file is not None:
         st.markdown("---")
         
         # Executive summary
-        create_executive_summary(df_filtered, metrics)
+        create_executive_summary(cube, metrics)
         
         st.markdown("---")
         
-        # Tab layout
+        # Tab layout: switching tabs reruns the script and only the open tab's
+        # section is computed and rendered
         tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
             "📊 Overview",
             "👥 Team Analytics",
@@ -2083,37 +2294,60 @@ if uploaded_file is not None:
             "📞 Source Intelligence",
             "🏢 Company Analysis",
             "📋 Data Explorer"
-        ])
+        ], key="section_tabs", on_change="rerun")
+        
+        # The unfiltered tab aggregates were queued in the background on
+        # upload; tabs show their progress and fill in once they are done.
+        # Profiled reruns compute them inline and render every tab, so the
+        # profile covers all the work
+        job = start_aggregates(df) if profiler is None else None
         
         with tab1:
-            st.header("Overview Analytics")
-            create_monthly_trends_advanced(df_filtered)
-            st.markdown("---")
-            create_heatmap_analysis(df_filtered)
-            st.markdown("---")
-            create_forecast_analysis(df_filtered)
+            if tab1.open or profiler is not None:
+                st.header("Overview Analytics")
+                aggregates = tab_aggregates(job, view, ['monthly_trends', 'forecast'])
+                if aggregates is not None:
+                    create_monthly_trends_advanced(cube, aggregates.get('monthly_trends'))
+                    st.markdown("---")
+                    create_heatmap_analysis(cube)
+                    st.markdown("---")
+                    create_forecast_analysis(cube, aggregates.get('forecast'))
         
         with tab2:
-            st.header("Team Performance & Productivity")
-            create_team_performance_comprehensive(df_filtered)
+            if tab2.open or profiler is not None:
+                st.header("Team Performance & Productivity")
+                aggregates = tab_aggregates(job, view, ['team'])
+                if aggregates is not None:
+                    create_team_performance_comprehensive(cube, aggregates.get('team'))
         
         with tab3:
-            st.header("Conversion Analysis")
-            create_advanced_funnel(df_filtered)
+            if tab3.open or profiler is not None:
+                st.header("Conversion Analysis")
+                create_advanced_funnel(cube)
         
         with tab4:
-            st.header("Lead Source Intelligence")
-            create_source_intelligence(df_filtered)
+            if tab4.open or profiler is not None:
+                st.header("Lead Source Intelligence")
+                aggregates = tab_aggregates(job, view, ['sources'])
+                if aggregates is not None:
+                    create_source_intelligence(cube, aggregates.get('sources'))
         
         with tab5:
-            st.header("Company & Account Analysis")
-            create_company_analysis(df_filtered)
+            if tab5.open or profiler is not None:
+                st.header("Company & Account Analysis")
+                aggregates = tab_aggregates(job, view, ['companies'])
+                if aggregates is not None:
+                    company_data = aggregates.get('companies')
+                    if company_data is None:
+                        company_data = cached_company_table(df.attrs['dataset_key'], filters, view)
+                    create_company_analysis(company_data)
         
         with tab6:
-            st.header("Data Explorer & Export")
-            create_detailed_data_explorer(df_filtered)
-            st.markdown("---")
-            export_reports(df_filtered, metrics)
+            if tab6.open or profiler is not None:
+                st.header("Data Explorer & Export")
+                create_detailed_data_explorer(view)
+                st.markdown("---")
+                export_reports(view, cube, metrics)
     else:
         st.error("❌ Could not load data. Please check the file format and column names.")
 
@@ -2177,4 +2411,14 @@ else:
     <p>Built with Streamlit • Plotly • Advanced Data Science</p>
     <p>🎨 Optimized for Light & Dark Mode | 📊 Production-Ready Analytics</p>
     </div>
-    """, unsafe_allow_html=True)
\ No newline at end of file
+    """, unsafe_allow_html=True)
+
+profile = None
+st.session_state['active_profiler'] = None
+if profiler is not None:
+    try:
+        profile = stop_profile(profiler)
+    except OSError as e:
+        st.sidebar.warning(f"⚠️ Could not save the profile: {e}")
+if trace is not None:
+    display_performance_panel(trace, profile)
\ No newline at end of file
@@ -0,0 +1,412 @@
+"""Benchmarks for the lead dashboard.
+
+Run with:
+    python benchmark.py [--sizes 10000 100000 1000000] [--full] [--repeat 3]
+                        [--output results.json] [--compare baseline.json]
+    python benchmark.py --check     (parser and source aggregation against their references)
+
+Parsing and aggregation stages call the analytics module directly; the
+dashboard sections run through app imported in Streamlit's bare mode, so
+widgets return their defaults and nothing is sent to a browser. Results are
+emitted as JSON (stdout, or --output) so two versions can be compared with
+--compare.
+"""
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Snapshots written while benchmarking must not land in the app's own store
+os.environ.setdefault('LEAD_SNAPSHOT_DIR', tempfile.mkdtemp(prefix='lead-benchmark-'))
+
+# Bare mode logs a "missing ScriptRunContext" warning for every Streamlit call
+logging.getLogger('streamlit.runtime.scriptrunner_utils.script_run_context').disabled = True
+
+import analytics
+import app
+
+LEAD_STATUSES = ['New', 'Contacted', 'Pre Qualified', 'Lost Lead', 'Converted', 'Postpone']
+LEAD_SOURCES = ['Website', 'Referral', 'LinkedIn', 'Cold Call List', 'Trade Show', '']
+# The row-by-row reference parser is only run up to this many raw rows
+REFERENCE_MAX_ROWS = 300_000
+# Hierarchical CSVs above this many raw rows are larger than
+# CSV_CHUNK_THRESHOLD_BYTES, so uploads stream them: the in-memory parser is
+# only timed up to here, and larger exports are never built as one raw frame
+IN_MEMORY_PARSE_MAX_ROWS = 2_000_000
+# Larger exports are generated and written out in pieces of this many rows
+EXPORT_PIECE_ROWS = 1_000_000
+# --full adds the top of the range the suite is meant for
+FULL_SIZE = 10_000_000
+
+
+def make_hierarchical_export(n_rows, seed=42):
+    """Synthetic CRM export in the Month / Status / Owner / Lead layout"""
+    rng = np.random.default_rng(seed)
+    months = np.array([f"{m} 2024" for m in analytics.MONTHS], dtype=object)
+    statuses = np.array(LEAD_STATUSES, dtype=object)
+    owners = np.array(analytics.OWNERS, dtype=object)
+    # Each month block holds 3 statuses x 3 owners; an owner has 5-39 leads and a blank row
+    n_blocks = n_rows // (1 + 3 * (1 + 3 * 7)) + 1
+    group_leads = rng.integers(5, 40, size=(n_blocks, 3, 3))
+    group_rows = group_leads + 2
+    status_rows = 1 + group_rows.sum(axis=2)
+    block_rows = 1 + status_rows.sum(axis=1)
+    block_start = np.cumsum(block_rows) - block_rows
+    status_start = block_start[:, None] + 1 + np.cumsum(status_rows, axis=1) - status_rows
+    group_start = status_start[:, :, None] + 1 + np.cumsum(group_rows, axis=2) - group_rows
+
+    block_status = np.argsort(rng.random((n_blocks, len(statuses))), axis=1)[:, :3]
+    group_owner = np.argsort(rng.random((n_blocks, 3, len(owners))), axis=2)[:, :, :3]
+
+    cells = np.full((int(block_rows.sum()), 6), None, dtype=object)
+    cells[block_start, 0] = months[np.arange(n_blocks) % len(months)] + f" ({n_rows})"
+    cells[status_start.ravel(), 1] = statuses[block_status.ravel()] + " (12)"
+    cells[group_start.ravel(), 2] = owners[group_owner.ravel()] + " (4)"
+
+    lead_offsets = np.arange(1, group_leads.max() + 1)
+    lead_rows = (group_start[..., None] + lead_offsets)[lead_offsets <= group_leads[..., None]]
+    lead_ids = rng.integers(0, n_rows, len(lead_rows))
+    cells[lead_rows, 3] = "Lead " + lead_ids.astype(str).astype(object)
+    cells[lead_rows, 4] = rng.choice(np.array(LEAD_SOURCES, dtype=object), len(lead_rows))
+    cells[lead_rows, 5] = "Company " + (lead_ids % 997).astype(str).astype(object)
+    return pd.DataFrame(cells[:n_rows])
+
+
+def make_flat_export(n_leads, n_sources=200, seed=42):
+    """Synthetic CRM export in the flat one-lead-per-row schema"""
+    rng = np.random.default_rng(seed)
+    months = pd.date_range('2023-01-01', periods=24, freq='MS').strftime('%B %Y').to_numpy(dtype=object)
+    statuses = np.array([analytics.STATUS_ALIASES.get(status, status) for status in LEAD_STATUSES], dtype=object)
+    sources = np.array([''] + [f"Source {i}" for i in range(1, n_sources)], dtype=object)
+    return pd.DataFrame({
+        'Month': months[rng.integers(0, len(months), n_leads)],
+        'Status': rng.choice(statuses, n_leads),
+        'Sales_Person': rng.choice(np.array(analytics.OWNERS, dtype=object), n_leads),
+        'Lead_Name': "Lead " + np.arange(n_leads).astype(str).astype(object),
+        'Source': sources[rng.zipf(1.5, n_leads) % n_sources],
+        'Company': "Company " + rng.integers(0, max(n_leads // 5, 1), n_leads).astype(str).astype(object)
+    })
+
+
+def export_csv(make_export, n_rows, header):
+    """CSV bytes of a synthetic export, generated EXPORT_PIECE_ROWS rows (one seed) at a time"""
+    pieces = []
+    for i, start in enumerate(range(0, n_rows, EXPORT_PIECE_ROWS)):
+        piece = make_export(min(EXPORT_PIECE_ROWS, n_rows - start), seed=42 + i)
+        pieces.append(piece.to_csv(index=False, header=header and i == 0).encode())
+    return b''.join(pieces)
+
+
+def make_leads(n_leads, n_sources=200, seed=42):
+    """Synthetic parsed lead table, as returned by the upload parsers"""
+    df = make_flat_export(n_leads, n_sources, seed)
+    df['Month_Date'] = pd.to_datetime(df['Month'], format='%B %Y')
+    return analytics.compact_schema(df)
+
+
+class UploadedBytes(io.BytesIO):
+    """Stand-in for Streamlit's UploadedFile"""
+
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+        self.size = len(data)
+
+
+def extract_leads_rowwise(df_raw):
+    """Reference row-by-row parser (the pre-vectorization implementation)"""
+    leads_data = []
+    current_month = None
+    current_status = None
+    current_owner = None
+    for row in df_raw.values.tolist():
+        row = [str(cell).strip() if pd.notna(cell) else "" for cell in row]
+        if all(cell == "" or cell == "nan" for cell in row):
+            continue
+        if len(row) > 0 and any(month in row[0] for month in analytics.MONTHS):
+            current_month = row[0].split('(')[0].strip()
+            continue
+        if len(row) > 1 and any(status.lower() in row[1].lower() for status in analytics.STATUSES):
+            current_status = row[1].split('(')[0].strip()
+            continue
+        if len(row) > 2 and any(owner.lower() in row[2].lower() for owner in analytics.OWNERS):
+            current_owner = row[2].split('(')[0].strip()
+            continue
+        lead_name = row[3] if len(row) > 3 else ""
+        if (lead_name and
+            lead_name not in ["", "nan", "None", ".", "-"] and
+            len(lead_name) > 1 and
+            current_month and
+            current_status and
+            current_owner):
+            leads_data.append({
+                'Month': current_month,
+                'Status': current_status,
+                'Sales_Person': current_owner,
+                'Lead_Name': lead_name,
+                'Source': row[4] if len(row) > 4 else '',
+                'Company': row[5] if len(row) > 5 else ''
+            })
+    if not leads_data:
+        return None
+    df_clean = pd.DataFrame(leads_data)
+    for col in ['Month', 'Status', 'Sales_Person']:
+        df_clean[col] = df_clean[col].str.replace(r'\s*\(\d+\)', '', regex=True).str.strip()
+    df_clean['Company'] = df_clean['Company'].str.strip()
+    df_clean['Source'] = df_clean['Source'].str.strip()
+    df_clean['Status'] = df_clean['Status'].replace({'Pre Qualified': 'Pre-Qualified', 'Postpone': 'Postponed'})
+    return df_clean.drop_duplicates(subset=['Lead_Name', 'Month', 'Sales_Person', 'Company', 'Source'], keep='first')
+
+
+def source_table_lambda(df):
+    """Reference per-group lambda aggregation (the pre-cube implementation)"""
+    df_sources = df[df['Source'].str.len() > 0].copy()
+    source_data = df_sources.groupby('Source', observed=True).agg({
+        'Lead_Name': 'count',
+        'Status': lambda x: (x == 'Converted').sum()
+    }).reset_index()
+    source_data.columns = ['Source', 'Total_Leads', 'Converted']
+    source_data['Conversion_Rate'] = (source_data['Converted'] / source_data['Total_Leads'] * 100).round(1)
+    source_data['Lost'] = df_sources.groupby('Source', observed=True)['Status'].apply(lambda x: (x == 'Lost Lead').sum()).values
+    source_data['Loss_Rate'] = (source_data['Lost'] / source_data['Total_Leads'] * 100).round(1)
+    return source_data.sort_values('Total_Leads', ascending=False)
+
+
+def best_of(func, *args, repeat=3):
+    """Best wall time of several runs, plus the last result"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def time_stage(func, *args, repeat=3, setup=None):
+    """Best, median and individual timings of func(*args), running an untimed setup() before each call"""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+    return {'best_s': min(timings), 'median_s': statistics.median(timings), 'runs_s': timings}, result
+
+
+def bench_parser(n_rows):
+    df_raw = make_hierarchical_export(n_rows)
+    t_loop, expected = best_of(extract_leads_rowwise, df_raw)
+    t_vec, (actual, _) = best_of(analytics.extract_leads_from_excel, df_raw)
+    pd.testing.assert_frame_equal(actual, expected)
+    print(f"{n_rows:>9,} raw rows | {len(actual):>9,} leads | "
+          f"row loop {t_loop:7.3f}s | vectorized {t_vec:7.3f}s | {t_loop / t_vec:5.1f}x")
+
+
+def bench_sources(n_leads):
+    df = make_leads(n_leads)
+    t_lambda, expected = best_of(source_table_lambda, df)
+    t_cube, cube = best_of(analytics.build_status_cube, df)
+    t_table, actual = best_of(analytics.source_table, cube)
+    actual = actual.round({'Conversion_Rate': 1, 'Loss_Rate': 1})
+    columns = ['Source', 'Total_Leads', 'Converted', 'Conversion_Rate', 'Lost', 'Loss_Rate']
+    pd.testing.assert_frame_equal(
+        actual[columns].sort_values('Source').reset_index(drop=True),
+        expected[columns].astype({'Source': str}).sort_values('Source').reset_index(drop=True),
+        check_dtype=False)
+    print(f"{n_leads:>9,} leads | {len(actual):>5,} sources | lambda agg {t_lambda:7.3f}s | "
+          f"cube {t_cube:7.3f}s + table {t_table:7.3f}s | {t_lambda / (t_cube + t_table):5.1f}x "
+          f"({t_lambda / t_table:.0f}x with a cached cube)")
+
+
+def _forget_parses():
+    """Empty the in-process parse cache (snapshots stay on disk)"""
+    app._parse_cache()[0].clear()
+    app.filter_index.clear()
+
+
+def _forget_dataset(upload):
+    """Drop an upload from the parse cache and the snapshot store, so the next load parses it"""
+    _forget_parses()
+    path = analytics.snapshot_path(analytics.make_dataset_key(hashlib.sha256(upload.getvalue()).hexdigest()))
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _forget_figures():
+    figures, _, usage = app._figure_cache()
+    figures.clear()
+    usage['bytes'] = 0
+
+
+def dashboard_stages(df, repeat=3):
+    """Timings of every aggregation and section the dashboard runs on a loaded dataset"""
+    results = []
+
+    def record(stage, func, *args, setup=None, rows=None):
+        timing, result = time_stage(func, *args, repeat=repeat, setup=setup)
+        results.append(dict(stage=stage, rows=len(df) if rows is None else rows, **timing))
+        return result
+
+    record('filter_index', app.filter_index, df.attrs['dataset_key'], df, setup=app.filter_index.clear)
+    view, filters = record('create_advanced_filters', app.create_advanced_filters, df)
+    cube = record('build_status_cube', analytics.build_status_cube, view.frame(analytics.CUBE_DIMENSIONS))
+    metrics = record('calculate_metrics', analytics.calculate_metrics, cube, rows=len(cube))
+    company_data = record('build_company_table', analytics.build_company_table, view.frame(analytics.COMPANY_COLUMNS))
+
+    # The sections' aggregations on their own, without building or rendering figures
+    aggregations = [
+        ('source_table', analytics.source_table, (cube,)),
+        ('executive_highlights', analytics.executive_highlights, (cube,)),
+        ('monthly_trends', analytics.monthly_trends, (cube,)),
+        ('team_performance', analytics.team_performance, (cube,)),
+        ('funnel_counts', analytics.funnel_counts, (cube,)),
+        ('status_timeline_counts', analytics.status_timeline_counts, (cube,)),
+        ('status_month_pivot', analytics.status_month_pivot, (cube,)),
+        ('top_salesperson_status_pivot', analytics.top_salesperson_status_pivot, (cube,)),
+        ('lead_forecast', analytics.lead_forecast, (cube,)),
+    ]
+    for stage, func, args in aggregations:
+        record(stage, func, *args, rows=len(cube))
+    record('engagement_duration_counts', analytics.engagement_duration_counts, company_data['Days_Active'],
+           rows=len(company_data))
+    record('search_leads', analytics.search_leads, view.frame(analytics.LEAD_DISPLAY_COLUMNS), 'Lead 1', 'Month')
+    # The background job queued on upload (all of the unfiltered tab aggregates)
+    record('precompute_aggregates', analytics.precompute_aggregates, df, cube, lambda stage, result: None)
+
+    sections = [
+        ('create_executive_summary', app.create_executive_summary, (cube, metrics)),
+        ('create_monthly_trends_advanced', app.create_monthly_trends_advanced, (cube,)),
+        ('create_heatmap_analysis', app.create_heatmap_analysis, (cube,)),
+        ('create_forecast_analysis', app.create_forecast_analysis, (cube,)),
+        ('create_team_performance_comprehensive', app.create_team_performance_comprehensive, (cube,)),
+        ('create_advanced_funnel', app.create_advanced_funnel, (cube,)),
+        ('create_source_intelligence', app.create_source_intelligence, (cube,)),
+        ('create_company_analysis', app.create_company_analysis, (company_data,)),
+        ('create_detailed_data_explorer', app.create_detailed_data_explorer, (view,)),
+        ('export_reports', app.export_reports, (view, cube, metrics)),
+    ]
+    for stage, func, args in sections:
+        # Cold (figures rebuilt), then a rerun with the figure cache warm
+        record(stage, func, *args, setup=_forget_figures)
+        record(f"{stage}[cached figures]", func, *args)
+    return results
+
+
+def run_suite(sizes, repeat=3):
+    """Time loading, parsing and every dashboard aggregation at each size"""
+    results = []
+    for size in sizes:
+        print(f"--- {size:,} rows", file=sys.stderr)
+
+        def record(dataset, stage, timing, rows):
+            results.append(dict(size=size, dataset=dataset, stage=stage, rows=rows, **timing))
+            print(f"{dataset:>12} {stage:<48} {timing['best_s']:9.4f}s", file=sys.stderr)
+
+        # Hierarchical layout: the parser on its own, then a full CSV upload
+        if size <= IN_MEMORY_PARSE_MAX_ROWS:
+            df_raw = make_hierarchical_export(size)
+            timing, _ = time_stage(analytics.extract_leads_from_excel, df_raw, repeat=repeat)
+            record('hierarchical', 'extract_leads_from_excel', timing, size)
+            if size <= REFERENCE_MAX_ROWS:
+                timing, _ = time_stage(extract_leads_rowwise, df_raw, repeat=1)
+                record('hierarchical', 'extract_leads_rowwise[reference]', timing, size)
+            upload = UploadedBytes(df_raw.to_csv(index=False, header=False).encode(), 'hierarchical.csv')
+            del df_raw
+        else:
+            upload = UploadedBytes(export_csv(make_hierarchical_export, size, header=False), 'hierarchical.csv')
+        timing, _ = time_stage(analytics.parse_upload, upload.name, upload.getvalue(), repeat=repeat)
+        record('hierarchical', 'parse_upload', timing, size)
+        timing, _ = time_stage(app.load_data, upload, repeat=repeat, setup=lambda: _forget_dataset(upload))
+        record('hierarchical', 'load_data', timing, size)
+        _forget_dataset(upload)
+
+        # Flat schema: cold parse, snapshot read, parse-cache hit, then the dashboard itself
+        upload = UploadedBytes(export_csv(make_flat_export, size, header=True), 'flat.csv')
+        timing, _ = time_stage(app.load_data, upload, repeat=repeat, setup=lambda: _forget_dataset(upload))
+        record('flat', 'load_data', timing, size)
+        timing, _ = time_stage(app.load_data, upload, repeat=repeat, setup=_forget_parses)
+        record('flat', 'load_data[snapshot]', timing, size)
+        timing, df = time_stage(app.load_data, upload, repeat=repeat)
+        record('flat', 'load_data[parse cache]', timing, size)
+        for result in dashboard_stages(df, repeat):
+            record('flat', result.pop('stage'), result, result.pop('rows'))
+        _forget_dataset(upload)
+        _forget_figures()
+    return results
+
+
+def environment():
+    """Code version and machine details stored next to the timings"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=analytics.APP_DIR).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'commit': commit,
+        'parser_version': analytics.PARSER_VERSION,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': datetime.now().isoformat(timespec='seconds')
+    }
+
+
+def compare(results, baseline):
+    """Best-time ratios against an earlier results file (above 1 means slower now)"""
+    before = {(r['size'], r['dataset'], r['stage']): r['best_s'] for r in baseline['results']}
+    print(f"{'size':>10} {'dataset':>12} {'stage':<48} {'before':>9} {'after':>9} {'ratio':>7}")
+    for r in results:
+        key = (r['size'], r['dataset'], r['stage'])
+        if before.get(key):
+            print(f"{r['size']:>10,} {r['dataset']:>12} {r['stage']:<48} "
+                  f"{before[key]:9.4f} {r['best_s']:9.4f} {r['best_s'] / before[key]:7.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks for the lead dashboard")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                        help="rows per synthetic export (the suite is meant for 10k up to 10M)")
+    parser.add_argument('--full', action='store_true',
+                        help=f"also run {FULL_SIZE:,} rows (slow; needs several GB of memory)")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per stage; best and median are reported")
+    parser.add_argument('--output', help="write the JSON results here instead of stdout")
+    parser.add_argument('--compare', help="earlier JSON results to compare against")
+    parser.add_argument('--check', action='store_true',
+                        help="check the parser and source aggregation against their reference implementations")
+    args = parser.parse_args()
+    if args.full and FULL_SIZE not in args.sizes:
+        args.sizes.append(FULL_SIZE)
+
+    if args.check:
+        for size in args.sizes:
+            if size <= REFERENCE_MAX_ROWS:
+                bench_parser(size)
+        bench_sources(500_000)
+        sys.exit()
+
+    report = {'environment': environment(), 'results': run_suite(args.sizes, args.repeat)}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report['results'], json.load(f))
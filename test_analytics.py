@@ -0,0 +1,207 @@
+"""Equivalence tests for the incremental paths of the headless analytics core"""
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import analytics
+
+SOURCES = ['Website', 'Referral', 'LinkedIn', 'Trade Show', '']
+STATUSES = ['New', 'Contacted', 'Converted', 'Lost Lead']
+
+
+def hierarchical_csv(n_leads, seed=0, typo_rate=0.0):
+    """A hierarchical CRM export (Month / Status / Owner header rows over leads) as CSV bytes.
+
+    Some leads are repeated exactly or with case/punctuation changes, and one
+    is a known test entry, so every dedup and filtering rule has work to do;
+    with `typo_rate`, leads are also followed by a misspelt near-duplicate.
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    lead = 0
+    while lead < n_leads:
+        month = analytics.MONTHS[(lead // 400) % 6]
+        rows.append([f"{month} 2024 (0)", '', '', '', '', ''])
+        for status in rng.choice(STATUSES, 2, replace=False):
+            rows.append(['', f"{status} (0)", '', '', '', ''])
+            for owner in rng.choice(analytics.OWNERS[:4], 2, replace=False):
+                rows.append(['', '', f"{owner} (0)", '', '', ''])
+                for _ in range(rng.integers(5, 40)):
+                    lead_id = rng.integers(0, n_leads)
+                    row = ['', '', '', f"Lead {lead_id}", rng.choice(SOURCES), f"Company {lead_id % 40}"]
+                    rows.append(row)
+                    if rng.random() < typo_rate:
+                        rows.append(row[:3] + [f"Leads {lead_id}"] + row[4:])
+                    if rng.random() < 0.05:
+                        rows.append(row)
+                    elif rng.random() < 0.05:
+                        rows.append(row[:3] + [row[3].upper() + '.'] + row[4:])
+                    lead += 1
+                rows.append([''] * 6)
+    rows.append(['', '', '', 'test', 'Website', 'Company 1'])
+
+    buffer = io.BytesIO()
+    pd.DataFrame(rows).to_csv(buffer, index=False, header=False)
+    return buffer.getvalue()
+
+
+def read_raw(file_bytes):
+    return pd.read_csv(io.BytesIO(file_bytes), header=None, dtype=str)
+
+
+@pytest.mark.parametrize('chunk_rows', [97, 1000, 1_000_000])
+def test_chunked_parse_matches_in_memory_parse(chunk_rows):
+    data = hierarchical_csv(3000)
+
+    in_memory, in_memory_report = analytics.extract_leads_from_excel(read_raw(data))
+    expected = analytics.compact_schema(analytics._filter_test_entries(in_memory))
+    chunked, test_removed, chunked_report = analytics.extract_leads_from_csv_chunks(data, chunk_rows=chunk_rows)
+
+    pd.testing.assert_frame_equal(chunked.reset_index(drop=True), expected.reset_index(drop=True))
+    assert test_removed == len(in_memory) - len(expected) == 1
+    for rule in ('exact', 'normalized', 'fuzzy'):
+        assert chunked_report[rule] == in_memory_report[rule]
+    assert chunked_report['exact'] > 0 and chunked_report['normalized'] > 0
+
+
+def test_streamed_upload_matches_in_memory_upload(monkeypatch):
+    data = hierarchical_csv(3000)
+    in_memory = analytics.parse_upload('leads.csv', data)
+    monkeypatch.setattr(analytics, 'CSV_CHUNK_THRESHOLD_BYTES', 0)
+    streamed = analytics.parse_upload('leads.csv', data)
+
+    assert (in_memory.layout, streamed.layout) == ('hierarchical', 'streamed')
+    pd.testing.assert_frame_equal(streamed.df.reset_index(drop=True), in_memory.df.reset_index(drop=True))
+    assert streamed.summary['test_entries_removed'] == in_memory.summary['test_entries_removed']
+    assert streamed.extracted == in_memory.extracted
+
+
+def lead_keys(df):
+    """The leads of a frame as sorted DEDUP_KEY tuples, independent of row order and dtypes"""
+    return sorted(map(tuple, df[analytics.DEDUP_KEY].astype(object).fillna('').to_numpy().tolist()))
+
+
+def plain_cube(cube):
+    """A cube with object dimensions in a canonical row order, for comparing cubes built differently"""
+    categorical = [column for column in cube.columns if isinstance(cube[column].dtype, pd.CategoricalDtype)]
+    return cube.astype({column: object for column in categorical}).sort_values(
+        analytics.CUBE_DIMENSIONS
+    ).reset_index(drop=True)
+
+
+@pytest.fixture(scope='module')
+def uploads():
+    """A saved week of leads and a later export that repeats some of them, with misspelt near-duplicates"""
+    base = analytics.parse_upload('week1.csv', hierarchical_csv(3000, seed=1))
+    new = analytics.parse_upload('week2.csv', hierarchical_csv(800, seed=2, typo_rate=0.1))
+    return base, new
+
+
+def append(base, new, merge_near_duplicates=False):
+    fingerprints = np.sort(analytics.row_fingerprints(base.df))
+    return analytics.merge_new_leads(base.df, new.df, fingerprints, merge_near_duplicates=merge_near_duplicates)
+
+
+def test_merged_cube_matches_rebuilt_cube(uploads):
+    base, new = uploads
+    df, delta, _, _ = append(base, new)
+
+    merged = analytics.merge_cubes(analytics.build_status_cube(base.df), analytics.build_status_cube(delta), df)
+    pd.testing.assert_frame_equal(plain_cube(merged), plain_cube(analytics.build_status_cube(df)))
+
+
+def test_append_matches_full_reupload(uploads):
+    base, new = uploads
+    df, delta, fingerprints, report = append(base, new)
+    full, full_summary, full_report = analytics.merge_uploads([base, new])
+
+    assert len(delta) > 0 and report['existing'] > 0
+    assert lead_keys(df) == lead_keys(full)
+    assert np.array_equal(fingerprints, np.sort(analytics.row_fingerprints(df)))
+    # Leads the base already had are duplicates of the first upload in a full re-upload
+    assert (report['exact'] + report['normalized'] + report['existing'] ==
+            full_report['exact'] + full_report['normalized'])
+    assert report['fuzzy'] == full_report['fuzzy'] == 0
+
+    cube = analytics.merge_cubes(analytics.build_status_cube(base.df), analytics.build_status_cube(delta), df)
+    summary = analytics.summarize_append(
+        base.summary, base.df, delta, df, cube,
+        full_summary['test_entries_before'], full_summary['test_entries_removed']
+    )
+    for key in ('total_records', 'date_range', 'unique_salespeople', 'unique_companies',
+                'quality_checks', 'missing_names', 'blank_companies'):
+        assert summary[key] == full_summary[key], key
+    for key, by in (('status_distribution', 'Status'), ('top_salespeople', 'Salesperson'),
+                    ('monthly_distribution', 'Month')):
+        expected = full_summary[key].astype({by: object}).sort_values(by).reset_index(drop=True)
+        got = summary[key].astype({by: object}).sort_values(by).reset_index(drop=True)
+        pd.testing.assert_frame_equal(got, expected, check_dtype=False)
+
+
+def test_append_merges_near_duplicates_only_when_enabled(uploads):
+    base, new = uploads
+    kept, _, _, report = append(base, new)
+    merged, _, _, merged_report = append(base, new, merge_near_duplicates=True)
+
+    assert not report['fuzzy_merged'] and merged_report['fuzzy_merged']
+    assert report['fuzzy'] == 0 and report['examples'].empty
+    # Only the new rows' near-duplicates are merged; those the base kept stay
+    new_near_duplicates = analytics.find_near_duplicates(kept)[0] - analytics.find_near_duplicates(base.df)[0]
+    assert merged_report['fuzzy'] == new_near_duplicates > 0
+    assert len(merged) == len(kept) - merged_report['fuzzy']
+    assert set(merged_report['examples']['Near-Duplicate Lead']) <= set(new.df['Lead_Name'])
+
+
+def test_extended_filter_index_matches_rebuilt_index(uploads):
+    base, new = uploads
+    df, delta, _, _ = append(base, new)
+    extended = analytics.extend_filter_index(analytics.build_filter_index(base.df), delta, len(base.df))
+    rebuilt = analytics.build_filter_index(df)
+
+    months = sorted(rebuilt['Month_Date'])
+    for filters in (
+        {'Status': ['New']},
+        {'Source': ['Website', '']},
+        {'Sales_Person': analytics.OWNERS[:2], 'Status': ['Converted', 'Contacted']},
+        {'date_range': (months[1].date(), months[3].date()), 'Source': ['Referral']},
+    ):
+        expected = analytics.select_rows(rebuilt, len(df), filters)
+        assert np.array_equal(analytics.select_rows(extended, len(df), filters), expected), filters
+
+
+def test_delta_snapshot_round_trip(uploads, tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics, 'SNAPSHOT_DIR', str(tmp_path))
+    base, new = uploads
+    df, _, _, _ = append(base, new)
+    analytics.save_snapshot(base.df, base.summary, 'week1', 'week1.csv')
+    analytics.save_snapshot(df, base.summary, 'week2', 'week2.csv', base_key='week1')
+
+    mapped, metadata = analytics.map_snapshot('week2')
+    assert (metadata['base_key'], metadata['base_rows'], metadata['depth']) == ('week1', len(base.df), 1)
+    pd.testing.assert_frame_equal(
+        mapped[analytics.DEDUP_KEY].astype(object), df[analytics.DEDUP_KEY].astype(object)
+    )
+
+    # A delta whose base is gone cannot be read back, and is pruned
+    (tmp_path / 'week1.arrow').unlink()
+    assert analytics.map_snapshot('week2') is None
+    assert analytics.prune_snapshots() == ['week2.arrow']
+
+
+def test_prune_deletes_only_older_parser_versions(uploads, tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics, 'SNAPSHOT_DIR', str(tmp_path))
+    base, _ = uploads
+    with monkeypatch.context() as patched:
+        patched.setattr(analytics, 'PARSER_VERSION', analytics.PARSER_VERSION - 1)
+        analytics.save_snapshot(base.df, base.summary, 'old', 'week1.csv')
+    with monkeypatch.context() as patched:
+        patched.setattr(analytics, 'MERGE_NEAR_DUPLICATES', not analytics.MERGE_NEAR_DUPLICATES)
+        analytics.save_snapshot(base.df, base.summary, 'other-mode', 'week1.csv')
+    analytics.save_snapshot(base.df, base.summary, 'week1', 'week1.csv')
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['other-mode.arrow', 'week1.arrow']
+
+    # The other dedup mode's snapshot still counts against the limits
+    monkeypatch.setattr(analytics, 'SNAPSHOT_MAX_COUNT', 1)
+    assert analytics.prune_snapshots() == ['other-mode.arrow']